@@ -0,0 +1,119 @@
+# aggregates.py
+# Materialized aggregate tables built once by merger.py.
+#
+# Several reports recompute the same groupbys over the full daily file
+# (monthly pivots, day-of-year means, seasonal stats). Instead, the merge step
+# writes small tables holding count/sum/min/max/sumsq per group. Means and
+# standard deviations can be derived from those without touching daily rows,
+# and tables for different subsets can be combined by simply adding them up.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = ["Max_Temp_C", "Min_Temp_C", "Mean_Temp_C", "Total_Precip_mm"]
+STAT_NAMES = ["count", "sum", "min", "max", "sumsq"]
+
+SEASON_BY_MONTH = {
+    12: "Winter", 1: "Winter", 2: "Winter",
+    3: "Spring", 4: "Spring", 5: "Spring",
+    6: "Summer", 7: "Summer", 8: "Summer",
+    9: "Fall", 10: "Fall", 11: "Fall",
+}
+
+# Table name -> (output filename, group keys)
+AGGREGATE_TABLES = {
+    "daily_climatology": ("agg_daily_climatology.csv", ["City", "Day_of_Year"]),
+    "monthly": ("agg_monthly.csv", ["City", "Year", "Month"]),
+    "seasonal": ("agg_seasonal.csv", ["City", "Year", "Season"]),
+}
+
+
+def _add_group_keys(df):
+    """Adds the calendar keys used by the aggregate tables."""
+    keyed = pd.DataFrame({"City": df["City"].to_numpy()}, index=df.index)
+    dates = df["Date_Time"].dt
+    keyed["Year"] = dates.year
+    keyed["Month"] = dates.month
+    keyed["Day_of_Year"] = dates.dayofyear
+    keyed["Season"] = keyed["Month"].map(SEASON_BY_MONTH)
+    for metric in METRIC_COLUMNS:
+        if metric in df.columns:
+            keyed[metric] = pd.to_numeric(df[metric], errors="coerce")
+    return keyed
+
+
+def _aggregate(keyed, keys):
+    """Computes count/sum/min/max/sumsq for every metric in one groupby pass."""
+    metrics = [m for m in METRIC_COLUMNS if m in keyed.columns]
+    squares = keyed[metrics].pow(2).add_suffix("_sq")
+    grouped = pd.concat([keyed[keys + metrics], squares], axis=1).groupby(keys, sort=True)
+
+    base = grouped[metrics].agg(["count", "sum", "min", "max"])
+    base.columns = [f"{metric}_{stat}" for metric, stat in base.columns]
+    sumsq = grouped[list(squares.columns)].sum()
+    sumsq.columns = [f"{col[:-3]}_sumsq" for col in sumsq.columns]
+
+    table = base.join(sumsq)
+    ordered = [f"{metric}_{stat}" for metric in metrics for stat in STAT_NAMES]
+    return table[ordered].reset_index()
+
+
+def build_aggregate_tables(df):
+    """
+    Builds every aggregate table from the merged daily dataframe.
+    Returns a dict of table name -> dataframe.
+    """
+    keyed = _add_group_keys(df)
+    return {name: _aggregate(keyed, keys) for name, (_, keys) in AGGREGATE_TABLES.items()}
+
+
+def write_aggregate_tables(tables, processed_data_dir):
+    """Writes the aggregate tables next to the merged data file."""
+    paths = {}
+    for name, table in tables.items():
+        filename = AGGREGATE_TABLES[name][0]
+        path = os.path.join(processed_data_dir, filename)
+        table.to_csv(path, index=False)
+        paths[name] = path
+    return paths
+
+
+def load_aggregate_table(name, processed_data_dir):
+    """
+    Loads one aggregate table written by merger.py.
+    Returns None if it has not been generated yet, so callers can fall back
+    to computing from the daily data.
+    """
+    path = os.path.join(processed_data_dir, AGGREGATE_TABLES[name][0])
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
+
+
+def combine(table, keys):
+    """
+    Rolls an aggregate table up to coarser keys (e.g. monthly -> City/Month
+    across all years). Counts, sums and sums of squares add; min/max reduce.
+    """
+    agg_spec = {}
+    for col in table.columns:
+        if col.endswith(("_count", "_sum", "_sumsq")):
+            agg_spec[col] = "sum"
+        elif col.endswith("_min"):
+            agg_spec[col] = "min"
+        elif col.endswith("_max"):
+            agg_spec[col] = "max"
+    return table.groupby(keys, sort=True).agg(agg_spec).reset_index()
+
+
+def mean_and_std(table, metric):
+    """Returns (mean, sample std) series for a metric from its stored sums."""
+    count = table[f"{metric}_count"].astype("float64")
+    total = table[f"{metric}_sum"]
+    sumsq = table[f"{metric}_sumsq"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (total / count).where(count > 0)
+        variance = ((sumsq - total * mean) / (count - 1)).where(count > 1)
+    return mean, np.sqrt(variance.clip(lower=0))
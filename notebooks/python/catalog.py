@@ -0,0 +1,72 @@
+# catalog.py
+# City and station catalogs built by merger.py from the merged daily frame.
+#
+# cities_metadata.csv is what webapp.py reads at startup (City, start_year,
+# end_year); stations_catalog.csv adds the same coverage numbers per station.
+# Both come from a single groupby over the merged data, so the web app can
+# list cities and years without touching the daily rows. The files are
+# replaced atomically, so a running web app never reads a partial catalog.
+
+import os
+
+from aggregates import METRIC_COLUMNS
+from merged_data import atomic_write
+
+CITIES_METADATA_FILE = "cities_metadata.csv"
+STATIONS_CATALOG_FILE = "stations_catalog.csv"
+
+
+def _coverage(df, keys):
+    """Row counts, date range and per-metric null fraction for each group."""
+    metrics = [m for m in METRIC_COLUMNS if m in df.columns]
+    flags = df[keys].copy()
+    flags["Date_Time"] = df["Date_Time"]
+    for metric in metrics:
+        flags[f"{metric}_null_frac"] = df[metric].isna()
+
+    agg_spec = {
+        "first_date": ("Date_Time", "min"),
+        "last_date": ("Date_Time", "max"),
+        "rows": ("Date_Time", "size"),
+    }
+    for metric in metrics:
+        agg_spec[f"{metric}_null_frac"] = (f"{metric}_null_frac", "mean")
+
+    coverage = flags.groupby(keys, sort=True).agg(**agg_spec).reset_index()
+    coverage.insert(len(keys), "start_year", coverage["first_date"].dt.year)
+    coverage.insert(len(keys) + 1, "end_year", coverage["last_date"].dt.year)
+    coverage["first_date"] = coverage["first_date"].dt.strftime("%Y-%m-%d")
+    coverage["last_date"] = coverage["last_date"].dt.strftime("%Y-%m-%d")
+    return coverage.round({f"{m}_null_frac": 4 for m in metrics})
+
+
+def build_catalogs(df, cities):
+    """
+    Returns (cities_metadata, stations_catalog) dataframes. `cities` is the
+    CITIES config, used to attach station IDs to the station catalog.
+    """
+    cities_metadata = _coverage(df, ["City"])
+
+    stations = _coverage(df, ["City", "Station"]) if "Station" in df.columns else None
+    if stations is not None:
+        station_ids = {
+            (city_name, info["station_name"]): info["station_id"]
+            for city_name, stations_list in cities.items()
+            for info in stations_list
+        }
+        keys = zip(stations["City"], stations["Station"])
+        stations.insert(2, "station_id", [station_ids.get(key) for key in keys])
+    return cities_metadata, stations
+
+
+def write_catalogs(df, cities, processed_data_dir):
+    """Builds and writes both catalogs, returning their paths."""
+    cities_metadata, stations = build_catalogs(df, cities)
+    paths = {"cities": os.path.join(processed_data_dir, CITIES_METADATA_FILE)}
+    with atomic_write(paths["cities"]) as tmp_path:
+        cities_metadata.to_csv(tmp_path, index=False)
+    if stations is not None:
+        paths["stations"] = os.path.join(processed_data_dir, STATIONS_CATALOG_FILE)
+        with atomic_write(paths["stations"]) as tmp_path:
+            stations.to_csv(tmp_path, index=False)
+    return paths
@@ -0,0 +1,43 @@
+# city_partitions.py
+# One Parquet file per city, written by merger.py alongside the merged CSV.
+#
+# The web app loads a single city's rows on demand from these files instead of
+# reading the full all_cities_weather_data.csv into every worker at startup.
+# Each file is written under a temporary name and renamed into place, so a
+# running web app never loads a partially written partition.
+
+import os
+import re
+
+import pandas as pd
+
+from merged_data import atomic_write
+
+PARTITIONS_DIR_NAME = "by_city"
+
+
+def partitions_dir(processed_data_dir):
+    return os.path.join(processed_data_dir, PARTITIONS_DIR_NAME)
+
+
+def partition_path(processed_data_dir, city):
+    """Path of a city's partition file, e.g. by_city/st_john_s.parquet."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", city).strip("_").lower()
+    return os.path.join(partitions_dir(processed_data_dir), f"{slug}.parquet")
+
+
+def write_city_partitions(df, processed_data_dir):
+    """Splits the merged frame by City in one groupby pass and writes each part."""
+    os.makedirs(partitions_dir(processed_data_dir), exist_ok=True)
+    paths = {}
+    for city, city_df in df.groupby("City", sort=True):
+        path = partition_path(processed_data_dir, city)
+        with atomic_write(path) as tmp_path:
+            city_df.sort_values("Date_Time").to_parquet(tmp_path, index=False)
+        paths[city] = path
+    return paths
+
+
+def load_city_partition(processed_data_dir, city):
+    """Loads one city's rows. Raises FileNotFoundError if merger.py hasn't written it."""
+    return pd.read_parquet(partition_path(processed_data_dir, city))
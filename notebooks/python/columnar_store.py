@@ -0,0 +1,134 @@
+# columnar_store.py
+# A memory-mappable, column-per-file export of the merged dataset.
+#
+# merger.py writes each column as a .npy file with rows sorted by (City, Date),
+# plus an index.json giving every city's row range. Readers open the columns
+# with np.load(mmap_mode="r"), so all web workers on a machine share the same
+# page-cache pages read-only, and a city's rows are a zero-copy slice.
+#
+# Each export goes into its own version directory (columnar/<version>/) and is
+# published by atomically replacing columnar/CURRENT, so a reader never maps a
+# half-written column and processes still mapping an older version keep working.
+
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from merged_data import atomic_write
+
+STORE_DIR_NAME = "columnar"
+INDEX_FILE = "index.json"
+CURRENT_FILE = "CURRENT"
+# Older versions kept besides the current one, for readers that still map them
+KEEP_OLD_VERSIONS = 1
+
+# Column name -> dtype stored on disk
+STORE_COLUMNS = {
+    "Date": "datetime64[D]",
+    "Year": "int16",
+    "Day_of_Year": "int16",
+    "Max_Temp_C": "float32",
+    "Min_Temp_C": "float32",
+    "Mean_Temp_C": "float32",
+    "Total_Precip_mm": "float32",
+}
+
+
+def store_dir(processed_data_dir):
+    return os.path.join(processed_data_dir, STORE_DIR_NAME)
+
+
+def current_version(processed_data_dir):
+    """Name of the published version. Raises FileNotFoundError if there is none."""
+    with open(os.path.join(store_dir(processed_data_dir), CURRENT_FILE)) as f:
+        return f.read().strip()
+
+
+def _publish(root, version):
+    """Points CURRENT at `version` with an atomic rename, then prunes old versions."""
+    with atomic_write(os.path.join(root, CURRENT_FILE)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            f.write(version)
+
+    versions = sorted(
+        name for name in os.listdir(root)
+        if name != version and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[: max(len(versions) - KEEP_OLD_VERSIONS, 0)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def write_columnar_store(df, processed_data_dir):
+    """
+    Exports the merged frame as one .npy file per column plus a city index
+    into a new version directory, then publishes it as the current version.
+    """
+    root = store_dir(processed_data_dir)
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    directory = os.path.join(root, version)
+    os.makedirs(directory, exist_ok=True)
+
+    ordered = df.sort_values(["City", "Date_Time"], kind="stable")
+    dates = ordered["Date_Time"]
+    columns = {
+        "Date": dates.to_numpy().astype("datetime64[D]"),
+        "Year": dates.dt.year.to_numpy(),
+        "Day_of_Year": dates.dt.dayofyear.to_numpy(),
+    }
+    for metric in ["Max_Temp_C", "Min_Temp_C", "Mean_Temp_C", "Total_Precip_mm"]:
+        columns[metric] = pd.to_numeric(ordered[metric], errors="coerce").to_numpy()
+
+    for name, values in columns.items():
+        np.save(os.path.join(directory, f"{name}.npy"), values.astype(STORE_COLUMNS[name]))
+
+    # Rows are sorted by City, so each city is one contiguous [start, stop) range
+    city_values = ordered["City"].to_numpy()
+    boundaries = np.flatnonzero(city_values[1:] != city_values[:-1]) + 1
+    starts = np.concatenate([[0], boundaries])
+    stops = np.concatenate([boundaries, [len(ordered)]])
+    index = {
+        "rows": int(len(ordered)),
+        "columns": list(STORE_COLUMNS),
+        "cities": {
+            str(city_values[start]): [int(start), int(stop)]
+            for start, stop in zip(starts, stops)
+            if stop > start
+        },
+    }
+    with open(os.path.join(directory, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    _publish(root, version)
+    return directory
+
+
+class ColumnarStore:
+    """Read-only, memory-mapped view of one version of the columnar export."""
+
+    def __init__(self, processed_data_dir, version=None):
+        self.version = version or current_version(processed_data_dir)
+        self.directory = os.path.join(store_dir(processed_data_dir), self.version)
+        with open(os.path.join(self.directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.rows = index["rows"]
+        self.city_ranges = {city: tuple(bounds) for city, bounds in index["cities"].items()}
+        self.columns = {
+            name: np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+            for name in index["columns"]
+        }
+
+    @property
+    def cities(self):
+        return list(self.city_ranges)
+
+    def city_columns(self, city, names=None):
+        """Zero-copy views of a city's rows for the requested columns."""
+        start, stop = self.city_ranges[city]
+        names = self.columns if names is None else names
+        return {name: self.columns[name][start:stop] for name in names}
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
@@ -8,6 +8,10 @@
 # 2. Find your desired station.
 # 3. The "Station ID" is what you need for the 'station_id' field below.
 # 4. Check the available years for "Daily" data and set 'start_year' and 'end_year'.
+#
+# A station with only hourly data can be added with "data_type": "hourly". The
+# scraper then fetches it month by month into compact Parquet files and the
+# merger rolls those up to daily rows (see hourly.py).
 
 CITIES = {
     "Calgary": [
@@ -1,8 +1,9 @@
 # debug_city_plot.py
-import pandas as pd
 import plotly.express as px
 import os
 
+from merged_data import load_merged_data, merged_data_path
+
 # ############################################################################
 # # MAIN DEBUGGING SCRIPT
 # ############################################################################
@@ -21,11 +22,12 @@ def debug_city(city_name):
 
     # --- 1. LOAD THE FINAL PROCESSED DATA ---
     base_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in locals() else '.'
-    data_path = os.path.join(base_dir, '..', '..', 'data', 'processed', 'all_cities_weather_data.csv')
+    processed_data_dir = os.path.join(base_dir, '..', '..', 'data', 'processed')
+    data_path = merged_data_path(processed_data_dir)
     
     print(f"Loading data from: {data_path}")
     try:
-        df = pd.read_csv(data_path, parse_dates=['Date_Time'])
+        df = load_merged_data(processed_data_dir)
     except FileNotFoundError:
         print(f"Error: Data file not found at {data_path}")
         return
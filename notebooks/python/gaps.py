@@ -0,0 +1,282 @@
+# gaps.py
+# Complete daily (City x Date) grid with gap detection and gap filling.
+#
+# The reports used to call resample("D") or asfreq("D") on their own, which
+# silently turned missing days into NaNs that their 30-day rolling means then
+# smeared across. merger.py now builds the complete grid once: every city gets
+# one row per day from its first to its last observation, laid out city after
+# city in flat NumPy arrays. Missing spans are found per metric by run-length
+# encoding the NaN mask, and are filled in the order given by `fills`:
+#
+#   interpolate  linear interpolation for spans of up to MAX_INTERPOLATE_DAYS
+#                with an observation on both sides
+#   nearby       the other city whose anomalies in that metric correlate best,
+#                same day: temperatures shifted by the difference between the two
+#                cities' climatologies, precipitation scaled by their ratio
+#   climatology  the city's own mean for that day of the year
+#
+# Nearby and climatology fills only cover spans up to MAX_FILL_DAYS; longer
+# outages (Fort St. John's 2013-2020 gap) stay missing. Each metric gets a
+# <metric>_fill column holding one of FILL_CODES, so filled values can be told
+# apart. The grid is written to daily_grid.parquet and the spans, with how they
+# were filled, to gap_spans.csv.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import METRIC_COLUMNS
+from merged_data import atomic_write
+
+GRID_FILE = "daily_grid.parquet"
+GAP_SPANS_FILE = "gap_spans.csv"
+
+FILL_METHODS = ("interpolate", "nearby", "climatology")
+DEFAULT_FILLS = FILL_METHODS
+MAX_INTERPOLATE_DAYS = 3
+MAX_FILL_DAYS = 62
+# A city's nearby fill source must track its daily anomalies at least this closely
+MIN_NEIGHBOUR_CORRELATION = 0.8
+MIN_NEIGHBOUR_OVERLAP_DAYS = 365
+# Metrics filled from a neighbour by scaling with the climatology ratio instead
+# of shifting by the difference, so they stay non-negative
+RATIO_METRICS = ("Total_Precip_mm",)
+
+FILL_CODES = {"missing": -1, "observed": 0, "interpolate": 1, "nearby": 2, "climatology": 3}
+FILL_LABELS = {code: label for label, code in FILL_CODES.items()}
+
+
+def build_grid(df, metrics=None):
+    """
+    The complete daily grid for a frame with one row per (City, Date_Time),
+    as produced by splice.py. Returns a dataframe sorted by City then date.
+    """
+    metrics = [m for m in (metrics or METRIC_COLUMNS) if m in df.columns]
+    city_codes, cities = pd.factorize(df["City"], sort=True)
+    days = df["Date_Time"].to_numpy().astype("datetime64[D]").astype("int64")
+
+    first = np.full(len(cities), np.iinfo("int64").max)
+    last = np.full(len(cities), np.iinfo("int64").min)
+    np.minimum.at(first, city_codes, days)
+    np.maximum.at(last, city_codes, days)
+    lengths = last - first + 1
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    grid_city = np.repeat(np.arange(len(cities)), lengths)
+    grid_days = first[grid_city] + np.arange(lengths.sum()) - offsets[grid_city]
+    positions = offsets[city_codes] + days - first[city_codes]
+
+    grid = pd.DataFrame(
+        {
+            "City": pd.Categorical.from_codes(grid_city, categories=cities),
+            "Date_Time": grid_days.astype("datetime64[D]").astype("datetime64[ns]"),
+        }
+    )
+    for metric in metrics:
+        values = np.full(len(grid), np.nan)
+        values[positions] = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype="float64")
+        grid[metric] = values
+    return grid
+
+
+def _city_bounds(grid):
+    """(codes, first row of each city, last row of each city) for a grid from build_grid."""
+    codes = grid["City"].cat.codes.to_numpy()
+    starts = np.flatnonzero(np.diff(codes, prepend=-1) != 0)
+    ends = np.append(starts[1:], len(codes)) - 1
+    return codes, starts, ends
+
+
+def missing_runs(values, city_starts, city_ends):
+    """
+    Run-length encodes the NaNs of one grid column. Returns (starts, lengths,
+    bounded), where bounded marks runs with an observation on both sides in
+    the same city. Runs never cross from one city into the next.
+    """
+    missing = np.isnan(values)
+    first_row = np.zeros(len(values), dtype=bool)
+    first_row[city_starts] = True
+    last_row = np.zeros(len(values), dtype=bool)
+    last_row[city_ends] = True
+
+    previous_missing = np.concatenate([[False], missing[:-1]])
+    next_missing = np.concatenate([missing[1:], [False]])
+    starts = np.flatnonzero(missing & (first_row | ~previous_missing))
+    ends = np.flatnonzero(missing & (last_row | ~next_missing))
+    bounded = ~first_row[starts] & ~last_row[ends]
+    return starts, ends - starts + 1, bounded
+
+
+def _climatology(values, codes, day_of_year, n_cities):
+    """Mean per (city, day of year) of the observed values, broadcast to every row."""
+    keys = codes.astype("int64") * 367 + day_of_year
+    observed = ~np.isnan(values)
+    sums = np.bincount(keys[observed], weights=values[observed], minlength=n_cities * 367)
+    counts = np.bincount(keys[observed], minlength=n_cities * 367)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return means[keys]
+
+
+def correlated_neighbours(grid, metric="Mean_Temp_C"):
+    """
+    City -> the other city whose daily anomalies (value minus climatology)
+    correlate best with it, for pairs above MIN_NEIGHBOUR_CORRELATION over at
+    least MIN_NEIGHBOUR_OVERLAP_DAYS. The Date x City matrix this builds is
+    fine for a few hundred cities; pass `neighbours` explicitly beyond that.
+    """
+    codes, _, _ = _city_bounds(grid)
+    cities = grid["City"].cat.categories
+    values = grid[metric].to_numpy(dtype="float64")
+    dates = grid["Date_Time"]
+    anomalies = values - _climatology(values, codes, dates.dt.dayofyear.to_numpy(), len(cities))
+
+    day_index = (dates - dates.min()).dt.days.to_numpy()
+    matrix = np.full((day_index.max() + 1, len(cities)), np.nan)
+    matrix[day_index, codes] = anomalies
+    corr = pd.DataFrame(matrix, columns=cities).corr(min_periods=MIN_NEIGHBOUR_OVERLAP_DAYS)
+
+    neighbours = {}
+    for city in cities:
+        candidates = corr[city].drop(city).dropna()
+        candidates = candidates[candidates >= MIN_NEIGHBOUR_CORRELATION]
+        if not candidates.empty:
+            neighbours[city] = candidates.idxmax()
+    return neighbours
+
+
+def fill_gaps(grid, fills=DEFAULT_FILLS, neighbours=None,
+              max_interpolate_days=MAX_INTERPOLATE_DAYS, max_fill_days=MAX_FILL_DAYS):
+    """
+    Fills the missing values of a copy of the grid. Returns (filled_grid,
+    gap_spans): the grid with a <metric>_fill column per metric, and one row
+    per missing span with its length, how many days were filled and the fill
+    used for its first day. `neighbours` maps metric -> {city: source city}
+    for the nearby fill; metrics left out use correlated_neighbours().
+    """
+    unknown = [fill for fill in fills if fill not in FILL_METHODS]
+    if unknown:
+        raise ValueError(f"Unknown fill method(s) {unknown}; expected any of {FILL_METHODS}")
+
+    grid = grid.copy()
+    metrics = [m for m in METRIC_COLUMNS if m in grid.columns]
+    codes, city_starts, city_ends = _city_bounds(grid)
+    cities = grid["City"].cat.categories
+    day_of_year = grid["Date_Time"].dt.dayofyear.to_numpy()
+    neighbours = dict(neighbours or {})
+    grid_days = grid["Date_Time"].to_numpy().astype("datetime64[D]").astype("int64")
+    city_index = {city: i for i, city in enumerate(cities)}
+
+    def neighbour_rows(metric):
+        """Row of the metric's neighbour on the same day, or -1 outside its range."""
+        rows = np.full(len(grid), -1)
+        if metric not in neighbours:
+            neighbours[metric] = correlated_neighbours(grid, metric)
+        if not neighbours[metric]:
+            return rows
+        first_day = grid_days[city_starts]
+        last_day = grid_days[city_ends]
+        neighbour_of = np.array(
+            [city_index.get(neighbours[metric].get(city), -1) for city in cities]
+        )
+        source = neighbour_of[codes]
+        has_source = source >= 0
+        in_range = has_source & (grid_days >= first_day[source]) & (grid_days <= last_day[source])
+        rows[in_range] = city_starts[source[in_range]] + (
+            grid_days[in_range] - first_day[source[in_range]]
+        )
+        return rows
+
+    spans = []
+    for metric in metrics:
+        values = grid[metric].to_numpy(dtype="float64").copy()
+        observed = ~np.isnan(values)
+        marks = np.where(observed, FILL_CODES["observed"], FILL_CODES["missing"]).astype("int8")
+        starts, lengths, bounded = missing_runs(values, city_starts, city_ends)
+        # Each missing row's run, in order, so per-run rules broadcast to rows
+        missing_rows = np.flatnonzero(~observed)
+        run_of_row = np.repeat(np.arange(len(starts)), lengths)
+        climatology = _climatology(values, codes, day_of_year, len(cities))
+
+        for fill in fills:
+            if fill == "interpolate":
+                eligible = bounded & (lengths <= max_interpolate_days)
+            else:
+                eligible = lengths <= max_fill_days
+            rows = missing_rows[eligible[run_of_row]]
+            rows = rows[marks[rows] == FILL_CODES["missing"]]
+            if not len(rows):
+                continue
+
+            if fill == "interpolate":
+                observed_rows = np.flatnonzero(observed)
+                filled = np.interp(rows, observed_rows, values[observed_rows])
+            elif fill == "climatology":
+                filled = climatology[rows]
+            else:
+                source = neighbour_rows(metric)[rows]
+                filled = np.full(len(rows), np.nan)
+                usable = (source >= 0) & (marks[np.maximum(source, 0)] == FILL_CODES["observed"])
+                source, target = source[usable], rows[usable]
+                if metric in RATIO_METRICS:
+                    # A source climatology of 0 gives no ratio; those rows stay
+                    # missing for the climatology fill
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        ratio = climatology[target] / climatology[source]
+                    ratio[~np.isfinite(ratio)] = np.nan
+                    filled[usable] = np.clip(values[source] * ratio, 0, None)
+                else:
+                    filled[usable] = values[source] + climatology[target] - climatology[source]
+            done = ~np.isnan(filled)
+            values[rows[done]] = np.round(filled[done], 1)
+            marks[rows[done]] = FILL_CODES[fill]
+
+        grid[metric] = values
+        grid[f"{metric}_fill"] = marks
+        filled_per_run = np.bincount(
+            run_of_row, weights=marks[missing_rows] != FILL_CODES["missing"], minlength=len(starts)
+        )
+        spans.append(
+            pd.DataFrame(
+                {
+                    "City": cities[codes[starts]],
+                    "Metric": metric,
+                    "Start": grid["Date_Time"].to_numpy()[starts],
+                    "Days": lengths,
+                    "Filled_Days": filled_per_run.astype("int64"),
+                    "Fill": [FILL_LABELS[code] for code in marks[starts]],
+                }
+            )
+        )
+
+    gap_spans = pd.concat(spans, ignore_index=True) if spans else pd.DataFrame()
+    return grid, gap_spans
+
+
+def write_grid(grid, gap_spans, processed_data_dir):
+    """Writes daily_grid.parquet and gap_spans.csv, each replaced atomically."""
+    paths = {
+        "grid": os.path.join(processed_data_dir, GRID_FILE),
+        "gap_spans": os.path.join(processed_data_dir, GAP_SPANS_FILE),
+    }
+    with atomic_write(paths["grid"]) as tmp_path:
+        grid.to_parquet(tmp_path, index=False)
+    with atomic_write(paths["gap_spans"]) as tmp_path:
+        gap_spans.to_csv(tmp_path, index=False)
+    return paths
+
+
+def load_daily_grid(processed_data_dir, city=None):
+    """
+    Loads the gap-filled grid written by merger.py, optionally for one city
+    (matched case-insensitively). Returns None if it has not been generated
+    yet, so callers can fall back to resampling the daily data.
+    """
+    path = os.path.join(processed_data_dir, GRID_FILE)
+    if not os.path.exists(path):
+        return None
+    grid = pd.read_parquet(path)
+    if city is not None:
+        grid = grid[grid["City"].astype(str).str.lower() == city.lower()]
+    return grid
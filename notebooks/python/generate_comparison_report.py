@@ -1,9 +1,10 @@
-import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import os
 
-def generate_comparison_report():
+from gaps import load_daily_grid
+from merged_data import load_merged_data, merged_data_path
+
+def generate_comparison_report(processed_data_dir=None, output_dir=None):
     """
     Loads weather data for all cities and generates a multi-plot
     interactive HTML report comparing them.
@@ -12,33 +13,52 @@ def generate_comparison_report():
 
     # --- 1. DEFINE FILE PATHS ---
     base_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in locals() else '.'
-    data_path = os.path.join(base_dir, '..', '..', 'data', 'processed', 'all_cities_weather_data.csv')
-    output_dir = os.path.join(base_dir, '..', '..', 'reports')
+    if processed_data_dir is None:
+        processed_data_dir = os.path.join(base_dir, '..', '..', 'data', 'processed')
+    if output_dir is None:
+        output_dir = os.path.join(base_dir, '..', '..', 'reports')
     os.makedirs(output_dir, exist_ok=True)
-    
-    print(f"Loading data from: {data_path}")
-    try:
-        df = pd.read_csv(data_path, parse_dates=['Date_Time'])
-        print("Data loaded successfully. Creating comparison plots...")
-    except FileNotFoundError:
-        print(f"Error: Data file not found at {data_path}")
-        return
-
-    # --- 2. PLOT 1: 30-DAY MOVING AVERAGE TEMPERATURE COMPARISON ---
+
+    # --- 2. BUILD THE (DATE x CITY) MATRIX ONCE ---
+    # One column per city on a continuous daily index, from merger.py's
+    # gap-filled daily grid when available; the merged file is only read
+    # without it. Every plot below works column-wise on this matrix instead of
+    # re-filtering the full frame per city.
+    grid = load_daily_grid(processed_data_dir)
+    if grid is not None:
+        print(f"Loaded the daily grid from: {processed_data_dir}")
+        daily_matrix = grid.pivot(index='Date_Time', columns='City', values='Mean_Temp_C')
+        daily_matrix.columns = daily_matrix.columns.astype(str)
+    else:
+        data_path = merged_data_path(processed_data_dir)
+        print(f"Loading data from: {data_path}")
+        try:
+            df = load_merged_data(processed_data_dir)
+            print("Data loaded successfully. Creating comparison plots...")
+        except FileNotFoundError:
+            print(f"Error: Data file not found at {data_path}")
+            return
+        daily_matrix = df.pivot_table(
+            index='Date_Time',
+            columns='City',
+            values='Mean_Temp_C',
+            aggfunc='mean'
+        )
+    daily_matrix = daily_matrix.asfreq('D')
+
+    # 30-day moving average for every city in a single rolling pass; half a
+    # window of data is required so it doesn't run on into long gaps
+    rolling_matrix = daily_matrix.rolling(window=30, min_periods=15, center=True).mean()
+
+    # --- 3. PLOT 1: 30-DAY MOVING AVERAGE TEMPERATURE COMPARISON ---
     
     fig_line = go.Figure()
     
-    # Loop through each city and add its moving average as a separate line
-    for city in df['City'].unique():
-        city_df = df[df['City'] == city].set_index('Date_Time').sort_index()
-        
-        # Resample to daily and calculate moving average
-        daily_df = city_df.resample('D').agg({'Mean_Temp_C': 'mean'}).copy()
-        daily_df['30-Day Avg'] = daily_df['Mean_Temp_C'].rolling(window=30, min_periods=1, center=True).mean()
-        
+    # Add each city's moving average as a separate line
+    for city in rolling_matrix.columns:
         fig_line.add_trace(go.Scatter(
-            x=daily_df.index, 
-            y=daily_df['30-Day Avg'], 
+            x=rolling_matrix.index, 
+            y=rolling_matrix[city], 
             name=city, # The legend will show the city name
             mode='lines'
         ))
@@ -50,30 +70,32 @@ def generate_comparison_report():
         legend_title='City'
     )
 
-    # --- 3. PLOT 2: MONTHLY TEMPERATURE DISTRIBUTION BOX PLOT COMPARISON ---
+    # --- 4. PLOT 2: MONTHLY TEMPERATURE DISTRIBUTION BOX PLOT COMPARISON ---
     
-    # Plotly Express is great for this, as it can group by color automatically
-    df['Month'] = pd.Categorical(
-        df['Date_Time'].dt.month_name(),
-        categories=['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'],
-        ordered=True
-    )
-    
-    fig_box = px.box(
-        df.sort_values('Month'), # Sort by month to ensure correct order
-        x='Month',
-        y='Mean_Temp_C',
-        color='City', # This creates a separate, colored box for each city
-        title='Monthly Temperature Distribution Comparison'
-    )
+    # Reuse the daily matrix: one month label per row, then one box trace per city column
+    month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+    month_labels = daily_matrix.index.month_name()
+
+    fig_box = go.Figure()
+    for city in daily_matrix.columns:
+        fig_box.add_trace(go.Box(
+            x=month_labels,
+            y=daily_matrix[city],
+            name=city # This creates a separate, colored box for each city
+        ))
     
     fig_box.update_layout(
+        title_text='Monthly Temperature Distribution Comparison',
+        boxmode='group',
         xaxis_title='Month',
-        yaxis_title='Mean Temperature (°C)'
+        yaxis_title='Mean Temperature (°C)',
+        xaxis_categoryorder='array',
+        xaxis_categoryarray=month_order,
+        legend_title='City'
     )
 
 
-    # --- 4. SAVE BOTH PLOTS TO A SINGLE HTML FILE ---
+    # --- 5. SAVE BOTH PLOTS TO A SINGLE HTML FILE ---
     output_filename = "weather_report.html" # The main comparison report file
     output_path = os.path.join(output_dir, output_filename)
 
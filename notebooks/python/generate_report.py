@@ -1,4 +1,4 @@
-import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
@@ -6,7 +6,12 @@ import argparse
 import sys
 import os
 
-def generate_report(city_name):
+from aggregates import load_aggregate_table, mean_and_std
+from gaps import load_daily_grid
+from merged_data import load_merged_data, merged_data_path
+from query_store import load_city, query
+
+def generate_report(city_name, processed_data_dir=None, output_dir=None):
     """
     Loads weather data, filters it for a specific city, and generates
     a multi-plot interactive HTML report including a heatmap.
@@ -15,40 +20,60 @@ def generate_report(city_name):
 
     # --- 1. DEFINE FILE PATHS ---
     base_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in locals() else '.'
-    data_path = os.path.join(base_dir, '..', '..', 'data', 'processed', 'all_cities_weather_data.csv')
-    output_dir = os.path.join(base_dir, '..', '..', 'reports')
+    if processed_data_dir is None:
+        processed_data_dir = os.path.join(base_dir, '..', '..', 'data', 'processed')
+    if output_dir is None:
+        output_dir = os.path.join(base_dir, '..', '..', 'reports')
+    data_path = merged_data_path(processed_data_dir)
     os.makedirs(output_dir, exist_ok=True)
     
-    print(f"Loading data from: {data_path}")
-    try:
-        df = pd.read_csv(data_path, parse_dates=['Date_Time'])
-        print("Data loaded successfully. Creating plots...")
-    except FileNotFoundError:
-        print(f"Error: Data file not found at {data_path}")
-        return
-    except ValueError as e:
-        print(f"Error reading the CSV. It might be missing a key column. Details: {e}")
-        return
-
-    # --- 2. FILTER DATA FOR THE CHOSEN CITY ---
-    city_df = df[df['City'].str.lower() == city_name.lower()].copy()
-
-    if city_df.empty:
-        print(f"Error: No data found for city '{city_name}'. Please check the city name.")
-        print(f"Available cities in the dataset are: {df['City'].unique()}")
-        return
+    # Only this city's rows are needed: fetch them from merger.py's indexed
+    # query store when it exists rather than loading every city's data
+    city_df = load_city(processed_data_dir, city_name)
+    if city_df is not None:
+        print(f"Loaded {len(city_df)} rows for {city_name} from the query store.")
+        if city_df.empty:
+            available = query("SELECT DISTINCT City FROM daily", processed_data_dir=processed_data_dir)
+            print(f"Error: No data found for city '{city_name}'. Please check the city name.")
+            print(f"Available cities in the dataset are: {available['City'].tolist()}")
+            return
+    else:
+        print(f"Loading data from: {data_path}")
+        try:
+            df = load_merged_data(processed_data_dir)
+            print("Data loaded successfully. Creating plots...")
+        except FileNotFoundError:
+            print(f"Error: Data file not found at {data_path}")
+            return
+        except ValueError as e:
+            print(f"Error reading the CSV. It might be missing a key column. Details: {e}")
+            return
+
+        # --- 2. FILTER DATA FOR THE CHOSEN CITY ---
+        city_df = df[df['City'].str.lower() == city_name.lower()].copy()
+
+        if city_df.empty:
+            print(f"Error: No data found for city '{city_name}'. Please check the city name.")
+            print(f"Available cities in the dataset are: {df['City'].unique()}")
+            return
     
     city_df = city_df.set_index('Date_Time').sort_index()
     
     # --- 3. CREATE PLOTS ---
-    # Resample to daily for the line charts
-    daily_df = city_df.resample('D').agg({
-        'Max_Temp_C': 'max',
-        'Min_Temp_C': 'min',
-        'Mean_Temp_C': 'mean'
-    }).copy()
-    
-    daily_df['30-Day Avg Temp (°C)'] = daily_df['Mean_Temp_C'].rolling(window=30, min_periods=1, center=True).mean()
+    # The line charts use merger.py's complete daily grid, where short gaps are
+    # already filled and long ones are left missing; without it, resample here
+    daily_df = load_daily_grid(processed_data_dir, city_name)
+    if daily_df is not None and not daily_df.empty:
+        daily_df = daily_df.set_index('Date_Time')[['Max_Temp_C', 'Min_Temp_C', 'Mean_Temp_C']]
+    else:
+        daily_df = city_df.resample('D').agg({
+            'Max_Temp_C': 'max',
+            'Min_Temp_C': 'min',
+            'Mean_Temp_C': 'mean'
+        }).copy()
+
+    # Half a window of data is required so the average doesn't run on into long gaps
+    daily_df['30-Day Avg Temp (°C)'] = daily_df['Mean_Temp_C'].rolling(window=30, min_periods=15, center=True).mean()
 
     # --- Create a 3-ROW subplot figure ---
     fig = make_subplots(
@@ -63,9 +88,9 @@ def generate_report(city_name):
     )
 
     # PLOT 1: Daily Temperature with Moving Average
-    fig.add_trace(go.Scatter(x=daily_df.index, y=daily_df['Min_Temp_C'], name='Min Temp', line=dict(color='blue', width=1), opacity=0.5), row=1, col=1)
-    fig.add_trace(go.Scatter(x=daily_df.index, y=daily_df['Max_Temp_C'], name='Max Temp', line=dict(color='red', width=1), opacity=0.5), row=1, col=1)
-    fig.add_trace(go.Scatter(x=daily_df.index, y=daily_df['30-Day Avg Temp (°C)'], name='30-Day Avg', line=dict(color='black', width=2)), row=1, col=1)
+    fig.add_trace(go.Scatter(x=daily_df.index, y=daily_df['Min_Temp_C'].to_numpy(np.float32), name='Min Temp', line=dict(color='blue', width=1), opacity=0.5), row=1, col=1)
+    fig.add_trace(go.Scatter(x=daily_df.index, y=daily_df['Max_Temp_C'].to_numpy(np.float32), name='Max Temp', line=dict(color='red', width=1), opacity=0.5), row=1, col=1)
+    fig.add_trace(go.Scatter(x=daily_df.index, y=daily_df['30-Day Avg Temp (°C)'].to_numpy(np.float32), name='30-Day Avg', line=dict(color='black', width=2)), row=1, col=1)
 
     # PLOT 2: Monthly Box Plot for Mean Temperature
     city_df['MonthName'] = city_df.index.month_name()
@@ -73,18 +98,27 @@ def generate_report(city_name):
     fig.add_trace(go.Box(x=city_df['MonthName'], y=city_df['Mean_Temp_C'], name='Temp Dist.', marker_color='lightblue'), row=2, col=1)
 
     # --- PLOT 3: HEATMAP ---
-    # Prepare data for the heatmap by pivoting
-    heatmap_data = city_df.pivot_table(
-        values='Mean_Temp_C', 
-        index=city_df.index.year, 
-        columns=city_df.index.month,
-        aggfunc='mean'
-    )
-    # Rename month number columns to month names for the heatmap
+    # Use the monthly aggregate table from merger.py when available; otherwise pivot the daily rows
+    monthly_table = load_aggregate_table('monthly', processed_data_dir)
+    if monthly_table is not None:
+        city_monthly = monthly_table[monthly_table['City'].str.lower() == city_name.lower()].copy()
+        city_monthly['Mean_Temp_C'], _ = mean_and_std(city_monthly, 'Mean_Temp_C')
+        heatmap_data = city_monthly.pivot(index='Year', columns='Month', values='Mean_Temp_C')
+    else:
+        heatmap_data = city_df.pivot_table(
+            values='Mean_Temp_C', 
+            index=city_df.index.year, 
+            columns=city_df.index.month,
+            aggfunc='mean'
+        )
+    # Rename month number columns to month names for the heatmap; months
+    # without data (e.g. a partial first year) stay as empty columns
+    heatmap_data = heatmap_data.reindex(columns=range(1, 13))
     heatmap_data.columns = month_order
 
+    # plotly writes numpy arrays as base64 blobs rather than JSON lists; float32 halves them
     fig.add_trace(go.Heatmap(
-        z=heatmap_data.values,
+        z=heatmap_data.to_numpy(np.float32),
         x=heatmap_data.columns,
         y=heatmap_data.index,
         colorscale='RdBu_r', # Red-Blue reversed (hot is red, cold is blue)
@@ -1,9 +1,14 @@
-import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import os
 
-def generate_summary_report():
+from aggregates import load_aggregate_table, mean_and_std
+from merged_data import load_merged_data, merged_data_path
+from query_store import load_city, store_path
+from quantile_sketches import calendar_day, exact_bands, load_sketches
+
+def generate_summary_report(processed_data_dir=None, output_dir=None):
     """
     Loads weather data for all cities and generates a comprehensive, multi-plot
     interactive HTML report that compares them and provides deep-dive plots for each.
@@ -12,25 +17,42 @@ def generate_summary_report():
 
     # --- 1. DEFINE FILE PATHS ---
     base_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in locals() else '.'
-    data_path = os.path.join(base_dir, '..', '..', 'data', 'processed', 'all_cities_weather_data.csv')
-    output_dir = os.path.join(base_dir, '..', '..', 'reports')
+    if processed_data_dir is None:
+        processed_data_dir = os.path.join(base_dir, '..', '..', 'data', 'processed')
+    if output_dir is None:
+        output_dir = os.path.join(base_dir, '..', '..', 'reports')
+    data_path = merged_data_path(processed_data_dir)
     os.makedirs(output_dir, exist_ok=True)
     
-    print(f"Loading data from: {data_path}")
-    try:
-        df = pd.read_csv(data_path, parse_dates=['Date_Time'])
-        print("Data loaded successfully. Preparing data for plots...")
-    except FileNotFoundError:
-        print(f"Error: Data file not found at {data_path}")
-        return
+    # With merger.py's day-of-year climatology, quantile sketches and query
+    # store, only the per-city plots need daily rows, and they are read one
+    # city at a time; otherwise everything comes from the merged file.
+    climatology = load_aggregate_table('daily_climatology', processed_data_dir)
+    sketches = load_sketches(processed_data_dir)
+    df = None
+    if climatology is None or sketches is None or not os.path.exists(store_path(processed_data_dir)):
+        print(f"Loading data from: {data_path}")
+        try:
+            df = load_merged_data(processed_data_dir)
+            print("Data loaded successfully. Preparing data for plots...")
+        except FileNotFoundError:
+            print(f"Error: Data file not found at {data_path}")
+            return
 
     # --- 2. DATA PREPARATION ---
-    df['Day_of_Year'] = df['Date_Time'].dt.dayofyear
-    df = df[df['Day_of_Year'] != 366]
+    cities = sorted((df if df is not None else climatology)['City'].unique())
 
     # --- 3. PLOT 1: CITY-TO-CITY AVERAGE DAY COMPARISON ---
     print("Generating Plot 1: City-to-City Average Day Comparison...")
-    avg_day_df = df.groupby(['City', 'Day_of_Year'])['Mean_Temp_C'].mean().reset_index()
+    # Read the day-of-year climatology produced by merger.py instead of regrouping every row
+    if climatology is not None:
+        climatology = climatology[climatology['Day_of_Year'] != 366]
+        avg_day_df = climatology[['City', 'Day_of_Year']].copy()
+        avg_day_df['Mean_Temp_C'], _ = mean_and_std(climatology, 'Mean_Temp_C')
+    else:
+        day_of_year = df['Date_Time'].dt.dayofyear.rename('Day_of_Year')
+        avg_day_df = df.groupby(['City', day_of_year])['Mean_Temp_C'].mean().reset_index()
+        avg_day_df = avg_day_df[avg_day_df['Day_of_Year'] != 366]
 
     fig_avg_day = px.line(
         avg_day_df,
@@ -51,10 +73,16 @@ def generate_summary_report():
 
     # --- 5. GENERATE AND APPEND DEEP-DIVE PLOTS FOR EACH CITY ---
     with open(output_path, 'a') as f:
-        for city in sorted(df['City'].unique()):
+        for city in cities:
             print(f"Generating deep-dive plots for {city}...")
-            city_df = df[df['City'] == city].copy()
+            if df is not None:
+                city_df = df[df['City'] == city].copy()
+            else:
+                city_df = load_city(processed_data_dir, city)
             city_df['Year'] = city_df['Date_Time'].dt.year
+            # The calendar day the quantile sketches are keyed by, so every
+            # plot puts a date at the same x in leap and non-leap years
+            city_df['Day_of_Year'] = calendar_day(city_df['Date_Time'].dt)
 
             # --- PLOT 2 (per city): SMOOTHED YEAR-OVER-YEAR "SPAGHETTI PLOT" ---
             city_df['Smoothed_Temp'] = city_df.groupby('Year')['Mean_Temp_C'].transform(
@@ -88,7 +116,7 @@ def generate_summary_report():
 
 
             fig_heatmap = go.Figure(data=go.Heatmap(
-                z=heatmap_df.values,
+                z=heatmap_df.to_numpy(np.float32),
                 x=heatmap_df.columns,
                 y=heatmap_df.index,
                 colorscale='RdBu_r',
@@ -100,10 +128,32 @@ def generate_summary_report():
                 yaxis_title='Year'
             )
 
+            # --- PLOT 4 (per city): 10TH/50TH/90TH PERCENTILE BANDS ---
+            if sketches is not None:
+                bands_df = sketches.bands(city, 'Mean_Temp_C').set_index('Day_of_Year')
+            else:
+                bands_df = exact_bands(city_df, 'Mean_Temp_C').set_index('Day_of_Year')
+
+            fig_bands = go.Figure([
+                go.Scatter(x=bands_df.index, y=bands_df['P90'], name='90th percentile',
+                           line=dict(width=0.5, color='firebrick')),
+                go.Scatter(x=bands_df.index, y=bands_df['P10'], name='10th percentile',
+                           line=dict(width=0.5, color='royalblue'), fill='tonexty',
+                           fillcolor='rgba(128, 128, 128, 0.2)'),
+                go.Scatter(x=bands_df.index, y=bands_df['P50'], name='Median',
+                           line=dict(color='black')),
+            ])
+            fig_bands.update_layout(
+                title=f'{city}: Daily Mean Temperature Percentiles (10th, 50th, 90th)',
+                xaxis_title='Day of the Year',
+                yaxis_title='Mean Temperature (°C)'
+            )
+
             # Append plots to the HTML file
             f.write(f"<hr><h1>Detailed Analysis for {city}</h1>")
             f.write(fig_spaghetti.to_html(full_html=False, include_plotlyjs=False))
             f.write(fig_heatmap.to_html(full_html=False, include_plotlyjs=False))
+            f.write(fig_bands.to_html(full_html=False, include_plotlyjs=False))
             print(f"  > Appended {city}'s plots to the report.")
 
 
@@ -0,0 +1,157 @@
+# hourly.py
+# Storage and daily rollups for stations configured with "data_type": "hourly".
+#
+# The hourly bulk endpoint serves one month per request, so scraper.py downloads
+# hourly stations month by month and hands each CSV to parse_hourly_csv(). The
+# observations are kept as one small Parquet file per station-month next to the
+# daily raw files (data/raw/<City>_<Station>/<YYYY>_<MM>_hourly.parquet), with
+# measurements stored as scaled int16 (tenths of a degree, tenths of a mm, ...),
+# which is about a quarter of the size of float64 columns before compression.
+#
+# daily_rollups() turns a station's hourly rows into the same daily columns the
+# daily files have (plus rain and observation hours), so merger.py can merge
+# hourly stations alongside daily ones.
+
+import glob
+import io
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from merged_data import atomic_write
+
+HOURLY_FILE_SUFFIX = "_hourly.parquet"
+
+# (column in the EC hourly CSV, stored int16 column, decoded column, scale)
+HOURLY_FIELDS = [
+    ("Temp (°C)", "Temp_dC", "Temp_C", 10),
+    ("Dew Point Temp (°C)", "Dew_Point_dC", "Dew_Point_C", 10),
+    ("Rel Hum (%)", "Rel_Hum_pct", "Rel_Hum_pct", 1),
+    ("Precip. Amount (mm)", "Precip_dmm", "Precip_mm", 10),
+    ("Wind Spd (km/h)", "Wind_Spd_kmh", "Wind_Spd_kmh", 1),
+    ("Stn Press (kPa)", "Stn_Press_daPa", "Stn_Press_kPa", 100),
+]
+HOURLY_DATE_COLUMN = "Date/Time (LST)"
+HOURLY_STORED_COLUMNS = ["Date_Time"] + [stored for _, stored, _, _ in HOURLY_FIELDS]
+
+# A day needs this many hourly temperatures for its max/min/mean to be reported
+MIN_HOURS_FOR_DAILY_TEMP = 18
+
+
+def hourly_partition_path(raw_data_dir, city_name, station_info, year, month):
+    station_dir = os.path.join(raw_data_dir, f"{city_name}_{station_info['station_name']}")
+    return os.path.join(station_dir, f"{year}_{month:02d}{HOURLY_FILE_SUFFIX}")
+
+
+def parse_hourly_csv(text):
+    """
+    Parses an hourly bulk-data CSV (from its header row) into the compact
+    layout: Date_Time plus one nullable int16 column per HOURLY_FIELDS entry.
+    """
+    raw = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
+    dates = pd.to_datetime(raw[HOURLY_DATE_COLUMN], errors="coerce")
+    compact = pd.DataFrame({"Date_Time": dates.astype("datetime64[s]")})
+    for source, stored, _, scale in HOURLY_FIELDS:
+        if source in raw.columns:
+            values = pd.to_numeric(raw[source], errors="coerce").to_numpy(dtype="float64")
+        else:
+            values = np.full(len(raw), np.nan)
+        compact[stored] = pd.array(np.round(values * scale), dtype="Int16")
+    return compact.dropna(subset=["Date_Time"]).reset_index(drop=True)
+
+
+def write_hourly_partition(compact_df, path):
+    """Writes one station-month file, renaming it into place once complete."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path) as tmp_path:
+        compact_df.to_parquet(tmp_path, index=False, compression="zstd")
+
+
+def _partition_month(path):
+    pattern = r"(\d{4})_(\d{2})" + re.escape(HOURLY_FILE_SUFFIX) + "$"
+    match = re.match(pattern, os.path.basename(path))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def load_hourly(raw_data_dir, city_name, station_info, start=None, end=None, decode=True):
+    """
+    Loads a station's hourly rows between two "YYYY-MM" months (inclusive),
+    reading only the partitions in range. With `decode` the int16 columns are
+    converted back to float units (Temp_C, Precip_mm, ...).
+    """
+    station_dir = os.path.join(raw_data_dir, f"{city_name}_{station_info['station_name']}")
+    first = tuple(int(part) for part in start.split("-")) if start else (0, 0)
+    last = tuple(int(part) for part in end.split("-")) if end else (9999, 12)
+
+    paths = sorted(
+        path for path in glob.glob(os.path.join(station_dir, f"*{HOURLY_FILE_SUFFIX}"))
+        if _partition_month(path) and first <= _partition_month(path) <= last
+    )
+    if paths:
+        hourly_df = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    else:
+        hourly_df = pd.DataFrame(columns=HOURLY_STORED_COLUMNS)
+    return decode_hourly(hourly_df) if decode else hourly_df
+
+
+def decode_hourly(compact_df):
+    """Converts the scaled int16 columns to floats in their natural units."""
+    decoded = pd.DataFrame({"Date_Time": compact_df["Date_Time"]})
+    for _, stored, name, scale in HOURLY_FIELDS:
+        decoded[name] = compact_df[stored].astype("float64") / scale
+    return decoded
+
+
+def daily_rollups(compact_df):
+    """
+    Daily Max/Min/Mean temperature, total precipitation, rain hours and
+    observed hours from compact hourly rows, in one vectorized groupby on the
+    int16 columns. Mean_Temp_C is (max + min) / 2, as in the daily files, and
+    temperatures are left missing on days with fewer than
+    MIN_HOURS_FOR_DAILY_TEMP hourly readings.
+    """
+    if compact_df.empty:
+        return pd.DataFrame(columns=["Date_Time", "Max_Temp_C", "Min_Temp_C", "Mean_Temp_C",
+                                     "Total_Precip_mm", "Rain_Hours", "Obs_Hours"])
+
+    grouped = pd.DataFrame(
+        {
+            "day": compact_df["Date_Time"].dt.floor("D"),
+            "temp": compact_df["Temp_dC"],
+            "precip": compact_df["Precip_dmm"],
+            "rain": (compact_df["Precip_dmm"] > 0).fillna(False),
+        }
+    ).groupby("day", sort=True)
+    stats = grouped.agg(
+        max_temp=("temp", "max"),
+        min_temp=("temp", "min"),
+        obs_hours=("temp", "count"),
+        rain_hours=("rain", "sum"),
+    )
+    precip = grouped["precip"].sum(min_count=1)
+
+    def tenths(series, mask=None):
+        values = series.to_numpy(dtype="float64", na_value=np.nan) / 10
+        return values if mask is None else np.where(mask, values, np.nan)
+
+    enough = stats["obs_hours"].to_numpy() >= MIN_HOURS_FOR_DAILY_TEMP
+    max_temp = tenths(stats["max_temp"], enough)
+    min_temp = tenths(stats["min_temp"], enough)
+    return pd.DataFrame(
+        {
+            "Date_Time": stats.index,
+            "Max_Temp_C": max_temp,
+            "Min_Temp_C": min_temp,
+            "Mean_Temp_C": np.round((max_temp + min_temp) / 2, 1),
+            "Total_Precip_mm": tenths(precip),
+            "Rain_Hours": stats["rain_hours"].to_numpy(dtype="int16"),
+            "Obs_Hours": stats["obs_hours"].to_numpy(dtype="int16"),
+        }
+    )
+
+
+def station_daily_rollups(raw_data_dir, city_name, station_info):
+    """Daily rollups for every stored month of an hourly station."""
+    return daily_rollups(load_hourly(raw_data_dir, city_name, station_info, decode=False))
@@ -0,0 +1,64 @@
+# merged_data.py
+# Finds and loads the merged daily file written by merger.py.
+#
+# merger.py writes all_cities_weather_data.csv or .parquet depending on its
+# output_format, so readers shouldn't hard-code the .csv name. If both exist
+# (the format was switched between runs), the one written last is used.
+#
+# atomic_write() is how every merge output is written: to a temporary file
+# that is renamed over the old one, so readers never see a partial file.
+
+from contextlib import contextmanager
+import os
+
+import pandas as pd
+
+MERGED_FILE_STEM = 'all_cities_weather_data'
+MERGED_FORMATS = ('parquet', 'csv')
+
+
+@contextmanager
+def atomic_write(path, suffix='.tmp'):
+    """
+    Yields a temporary path next to `path` to write to, then renames it over
+    `path` once the block completes. A leftover temporary file from an
+    interrupted run is removed first, and the new one is removed on errors.
+    `suffix` is for writers that add their own extension (np.savez adds .npz).
+    """
+    tmp_path = f'{path}{suffix}'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def merged_data_path(processed_data_dir):
+    """
+    Path of the newest merged file in processed_data_dir. If there is none,
+    the .csv path is returned so error messages still name a file.
+    """
+    candidates = [
+        os.path.join(processed_data_dir, f'{MERGED_FILE_STEM}.{fmt}') for fmt in MERGED_FORMATS
+    ]
+    existing = [path for path in candidates if os.path.exists(path)]
+    if not existing:
+        return candidates[-1]
+    return max(existing, key=os.path.getmtime)
+
+
+def load_merged_data(processed_data_dir):
+    """
+    The merged daily frame, with Date_Time parsed. Raises FileNotFoundError
+    if merger.py hasn't written it.
+    """
+    path = merged_data_path(processed_data_dir)
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+        df['Date_Time'] = pd.to_datetime(df['Date_Time'])
+        return df
+    return pd.read_csv(path, parse_dates=['Date_Time'])
@@ -1,51 +1,210 @@
+import io
 import pandas as pd
 import os
 from config import CITIES # Import the CITIES dictionary from your config file
+from aggregates import build_aggregate_tables, write_aggregate_tables
+from catalog import write_catalogs
+from city_partitions import write_city_partitions
+from columnar_store import write_columnar_store
+from gaps import DEFAULT_FILLS, build_grid, fill_gaps, write_grid
+from hourly import HOURLY_FILE_SUFFIX, station_daily_rollups
+from merged_data import MERGED_FILE_STEM
+from quantile_sketches import build_sketches, load_sketches, write_sketches
+from query_store import write_query_store
+from raw_archive import RawArchive, legacy_year
+from records import load_records, update_records
+from splice import DEFAULT_SPLICE_PRIORITY, splice_stations, write_splice_report
+from validation import FLAG_COLUMNS, HOURLY_COLUMNS, issue_totals, validate, write_quality_report
 
-def merge_and_clean_data():
+OUTPUT_FORMATS = ('csv', 'parquet')
+
+# Daily rollups of hourly stations are renamed to the daily files' headers so
+# they go through the same cleaning step
+HOURLY_ROLLUP_COLUMNS = {
+    'Date_Time': 'Date/Time',
+    'Max_Temp_C': 'Max Temp (°C)',
+    'Min_Temp_C': 'Min Temp (°C)',
+    'Mean_Temp_C': 'Mean Temp (°C)',
+    'Total_Precip_mm': 'Total Precip (mm)',
+}
+
+
+def read_hourly_station(raw_data_dir, city_name, station_info):
+    """
+    Daily rows for a station configured with "data_type": "hourly", rolled up
+    from its monthly Parquet partitions (see hourly.py), with the daily files'
+    column names. Returns (dataframe, bytes read).
+    """
+    daily_df = station_daily_rollups(raw_data_dir, city_name, station_info)
+    daily_df = daily_df.rename(columns=HOURLY_ROLLUP_COLUMNS)
+    dates = pd.to_datetime(daily_df['Date/Time'])
+    daily_df['Year'] = dates.dt.year
+    daily_df['Month'] = dates.dt.month
+    daily_df['Day'] = dates.dt.day
+    station_dir_path = os.path.join(raw_data_dir, f"{city_name}_{station_info['station_name']}")
+    nbytes = sum(
+        entry.stat().st_size for entry in os.scandir(station_dir_path)
+        if entry.name.endswith(HOURLY_FILE_SUFFIX)
+    )
+    return daily_df, nbytes
+
+
+# Define a mapping from old, messy names to new, clean names
+# This will handle the columns present in the raw yearly CSVs
+COLUMN_RENAME_MAP = {
+    'Date/Time': 'Date_Time', # Name in raw files is often 'Date/Time'
+    'Year': 'Year',
+    'Month': 'Month',
+    'Day': 'Day',
+    'Max Temp (°C)': 'Max_Temp_C',
+    'Min Temp (°C)': 'Min_Temp_C',
+    'Mean Temp (°C)': 'Mean_Temp_C',
+    'Total Precip (mm)': 'Total_Precip_mm',
+    'City': 'City',
+    'Station': 'Station'
+}
+
+
+def read_archive_frames(archive, on_file=None):
+    """
+    Parses a station's archived yearly payloads. Members sharing a header row
+    are decompressed one after another into a single buffer and parsed with
+    one read_csv call, so a station costs a call per distinct header rather
+    than one per year; if that fails each member is parsed on its own and the
+    unreadable ones are skipped with a warning.
+    """
+    bodies = {}  # header line -> [(year, payload without the header)]
+    for year, payload, nbytes in archive.iter_members():
+        header, _, body = payload.partition(b"\n")
+        bodies.setdefault(header, []).append((year, body))
+        if on_file is not None:
+            on_file(f"{archive.path}#{year}", nbytes)
+
+    frames = []
+    for header, members in bodies.items():
+        buffer = b"\n".join([header] + [body.rstrip(b"\n") for _, body in members if body.strip()])
+        try:
+            frames.append(pd.read_csv(io.BytesIO(buffer)))
+            continue
+        except Exception:
+            pass
+        for year, body in members:
+            try:
+                frames.append(pd.read_csv(io.BytesIO(header + b"\n" + body)))
+            except Exception as e:
+                print(f"    > WARNING: Could not read {year} from {archive.path}. Error: {e}")
+    return frames
+
+
+def read_station_frames(raw_data_dir, city_name, station_info, on_file=None):
+    """
+    Reads one station's raw files (or the daily rollups of an hourly station)
+    into a list of dataframes tagged with City and Station. Returns an empty
+    list if the station has no raw directory.
+    """
+    # Construct the specific directory name for this station
+    station_name = station_info['station_name']
+    station_dir_path = os.path.join(raw_data_dir, f"{city_name}_{station_name}")
+    frames = []
+
+    if os.path.isdir(station_dir_path) and station_info.get('data_type', 'daily').lower() == 'hourly':
+        print(f"  > Found hourly directory: {station_dir_path}")
+        daily_df, nbytes = read_hourly_station(raw_data_dir, city_name, station_info)
+        daily_df['City'] = city_name
+        daily_df['Station'] = station_name
+        frames.append(daily_df)
+        if on_file is not None:
+            on_file(station_dir_path, nbytes)
+    elif os.path.isdir(station_dir_path):
+        print(f"  > Found directory: {station_dir_path}")
+        archive = RawArchive(station_dir_path)
+        frames.extend(read_archive_frames(archive, on_file))
+        # Loose yearly files of a station that hasn't been packed (see raw_archive.py);
+        # the archive's copy of a year wins
+        for filename in os.listdir(station_dir_path):
+            year = legacy_year(filename)
+            if year is not None and not archive.has(year):
+                file_path = os.path.join(station_dir_path, filename)
+                try:
+                    # Read the yearly data file
+                    frames.append(pd.read_csv(file_path))
+                    if on_file is not None:
+                        on_file(file_path, os.path.getsize(file_path))
+                except Exception as e:
+                    print(f"    > WARNING: Could not read file {filename}. Error: {e}")
+        for station_df in frames:
+            # --- CRITICAL FIX ---
+            # Assign the main 'city_name' (e.g., "Victoria") to all rows
+            station_df['City'] = city_name
+            # Keep the source station so the catalog can report per-station coverage
+            station_df['Station'] = station_name
+    else:
+        print(f"  > WARNING: Directory not found for station: {station_name}. Skipping.")
+    return frames
+
+
+def clean_merged_data(df):
+    """
+    Keeps the COLUMN_RENAME_MAP columns (and the data flags and hourly
+    stations' hour counts validation.py reads) under their clean names and
+    parses Date_Time, dropping rows whose date can't be parsed.
+    """
+    rename_map = {**COLUMN_RENAME_MAP, **FLAG_COLUMNS, **{c: c for c in HOURLY_COLUMNS}}
+    # Find which columns from the map actually exist in the dataframe
+    existing_columns = [col for col in rename_map if col in df.columns]
+
+    # Select only the columns we need and rename them
+    df = df[existing_columns].rename(columns=rename_map)
+
+    # Convert Date_Time to proper datetime objects and handle any errors
+    df['Date_Time'] = pd.to_datetime(df['Date_Time'], errors='coerce')
+    return df.dropna(subset=['Date_Time'])
+
+
+def merge_and_clean_data(raw_data_dir=None, processed_data_dir=None, cities=None,
+                         output_format='csv', on_file=None, splice_priority=DEFAULT_SPLICE_PRIORITY,
+                         mask_invalid=False, fills=DEFAULT_FILLS, rebuild_records=False):
     """
     Merges all raw CSV files from the nested directory structure into a single,
     cleaned data file. It correctly assigns the primary city name to all
-    associated station data and standardizes column names.
+    associated station data and standardizes column names. Days covered by
+    more than one of a city's stations are spliced to a single row using the
+    `splice_priority` rules (see splice.py). The spliced data is then checked
+    by validation.py; with `mask_invalid` values failing its range and
+    ordering checks are set to missing. Finally a complete daily grid with
+    missing days filled by the `fills` methods (see gaps.py) is written for
+    the reports, along with the per-day records index (see records.py) and
+    the percentile sketches (see quantile_sketches.py). The records index is
+    updated with the days since the last merge; `rebuild_records` rebuilds it
+    from the full history instead, to pick up corrections to past days.
+
+    The directories default to data/raw and data/processed. `on_file` is called
+    with (file_path, size_in_bytes) after each raw file is read, which lets the
+    packaged CLI report throughput.
     """
     print("--- Starting Data Merging and Cleaning Process ---")
 
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got '{output_format}'")
+
     # --- DEFINE FILE PATHS ---
     base_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in locals() else '.'
-    raw_data_dir = os.path.join(base_dir, '..', '..', 'data', 'raw')
-    processed_data_dir = os.path.join(base_dir, '..', '..', 'data', 'processed')
+    if raw_data_dir is None:
+        raw_data_dir = os.path.join(base_dir, '..', '..', 'data', 'raw')
+    if processed_data_dir is None:
+        processed_data_dir = os.path.join(base_dir, '..', '..', 'data', 'processed')
     os.makedirs(processed_data_dir, exist_ok=True)
+    cities = CITIES if cities is None else cities
     
     all_station_dataframes = []
 
     # Loop through the CITIES dictionary from the config file
-    for city_name, stations_list in CITIES.items():
+    for city_name, stations_list in cities.items():
         print(f"Processing city: {city_name}")
         for station_info in stations_list:
-            # --- THIS IS THE NEW LOGIC ---
-            # Construct the specific directory name for this station
-            station_name = station_info['station_name']
-            station_dir_path = os.path.join(raw_data_dir, f"{city_name}_{station_name}")
-
-            if os.path.isdir(station_dir_path):
-                print(f"  > Found directory: {station_dir_path}")
-                # Loop through every file inside that station's directory
-                for filename in os.listdir(station_dir_path):
-                    if filename.endswith('_daily_weather.csv'):
-                        file_path = os.path.join(station_dir_path, filename)
-                        try:
-                            # Read the yearly data file
-                            yearly_df = pd.read_csv(file_path)
-                            
-                            # --- CRITICAL FIX ---
-                            # Assign the main 'city_name' (e.g., "Victoria") to all rows
-                            yearly_df['City'] = city_name 
-                            
-                            all_station_dataframes.append(yearly_df)
-                        except Exception as e:
-                            print(f"    > WARNING: Could not read file {filename}. Error: {e}")
-            else:
-                print(f"  > WARNING: Directory not found for station: {station_name}. Skipping.")
+            all_station_dataframes.extend(
+                read_station_frames(raw_data_dir, city_name, station_info, on_file)
+            )
 
     if not all_station_dataframes:
         print("\nERROR: No data was merged. Check if raw data exists and paths are correct. Exiting.")
@@ -57,39 +216,106 @@ def merge_and_clean_data():
 
     # --- DATA CLEANING AND STANDARDIZATION ---
     print("Cleaning and standardizing column names...")
-    
-    # Define a mapping from old, messy names to new, clean names
-    # This will handle the columns present in the raw yearly CSVs
-    column_rename_map = {
-        'Date/Time': 'Date_Time', # Name in raw files is often 'Date/Time'
-        'Year': 'Year',
-        'Month': 'Month',
-        'Day': 'Day',
-        'Max Temp (°C)': 'Max_Temp_C',
-        'Min Temp (°C)': 'Min_Temp_C',
-        'Mean Temp (°C)': 'Mean_Temp_C',
-        'Total Precip (mm)': 'Total_Precip_mm',
-        'City': 'City'
-    }
+    final_df = clean_merged_data(final_df)
 
-    # Find which columns from the map actually exist in the dataframe
-    existing_columns = [col for col in column_rename_map if col in final_df.columns]
-    
-    # Select only the columns we need and rename them
-    final_df = final_df[existing_columns]
-    final_df = final_df.rename(columns=column_rename_map)
+    # --- SPLICE OVERLAPPING STATIONS ---
+    # One row per (City, Date_Time) so the aggregates below don't count
+    # overlap years twice
+    final_df, splice_report = splice_stations(final_df, cities, splice_priority)
+    splice_path = write_splice_report(splice_report, processed_data_dir)
+    print(f"Spliced stations: dropped {splice_report['dropped_rows'].sum()} overlapping rows "
+          f"on {splice_report['overlap_days'].sum()} city-days")
+    # Only gaps longer than a month are listed; the full table is in the report
+    for row in splice_report[splice_report['longest_gap_days'] > 31].itertuples():
+        print(f"  > {row.City}: {row.missing_days} days missing in {row.gaps} gaps, longest "
+              f"{row.longest_gap_start} to {row.longest_gap_end} ({row.longest_gap_days} days)")
+    print(f"  > Saved splice report to: {splice_path}")
+
+    # --- VALIDATE ---
+    # Range, ordering, flag and completeness checks per (City, Year); the
+    # flag and hour-count columns are only kept for this step
+    final_df, quality_report = validate(final_df, mask=mask_invalid)
+    validation_only = list(FLAG_COLUMNS.values()) + list(HOURLY_COLUMNS)
+    final_df = final_df.drop(columns=[c for c in validation_only if c in final_df.columns])
+    quality_path = write_quality_report(quality_report, processed_data_dir)
+    totals = issue_totals(quality_report)
+    print("Validated data: " + ", ".join(f"{count} {name}" for name, count in totals.items() if count))
+    print(f"  > Saved quality report to: {quality_path}")
+
+    # --- COMPLETE DAILY GRID ---
+    # Every city-day from first to last observation, with short gaps filled,
+    # so reports don't each resample; the tables below keep observed data only
+    grid, gap_spans = fill_gaps(build_grid(final_df), fills)
+    grid_paths = write_grid(grid, gap_spans, processed_data_dir)
+    fill_columns = [c for c in grid.columns if c.endswith('_fill')]
+    filled = int((grid[fill_columns] > 0).to_numpy().sum())
+    unfilled = int((grid[fill_columns] < 0).to_numpy().sum())
+    print(f"Built daily grid: {len(grid)} city-days, {len(gap_spans)} missing spans, "
+          f"{filled} values filled, {unfilled} left missing")
+    print(f"  > Saved daily grid to: {grid_paths['grid']}")
+
+    # --- PER-DAY RECORDS ---
+    # Top and bottom values per city and calendar day, for O(1) record lookups;
+    # only the days after the previous index's last date are folded in
+    records, broken, rebuilt = update_records(
+        final_df, previous=load_records(processed_data_dir), rebuild=rebuild_records
+    )
+    records_path = records.write(processed_data_dir)
+    print(f"{'Rebuilt' if rebuilt else 'Updated'} per-day records: "
+          f"{len(broken)} records broken since the last merge")
+    for row in broken.sort_values(['City', 'Month', 'Day']).head(10).itertuples():
+        print(f"  > {row.City} {row.Month:02d}-{row.Day:02d} {row.Metric} {row.Kind}: "
+              f"{row.Value} in {row.Year} (was {row.Previous_Value} in {row.Previous_Year})")
+    print(f"  > Saved records index to: {records_path}")
+
+    # --- PERCENTILE SKETCHES ---
+    # Mergeable digests per city, decade, day of year and metric for the
+    # reports' percentile bands; unchanged decades are carried over
+    sketches, rebuilt, blocks = build_sketches(final_df, previous=load_sketches(processed_data_dir))
+    sketches_path = write_sketches(sketches, processed_data_dir)
+    print(f"Updated quantile sketches: rebuilt {rebuilt} of {blocks} city/decade/metric blocks")
+    print(f"  > Saved quantile sketches to: {sketches_path}")
 
-    # Convert Date_Time to proper datetime objects and handle any errors
-    final_df['Date_Time'] = pd.to_datetime(final_df['Date_Time'], errors='coerce')
-    final_df.dropna(subset=['Date_Time'], inplace=True)
-    
     # --- SAVE THE FINAL PROCESSED FILE ---
-    output_path = os.path.join(processed_data_dir, 'all_cities_weather_data.csv')
-    final_df.to_csv(output_path, index=False)
+    output_path = os.path.join(processed_data_dir, f'{MERGED_FILE_STEM}.{output_format}')
+    if output_format == 'parquet':
+        final_df.to_parquet(output_path, index=False)
+    else:
+        final_df.to_csv(output_path, index=False)
+
+    # --- BUILD MATERIALIZED AGGREGATE TABLES ---
+    # Daily climatology plus monthly/seasonal stats per City/Year, so reports
+    # don't each have to regroup the full daily file.
+    print("Building aggregate tables...")
+    aggregate_paths = write_aggregate_tables(build_aggregate_tables(final_df), processed_data_dir)
+    for name, path in aggregate_paths.items():
+        print(f"  > Saved {name} table to: {path}")
+
+    # --- PER-CITY PARTITIONS ---
+    # The web app loads these one city at a time instead of the full file
+    partition_paths = write_city_partitions(final_df, processed_data_dir)
+    print(f"  > Saved {len(partition_paths)} city partitions")
+    # Indexed SQLite copy for weather-query and SQL push-down from the reports
+    query_store_path = write_query_store(final_df, processed_data_dir)
+    print(f"  > Saved query store to: {query_store_path}")
+
+    # --- CITY AND STATION CATALOGS ---
+    # Year coverage, row counts and null fractions for webapp.py's startup
+    catalog_paths = write_catalogs(final_df, cities, processed_data_dir)
+    for name, path in catalog_paths.items():
+        print(f"  > Saved {name} catalog to: {path}")
+
+    # --- PUBLISH THE COLUMNAR STORE ---
+    # Memory-mappable column files shared read-only by all web workers. Its
+    # CURRENT pointer is the web app's reload trigger, so it is published
+    # last, once every other file of this run is in place.
+    store_path = write_columnar_store(final_df, processed_data_dir)
+    print(f"  > Saved memory-mappable columnar store to: {store_path}")
     
     print("\n--- Merging and Cleaning Process Complete ---")
     print(f"Final processed file saved to: {output_path}")
     print(f"Total rows in final dataset: {len(final_df)}")
+    return output_path
 
 
 if __name__ == "__main__":
@@ -0,0 +1,311 @@
+# quantile_sketches.py
+# Mergeable quantile sketches per (City, Day_of_Year, metric) for percentile bands.
+#
+# The reports only had day-of-year means; exact 10th/50th/90th percentiles
+# would need every city's full history regrouped for each band. merger.py
+# instead keeps a t-digest per (City, block of SKETCH_BLOCK_YEARS years,
+# metric, bin of SKETCH_BIN_DAYS calendar days): for decade blocks and
+# five-day bins each digest summarizes about 50 values in at most about
+# SKETCH_COMPRESSION / 2 weighted centroids, finer towards the tails, whose
+# counts and weighted sums are exact. Digests merge by pooling their
+# centroids and compressing again. A day's band comes from the digests of
+# its bin and the SKETCH_WINDOW_BINS // 2 bins either side (wrapping around
+# the year) in the selected blocks, so serving every band reads a few
+# centroids per bin instead of the daily rows. Years only part of a block
+# would pull in the rest of it, so bands() rejects them. Days are calendar
+# days (see calendar_day), so a date keeps its bin in leap years.
+#
+# Every digest lives in flat arrays (a key per centroid, sorted by key then
+# mean), and building, merging and querying are a handful of vectorized
+# passes over all keys at once. On each merge only the blocks whose count or
+# sum changed, typically just the current decade, are rebuilt from the daily
+# rows; the others are carried over from the previous quantile_sketches.parquet.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import METRIC_COLUMNS
+from merged_data import atomic_write
+
+SKETCHES_FILE = "quantile_sketches.parquet"
+SKETCH_BLOCK_YEARS = 10
+# Calendar days per digest (365 = 73 bins of 5), and bins pooled per band,
+# centred on the day's own
+SKETCH_BIN_DAYS = 5
+SKETCH_WINDOW_BINS = 3
+# t-digest compression: at most about half this many centroids per digest
+SKETCH_COMPRESSION = 32
+BAND_QUANTILES = (0.1, 0.5, 0.9)
+BLOCK_COLUMNS = ["City", "Block", "Metric"]
+KEY_COLUMNS = BLOCK_COLUMNS + ["Day_Bin"]
+
+
+def calendar_day(dates):
+    """
+    Day of year (1-365) of a DatetimeIndex or a datetime Series' .dt accessor
+    with leap years shifted after Feb 28, so each calendar date keeps the same
+    day number; Feb 29 shares Feb 28's.
+    """
+    days = np.array(dates.dayofyear)
+    days[np.asarray(dates.is_leap_year) & (days > 59)] -= 1
+    return days
+
+
+def _compress(keys, means, weights, compression=SKETCH_COMPRESSION):
+    """
+    Merges centroids sharing a key into one t-digest per key. Within a key,
+    centroids whose midpoints fall in the same unit of the k1 scale function
+    (compression / 2π · asin(2q - 1)) are combined into their weighted mean.
+    Returns (keys, means, weights) sorted by key, then mean.
+    """
+    if not len(keys):
+        return keys, means, weights
+    mean_codes = pd.factorize(means, sort=True)[0]
+    order = np.argsort(keys * (mean_codes.max() + 1) + mean_codes)
+    keys, means, weights = keys[order], means[order], weights[order]
+
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = keys[1:] != keys[:-1]
+    key_index = np.cumsum(starts) - 1
+    totals = np.bincount(key_index, weights=weights)
+    cumulative = np.cumsum(weights)
+    before = cumulative - weights - (cumulative - weights)[starts][key_index]
+    q_mid = (before + weights / 2) / totals[key_index]
+    bucket = np.floor(compression / (2 * np.pi) * (np.arcsin(2 * q_mid - 1) + np.pi / 2))
+
+    new = np.ones(len(keys), dtype=bool)
+    new[1:] = starts[1:] | (bucket[1:] != bucket[:-1])
+    centroid = np.cumsum(new) - 1
+    merged_weights = np.bincount(centroid, weights=weights)
+    merged_means = np.bincount(centroid, weights=means * weights) / merged_weights
+    return keys[new], merged_means, merged_weights
+
+
+class QuantileSketches:
+    """The t-digest centroids of every (City, Block, Metric, Day_Bin) key."""
+
+    def __init__(self, centroids=None):
+        if centroids is None:
+            centroids = pd.DataFrame(
+                {"City": pd.Series(dtype="object"), "Block": pd.Series(dtype="int64"),
+                 "Metric": pd.Series(dtype="object"), "Day_Bin": pd.Series(dtype="int64"),
+                 "Mean": pd.Series(dtype="float64"), "Weight": pd.Series(dtype="float64")}
+            )
+        self.centroids = centroids.reset_index(drop=True)
+
+    @staticmethod
+    def _observations(df):
+        """One weight-1 centroid per observed value in a daily frame."""
+        dates = df["Date_Time"].dt
+        city_codes, cities = pd.factorize(df["City"])
+        blocks = dates.year.to_numpy() // SKETCH_BLOCK_YEARS * SKETCH_BLOCK_YEARS
+        bins = (calendar_day(dates) - 1) // SKETCH_BIN_DAYS
+        metrics = [m for m in METRIC_COLUMNS if m in df.columns]
+        parts = []
+        for code, metric in enumerate(metrics):
+            values = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype="float64")
+            observed = ~np.isnan(values)
+            parts.append((city_codes[observed], blocks[observed], np.full(observed.sum(), code),
+                          bins[observed], values[observed]))
+        if not parts:
+            return QuantileSketches().centroids
+        city, block, metric, day_bin, value = (np.concatenate(column) for column in zip(*parts))
+        return pd.DataFrame(
+            {
+                "City": pd.Categorical.from_codes(city, categories=cities),
+                "Block": block,
+                "Metric": pd.Categorical.from_codes(metric, categories=metrics),
+                "Day_Bin": day_bin,
+                "Mean": value,
+                "Weight": np.ones(len(value)),
+            }
+        )
+
+    @staticmethod
+    def _merge_centroids(centroids, key_columns=KEY_COLUMNS):
+        """Compresses centroids into one digest per distinct key_columns value."""
+        if centroids.empty:
+            return centroids
+        keys = centroids.groupby(key_columns, sort=True, observed=True).ngroup()
+        keys = keys.to_numpy(dtype="int64")
+        # Key values of each group code, from one row of the group
+        _, first_rows = np.unique(keys, return_index=True)
+        key_values = centroids[key_columns].iloc[first_rows]
+        keys, means, weights = _compress(
+            keys, centroids["Mean"].to_numpy(dtype="float64"),
+            centroids["Weight"].to_numpy(dtype="float64"),
+        )
+        merged = key_values.iloc[keys].reset_index(drop=True)
+        merged["Mean"] = means
+        merged["Weight"] = weights
+        return merged
+
+    def update(self, df):
+        """
+        Adds the observed values of a daily frame to the digests. The rows must
+        not have been added before: digests count, they don't deduplicate.
+        """
+        self.centroids = self._merge_centroids(
+            pd.concat([self.centroids, self._observations(df)], ignore_index=True)
+        )
+        return self
+
+    def block_totals(self):
+        """Count and sum of the values in each (City, Block, Metric)."""
+        weighted = self.centroids.assign(Sum=self.centroids["Mean"] * self.centroids["Weight"])
+        grouped = weighted.groupby(BLOCK_COLUMNS, sort=True, observed=True)
+        return grouped[["Weight", "Sum"]].sum().rename(columns={"Weight": "Count"})
+
+    def bands(self, city, metric, quantiles=BAND_QUANTILES, years=None):
+        """
+        Percentiles per Day_of_Year for one city and metric, from the digests
+        of `years` (every year if None). Returns a dataframe with Day_of_Year,
+        one P<nn> column per quantile and Count, the values in the day's
+        window of bins. Raises ValueError if `years` covers only part of a
+        block.
+        """
+        selected = self.centroids[
+            (self.centroids["City"] == city) & (self.centroids["Metric"] == metric)
+        ]
+        if years is not None:
+            years = set(years)
+            blocks = {year // SKETCH_BLOCK_YEARS * SKETCH_BLOCK_YEARS for year in years}
+            partial = sorted(
+                block for block in blocks
+                if not years.issuperset(range(block, block + SKETCH_BLOCK_YEARS))
+            )
+            if partial:
+                raise ValueError(
+                    f"years cover only part of the {SKETCH_BLOCK_YEARS}-year blocks starting "
+                    f"{partial}; the digests can't be split within a block"
+                )
+            selected = selected[selected["Block"].isin(blocks)]
+        return _day_bands(selected, quantiles)
+
+
+def _windows(centroids):
+    """
+    The centroids repeated into the window of every bin they fall in, keyed by
+    the window's centre bin in Day_Bin.
+    """
+    bins = 365 // SKETCH_BIN_DAYS
+    offsets = np.arange(SKETCH_WINDOW_BINS) - SKETCH_WINDOW_BINS // 2
+    windowed = centroids.iloc[np.repeat(np.arange(len(centroids)), len(offsets))]
+    centres = (windowed["Day_Bin"].to_numpy() + np.tile(offsets, len(centroids))) % bins
+    return windowed.assign(Day_Bin=centres).reset_index(drop=True)
+
+
+def _day_bands(centroids, quantiles):
+    """
+    Quantiles per calendar day from the centroids in its window of bins,
+    pooled as they are rather than compressed again.
+    """
+    windows = _windows(centroids).sort_values(["Day_Bin", "Mean"], kind="stable")
+    by_bin = _quantiles(windows.rename(columns={"Day_Bin": "Day_of_Year"}), quantiles)
+    if by_bin.empty:
+        return by_bin
+    days = np.arange(1, 366)
+    day_bins = (days - 1) // SKETCH_BIN_DAYS
+    present = np.isin(day_bins, by_bin["Day_of_Year"])
+    bands = by_bin.set_index("Day_of_Year").loc[day_bins[present]].reset_index(drop=True)
+    bands.insert(0, "Day_of_Year", days[present])
+    return bands
+
+
+def _quantiles(merged, quantiles):
+    """
+    Interpolates quantiles from digests sorted by (Day_of_Year, Mean). A
+    centroid of weight w after b values sits at rank b + (w - 1) / 2 out of
+    n - 1, which matches pandas' linear quantiles while every centroid is a
+    single value. Positions are offset by their day so one np.interp covers
+    every day.
+    """
+    columns = ["Day_of_Year"] + [f"P{round(q * 100):02d}" for q in quantiles] + ["Count"]
+    if merged.empty:
+        return pd.DataFrame(columns=columns)
+    days, day_index = np.unique(merged["Day_of_Year"].to_numpy(), return_inverse=True)
+    weights = merged["Weight"].to_numpy()
+    totals = np.bincount(day_index, weights=weights)
+    cumulative = np.cumsum(weights)
+    day_start = np.concatenate([[0], np.cumsum(totals)[:-1]])
+    before = cumulative - weights - day_start[day_index]
+    centers = (before + (weights - 1) / 2) / np.maximum(totals - 1, 1)[day_index]
+    positions = day_index + np.clip(centers, 0, 1 - 1e-9)
+
+    bands = pd.DataFrame({"Day_of_Year": days})
+    means = merged["Mean"].to_numpy()
+    # Clamp to each day's first and last centroid, which np.interp can't do per day
+    first = np.searchsorted(day_index, np.arange(len(days)))
+    last = np.searchsorted(day_index, np.arange(len(days)), side="right") - 1
+    for q, column in zip(quantiles, columns[1:]):
+        target = np.arange(len(days)) + q
+        value = np.interp(target, positions, means)
+        value = np.where(target <= positions[first], means[first], value)
+        bands[column] = np.where(target >= positions[last], means[last], value)
+    bands["Count"] = totals.astype("int64")
+    return bands
+
+
+def build_sketches(df, previous=None):
+    """
+    Digests for the merged frame. Blocks whose count and sum match those of
+    the `previous` sketches are carried over; the rest are built from `df`.
+    Returns (sketches, rebuilt blocks, total blocks).
+    """
+    observations = QuantileSketches._observations(df)
+    grouped = observations.groupby(BLOCK_COLUMNS, sort=True, observed=True)
+    current = grouped["Mean"].agg(["size", "sum"]).set_axis(["Count", "Sum"], axis=1)
+    if previous is None or previous.centroids.empty:
+        sketches = QuantileSketches(QuantileSketches._merge_centroids(observations))
+        return sketches, len(current), len(current)
+
+    stored = previous.block_totals()
+    compared = stored.reindex(current.index)
+    same = (compared["Count"] == current["Count"]) & np.isclose(
+        compared["Sum"], current["Sum"], rtol=1e-9, atol=1e-6
+    )
+    # Masks per block, broadcast to rows by each row's block number
+    rebuild_rows = ~same.to_numpy()[grouped.ngroup().to_numpy()]
+    kept_blocks = stored.index.isin(current.index[same.to_numpy()])
+    previous_groups = previous.centroids.groupby(BLOCK_COLUMNS, sort=True, observed=True).ngroup()
+    kept = previous.centroids[kept_blocks[previous_groups.to_numpy()]]
+
+    rebuilt = QuantileSketches._merge_centroids(observations[rebuild_rows])
+    centroids = pd.concat([kept, rebuilt], ignore_index=True)
+    for column in ("City", "Metric"):
+        centroids[column] = centroids[column].astype("category")
+    return QuantileSketches(centroids), int((~same).sum()), len(current)
+
+
+def exact_bands(df, metric, quantiles=BAND_QUANTILES):
+    """
+    The percentiles bands() estimates, computed exactly from a daily frame
+    over the same windows of bins, for when there are no sketches.
+    """
+    observations = QuantileSketches._observations(df[["City", "Date_Time", metric]])
+    return _day_bands(observations, quantiles)
+
+
+def write_sketches(sketches, processed_data_dir):
+    path = os.path.join(processed_data_dir, SKETCHES_FILE)
+    with atomic_write(path) as tmp_path:
+        sketches.centroids.to_parquet(tmp_path, index=False)
+    return path
+
+
+def load_sketches(processed_data_dir):
+    """
+    Loads the digests written by merger.py. Returns None if they have not
+    been generated yet, or were written with per-day keys before the digests
+    were binned, so callers fall back to exact quantiles and the next merge
+    rebuilds them.
+    """
+    path = os.path.join(processed_data_dir, SKETCHES_FILE)
+    if not os.path.exists(path):
+        return None
+    centroids = pd.read_parquet(path)
+    if "Day_Bin" not in centroids.columns:
+        return None
+    return QuantileSketches(centroids)
@@ -0,0 +1,142 @@
+# query_store.py
+# An embedded SQLite database of the merged data, written by merger.py.
+#
+# The reports and ad-hoc analyses used to load all_cities_weather_data.csv
+# into pandas and filter it there. weather.sqlite holds the same rows in a
+# `daily` table indexed on (City, Date) and (City, Year, Month), so a query
+# for one city, a date range or a month is answered by the engine
+# and only the result reaches pandas:
+#
+#   from query_store import query
+#   query("SELECT Year, AVG(Max_Temp_C) AS max_temp FROM daily"
+#         " WHERE City = ? AND Month = 7 GROUP BY Year", ("Calgary",))
+#
+# `weather-query "SELECT ..."` runs the same from the command line. The file
+# is rebuilt under a temporary name and renamed into place, so readers never
+# see a partly written database; they open it read-only.
+
+import os
+import sqlite3
+
+import pandas as pd
+
+from aggregates import METRIC_COLUMNS
+from merged_data import atomic_write
+
+STORE_FILE = "weather.sqlite"
+DAILY_TABLE = "daily"
+# Column -> SQLite type of the daily table, in table order
+DAILY_COLUMNS = {
+    # NOCASE so the indexes also serve case-insensitive city lookups
+    "City": "TEXT NOT NULL COLLATE NOCASE",
+    "Station": "TEXT",
+    "Date": "TEXT NOT NULL",  # ISO 8601, so string comparisons are date comparisons
+    "Year": "INTEGER NOT NULL",
+    "Month": "INTEGER NOT NULL",
+    "Day": "INTEGER NOT NULL",
+    "Day_of_Year": "INTEGER NOT NULL",
+    **{metric: "REAL" for metric in METRIC_COLUMNS},
+}
+# splice.py leaves one row per (City, Date), so that is the table's clustered
+# primary key; monthly lookups get a secondary index
+DAILY_PRIMARY_KEY = ("City", "Date")
+DAILY_INDEXES = {
+    "daily_city_year_month": ("City", "Year", "Month"),
+}
+
+
+def store_path(processed_data_dir):
+    return os.path.join(processed_data_dir, STORE_FILE)
+
+
+def write_query_store(df, processed_data_dir):
+    """Writes the merged frame to weather.sqlite with its indexes. Returns the path."""
+    path = store_path(processed_data_dir)
+    dates = df["Date_Time"].dt
+    daily = pd.DataFrame(
+        {
+            "City": df["City"].astype(str).to_numpy(),
+            "Station": df["Station"].to_numpy() if "Station" in df.columns else None,
+            "Date": dates.strftime("%Y-%m-%d").to_numpy(),
+            "Year": dates.year.to_numpy(),
+            "Month": dates.month.to_numpy(),
+            "Day": dates.day.to_numpy(),
+            "Day_of_Year": dates.dayofyear.to_numpy(),
+        }
+    )
+    for metric in METRIC_COLUMNS:
+        values = pd.to_numeric(df[metric], errors="coerce") if metric in df.columns else None
+        daily[metric] = values.to_numpy() if values is not None else None
+    # Inserting in index order keeps the B-tree pages filled and the file compact
+    daily = daily.sort_values(["City", "Date"], kind="stable")
+
+    with atomic_write(path) as tmp_path:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            # Nothing reads the temporary file, so skip the journal and fsyncs while loading
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            columns = ", ".join(f"{name} {sql_type}" for name, sql_type in DAILY_COLUMNS.items())
+            conn.execute(
+                f"CREATE TABLE {DAILY_TABLE} ({columns}, "
+                f"PRIMARY KEY ({', '.join(DAILY_PRIMARY_KEY)})) WITHOUT ROWID"
+            )
+            # SQLite stores a bound NaN as NULL, so plain column lists can be inserted
+            rows = zip(*(daily[column].tolist() for column in DAILY_COLUMNS))
+            placeholders = ", ".join("?" * len(DAILY_COLUMNS))
+            with conn:
+                conn.executemany(f"INSERT INTO {DAILY_TABLE} VALUES ({placeholders})", rows)
+            for name, columns in DAILY_INDEXES.items():
+                conn.execute(f"CREATE INDEX {name} ON {DAILY_TABLE} ({', '.join(columns)})")
+            # Sampled statistics are enough for the planner to pick between the two
+            conn.execute("PRAGMA analysis_limit=1000")
+            conn.execute("ANALYZE")
+        finally:
+            conn.close()
+    return path
+
+
+def connect(processed_data_dir):
+    """
+    A read-only connection to weather.sqlite. Raises FileNotFoundError if
+    merger.py hasn't written it.
+    """
+    path = store_path(processed_data_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(2, "No query store; re-run merger.py", path)
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def query(sql, params=(), processed_data_dir=None):
+    """
+    Runs a query against weather.sqlite and returns the result as a
+    dataframe, with a Date column parsed to datetimes.
+    """
+    if processed_data_dir is None:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        processed_data_dir = os.path.join(base_dir, '..', '..', 'data', 'processed')
+    conn = connect(processed_data_dir)
+    try:
+        result = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    if "Date" in result.columns:
+        result["Date"] = pd.to_datetime(result["Date"])
+    return result
+
+
+def load_city(processed_data_dir, city):
+    """
+    One city's daily rows (matched case-insensitively) in the merged file's
+    layout, with Date_Time. Returns None if the store hasn't been written,
+    so callers can fall back to reading the merged CSV.
+    """
+    if not os.path.exists(store_path(processed_data_dir)):
+        return None
+    columns = ", ".join(["City", "Station", "Date", "Year", "Month", "Day"] + METRIC_COLUMNS)
+    city_df = query(
+        f"SELECT {columns} FROM {DAILY_TABLE} WHERE City = ? ORDER BY Date",
+        (city,),
+        processed_data_dir,
+    )
+    return city_df.rename(columns={"Date": "Date_Time"})
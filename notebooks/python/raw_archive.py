@@ -0,0 +1,221 @@
+# raw_archive.py
+# Per-station compressed archive of the scraper's daily CSV payloads.
+#
+# Each daily station used to be a directory of <year>_daily_weather.csv files:
+# thousands of small uncompressed files for merger.py to list and open one by
+# one. The scraper now appends every payload to the station's archive:
+#
+#   data/raw/<City>_<Station>/daily_archive.gz    one gzip member per payload
+#   data/raw/<City>_<Station>/daily_archive.json  the index
+#
+# Members are content-addressed: the index maps each year to the SHA-256 of
+# its payload and each hash to the member's (offset, length, size) in the
+# archive. Re-downloading a year whose content hasn't changed only touches
+# the index, and a changed year adds a member and repoints the year; the old
+# member stays until compact() rewrites the archive. The index is replaced
+# atomically after the member is written, so a crash leaves at worst an
+# unreferenced member behind; compaction writes a new archive file and
+# switches the index to it the same way.
+#
+# Loose CSVs are still read, for stations that haven't been packed yet;
+# `python raw_archive.py` packs every station directory under data/raw.
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+
+from merged_data import atomic_write
+
+ARCHIVE_FILE = "daily_archive.gz"
+# compact() writes daily_archive.<generation>.gz
+INDEX_FILE = "daily_archive.json"
+LEGACY_SUFFIX = "_daily_weather.csv"
+COMPRESS_LEVEL = 6
+
+# Scraper threads may download several years of one station at once; appends
+# and index updates to an archive are serialized per index path.
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path):
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def legacy_year(filename):
+    """The year of a loose <year>_daily_weather.csv file, or None for other files."""
+    match = re.match(r"(\d{4})" + re.escape(LEGACY_SUFFIX) + "$", filename)
+    return int(match.group(1)) if match else None
+
+
+class RawArchive:
+    """The archive of one station directory. It doesn't need to exist yet."""
+
+    def __init__(self, station_dir):
+        self.station_dir = station_dir
+        self.index_path = os.path.join(station_dir, INDEX_FILE)
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        else:
+            index = {}
+        self.generation = index.get("generation", 0)
+        self.path = os.path.join(self.station_dir, _archive_file(self.generation))
+        # JSON keys are strings; years are kept as ints in memory
+        self.members = {digest: tuple(entry) for digest, entry in index.get("members", {}).items()}
+        self.years = {int(year): digest for year, digest in index.get("years", {}).items()}
+        self.invalid = {int(year): digest for year, digest in index.get("invalid", {}).items()}
+
+    def _write_index(self):
+        with atomic_write(self.index_path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "generation": self.generation,
+                        "members": self.members,
+                        "years": {str(year): d for year, d in sorted(self.years.items())},
+                        "invalid": {str(year): d for year, d in sorted(self.invalid.items())},
+                    },
+                    f,
+                )
+
+    def has(self, year):
+        return year in self.years
+
+    def member_size(self, year):
+        """Compressed bytes of a year's member."""
+        return self.members[self.years[year]][1]
+
+    def put(self, year, payload):
+        """
+        Stores `payload` (bytes) as `year`'s content. Returns False if that
+        was already the year's content, in which case nothing is written.
+        """
+        digest = hashlib.sha256(payload).hexdigest()
+        with _lock_for(self.index_path):
+            # Another writer may have updated the index since it was loaded
+            self._load()
+            if self.years.get(year) == digest:
+                return False
+            if digest not in self.members:
+                member = gzip.compress(payload, compresslevel=COMPRESS_LEVEL, mtime=0)
+                os.makedirs(self.station_dir, exist_ok=True)
+                with open(self.path, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(member)
+                self.members[digest] = (offset, len(member), len(payload))
+            self.years[year] = digest
+            self.invalid.pop(year, None)
+            self._write_index()
+        return True
+
+    def quarantine(self, year):
+        """Moves a year out of the readable members, e.g. after failing validation."""
+        with _lock_for(self.index_path):
+            self._load()
+            self.invalid[year] = self.years.pop(year)
+            self._write_index()
+
+    def iter_members(self, years=None):
+        """
+        Yields (year, payload bytes, compressed size) for `years` (every
+        readable year if None), decompressing one member at a time in archive
+        order so the file is read sequentially.
+        """
+        selected = self.years if years is None else {y: self.years[y] for y in years}
+        ordered = sorted(selected.items(), key=lambda item: self.members[item[1]][0])
+        if not ordered:
+            return
+        with open(self.path, "rb") as f:
+            for year, digest in ordered:
+                offset, length, _ = self.members[digest]
+                f.seek(offset)
+                yield year, gzip.decompress(f.read(length)), length
+
+    def read(self, year):
+        return next(self.iter_members([year]))[1]
+
+    def header(self, year):
+        """The parsed CSV header row of a year's payload."""
+        payload = self.read(year)
+        first_line = payload.split(b"\n", 1)[0].decode("utf-8-sig")
+        return next(csv.reader(io.StringIO(first_line)), [])
+
+    def compact(self):
+        """Rewrites the archive without the members no year refers to. Returns bytes freed."""
+        with _lock_for(self.index_path):
+            self._load()
+            live = set(self.years.values()) | set(self.invalid.values())
+            if live == set(self.members):
+                return 0
+            old_path = self.path
+            before = os.path.getsize(old_path)
+            self.generation += 1
+            self.path = os.path.join(self.station_dir, _archive_file(self.generation))
+            members = {}
+            with open(old_path, "rb") as src, open(self.path, "wb") as dst:
+                for digest in sorted(live, key=lambda d: self.members[d][0]):
+                    offset, length, size = self.members[digest]
+                    src.seek(offset)
+                    members[digest] = (dst.tell(), length, size)
+                    dst.write(src.read(length))
+            # Until the index is replaced it still points at the old file, so
+            # an interrupted compaction leaves the archive as it was
+            self.members = members
+            self._write_index()
+            os.remove(old_path)
+            return before - os.path.getsize(self.path)
+
+
+def _archive_file(generation):
+    return ARCHIVE_FILE if generation == 0 else ARCHIVE_FILE.replace(".gz", f".{generation}.gz")
+
+
+def pack_station(station_dir, remove=True):
+    """
+    Moves a station directory's loose yearly CSVs into its archive, removing
+    them afterwards with `remove`. Returns (files packed, bytes before, bytes after).
+    """
+    archive = RawArchive(station_dir)
+    packed, nbytes = 0, 0
+    for filename in sorted(os.listdir(station_dir)):
+        year = legacy_year(filename)
+        if year is None:
+            continue
+        file_path = os.path.join(station_dir, filename)
+        with open(file_path, "rb") as f:
+            payload = f.read()
+        archive.put(year, payload)
+        nbytes += len(payload)
+        packed += 1
+        if remove:
+            os.remove(file_path)
+    archive_bytes = os.path.getsize(archive.path) if packed else 0
+    return packed, nbytes, archive_bytes
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    raw_data_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, '..', '..', 'data', 'raw')
+    print(f"--- Packing loose daily CSVs under {raw_data_dir} ---")
+    total_files, total_before, total_after = 0, 0, 0
+    for entry in sorted(os.scandir(raw_data_dir), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        files, before, after = pack_station(entry.path)
+        if files:
+            print(f"  > {entry.name}: {files} files, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+        total_files += files
+        total_before += before
+        total_after += after
+    print(f"Packed {total_files} files: {total_before / 1e6:.1f} MB -> {total_after / 1e6:.1f} MB")
@@ -0,0 +1,312 @@
+# records.py
+# Per-calendar-day records (hottest, coldest, wettest...) built by merger.py.
+#
+# For every (City, month-day, metric) the index keeps the RECORD_DEPTH highest
+# and lowest observed values with the year each was set, in dense arrays
+# indexed by (city, month-day slot, metric, rank). Answering "was the 15th of
+# July a record for Calgary?" is then a couple of array lookups instead of a
+# scan over the city's history, and checking whether a new day sets a record
+# is one comparison against rank 0.
+#
+# update() folds new days into the index: the stored entries and the new rows
+# are ranked together with one sort on a composite integer key, so its cost
+# depends on the new rows and the index size, not on the length of the history. A day that is
+# already indexed (same city, date and metric) is replaced, so feeding the
+# same rows twice changes nothing. Ties go to the earlier year, which set the
+# record first. The index is saved as records_index.npz.
+#
+# merger.py loads the previous index and feeds it only the days after each
+# city's last indexed date (update_records), so a merge costs the new days,
+# not the history. Upstream does revise past days, and an incremental update
+# can't lower a record that a correction removed, so a full rebuild from the
+# merged frame (build_records) remains the fallback: it runs when there is no
+# previous index or its metrics differ, and on request (rebuild=True).
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import METRIC_COLUMNS
+from merged_data import atomic_write
+
+RECORDS_FILE = "records_index.npz"
+RECORD_DEPTH = 5
+RECORD_KINDS = ("high", "low")
+# Month-day slot: (month - 1) * 31 + (day - 1), so Feb 29 has a slot of its own
+MONTH_DAY_SLOTS = 12 * 31
+
+
+def month_day_slot(month, day):
+    return (np.asarray(month) - 1) * 31 + (np.asarray(day) - 1)
+
+
+class RecordsIndex:
+    """Top and bottom RECORD_DEPTH values per (city, month-day, metric)."""
+
+    def __init__(self, cities=(), metrics=METRIC_COLUMNS, depth=RECORD_DEPTH):
+        self.cities = list(cities)
+        self.metrics = list(metrics)
+        self.depth = depth
+        shape = (len(self.cities), MONTH_DAY_SLOTS, len(self.metrics), depth)
+        # kind -> (values, years); an empty entry is NaN with year 0
+        self.entries = {
+            kind: (np.full(shape, np.nan), np.zeros(shape, dtype="int16")) for kind in RECORD_KINDS
+        }
+        self.last_date = {}
+        self._city_index = {city: i for i, city in enumerate(self.cities)}
+
+    def _add_cities(self, cities):
+        new = [city for city in cities if city not in self._city_index]
+        if not new:
+            return
+        for kind, (values, years) in self.entries.items():
+            extra = (len(new),) + values.shape[1:]
+            self.entries[kind] = (
+                np.concatenate([values, np.full(extra, np.nan)]),
+                np.concatenate([years, np.zeros(extra, dtype="int16")]),
+            )
+        self.cities.extend(new)
+        self._city_index = {city: i for i, city in enumerate(self.cities)}
+
+    def _stored_entries(self):
+        """Every stored (city, slot, metric, year, value), highs and lows together."""
+        parts = []
+        for values, years in self.entries.values():
+            city, slot, metric, rank = np.nonzero(~np.isnan(values))
+            parts.append(
+                (city, slot, metric, years[city, slot, metric, rank], values[city, slot, metric, rank])
+            )
+        return [np.concatenate(columns) for columns in zip(*parts)]
+
+    def _new_entries(self, df):
+        """The same five arrays for the observed values in `df`."""
+        dates = df["Date_Time"].dt
+        codes, names = pd.factorize(df["City"].astype(str))
+        city = np.array([self._city_index[name] for name in names], dtype="int64")[codes]
+        slot = month_day_slot(dates.month.to_numpy(), dates.day.to_numpy())
+        year = dates.year.to_numpy()
+        parts = []
+        for m, metric in enumerate(self.metrics):
+            if metric not in df.columns:
+                continue
+            values = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype="float64")
+            observed = ~np.isnan(values)
+            parts.append(
+                (city[observed], slot[observed], np.full(observed.sum(), m), year[observed],
+                 values[observed])
+            )
+        if not parts:
+            return [np.array([], dtype="int64")] * 4 + [np.array([], dtype="float64")]
+        return [np.concatenate(columns) for columns in zip(*parts)]
+
+    def update(self, df):
+        """
+        Adds the observed values of a daily frame (City, Date_Time and metric
+        columns). Returns the records the new rows broke: one row per
+        (City, Month, Day, Metric, Kind) whose record was beaten, with the
+        record it replaced. Slots without a previous record aren't reported.
+        """
+        if df.empty:
+            return _broken_records(self, {})
+        self._add_cities(pd.unique(df["City"].astype(str)))
+        before = {kind: (values[..., 0].copy(), years[..., 0].copy())
+                  for kind, (values, years) in self.entries.items()}
+
+        stored = self._stored_entries()
+        new = self._new_entries(df)
+        is_new = np.repeat([False, True], [len(stored[0]), len(new[0])])
+        city, slot, metric, year, value = (np.concatenate(pair) for pair in zip(stored, new))
+        group = (city * MONTH_DAY_SLOTS + slot) * len(self.metrics) + metric
+        if not len(group):
+            return _broken_records(self, before)
+
+        # One entry per (group, year), preferring the new row over the stored one
+        year_offset = year - year.min()
+        years_spanned = int(year_offset.max()) + 1
+        order = np.argsort((group * years_spanned + year_offset) * 2 + ~is_new)
+        key = (group * years_spanned + year_offset)[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = key[1:] != key[:-1]
+        order = order[keep]
+        city, slot, metric, year, value, group, year_offset = (
+            a[order] for a in (city, slot, metric, year, value, group, year_offset)
+        )
+
+        # Each (group, value rank, year) key is unique, so one unstable sort of
+        # a composite int64 key orders every group's entries best first
+        value_codes, distinct_values = pd.factorize(value, sort=True)
+        shape = self.entries["high"][0].shape
+        for kind in RECORD_KINDS:
+            value_rank = len(distinct_values) - 1 - value_codes if kind == "high" else value_codes
+            ranked = np.argsort(
+                (group * len(distinct_values) + value_rank) * years_spanned + year_offset
+            )
+            sorted_group = group[ranked]
+            starts = np.ones(len(ranked), dtype=bool)
+            starts[1:] = sorted_group[1:] != sorted_group[:-1]
+            positions = np.arange(len(ranked))
+            rank = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+            top = ranked[rank < self.depth]
+            values, years = np.full(shape, np.nan), np.zeros(shape, dtype="int16")
+            at = (city[top], slot[top], metric[top], rank[rank < self.depth])
+            values[at] = value[top]
+            years[at] = year[top]
+            self.entries[kind] = (values, years)
+
+        last = df.groupby(df["City"].astype(str))["Date_Time"].max()
+        for city_name, date in last.items():
+            self.last_date[city_name] = max(date, self.last_date.get(city_name, date))
+        return _broken_records(self, before)
+
+    def lookup(self, city, month, day, metric=None):
+        """
+        {metric: {"high": [(value, year), ...], "low": [...]}} for one calendar
+        day, best first. Raises KeyError for an unknown city or metric.
+        """
+        c = self._city_index[city]
+        slot = int(month_day_slot(month, day))
+        metrics = self.metrics if metric is None else [metric]
+        result = {}
+        for name in metrics:
+            if name not in self.metrics:
+                raise KeyError(name)
+            m = self.metrics.index(name)
+            result[name] = {}
+            for kind, (values, years) in self.entries.items():
+                found = ~np.isnan(values[c, slot, m])
+                result[name][kind] = [
+                    (float(v), int(y))
+                    for v, y in zip(values[c, slot, m][found], years[c, slot, m][found])
+                ]
+        return result
+
+    def is_record(self, city, month, day, metric, value):
+        """'high' or 'low' if `value` beats the current record for that day, else None."""
+        c = self._city_index.get(city)
+        if c is None or np.isnan(value):
+            return None
+        at = (c, int(month_day_slot(month, day)), self.metrics.index(metric), 0)
+        if value > self.entries["high"][0][at]:
+            return "high"
+        if value < self.entries["low"][0][at]:
+            return "low"
+        return None
+
+    def write(self, processed_data_dir):
+        """Saves the index to records_index.npz, replaced atomically."""
+        path = os.path.join(processed_data_dir, RECORDS_FILE)
+        arrays = {f"{kind}_{part}": array for kind, pair in self.entries.items()
+                  for part, array in zip(("values", "years"), pair)}
+        with atomic_write(path, suffix=".tmp.npz") as tmp_path:
+            np.savez(
+                tmp_path,
+                cities=np.array(self.cities, dtype=str),
+                metrics=np.array(self.metrics, dtype=str),
+                last_date=np.array([self.last_date.get(c, pd.NaT) for c in self.cities],
+                                   dtype="datetime64[D]"),
+                **arrays,
+            )
+        return path
+
+    @classmethod
+    def from_file(cls, path):
+        with np.load(path) as saved:
+            index = cls(saved["cities"].tolist(), saved["metrics"].tolist(),
+                        saved["high_values"].shape[-1])
+            for kind in RECORD_KINDS:
+                index.entries[kind] = (saved[f"{kind}_values"], saved[f"{kind}_years"])
+            index.last_date = {
+                city: pd.Timestamp(date)
+                for city, date in zip(index.cities, saved["last_date"]) if not np.isnat(date)
+            }
+        return index
+
+
+def _broken_records(index, before):
+    """Rank-0 entries that beat the ones in the `before` snapshot taken by update()."""
+    rows = []
+    for kind, (old_values, old_years) in before.items():
+        values, years = index.entries[kind][0][..., 0], index.entries[kind][1][..., 0]
+        n = len(old_values)
+        with np.errstate(invalid="ignore"):
+            if kind == "high":
+                changed = values[:n] > old_values
+            else:
+                changed = values[:n] < old_values
+        city, slot, metric = np.nonzero(changed)
+        rows.append(
+            pd.DataFrame(
+                {
+                    "City": np.array(index.cities, dtype=object)[city],
+                    "Month": slot // 31 + 1,
+                    "Day": slot % 31 + 1,
+                    "Metric": np.array(index.metrics, dtype=object)[metric],
+                    "Kind": kind,
+                    "Value": values[city, slot, metric],
+                    "Year": years[city, slot, metric],
+                    "Previous_Value": old_values[city, slot, metric],
+                    "Previous_Year": old_years[city, slot, metric],
+                }
+            )
+        )
+    if not rows:
+        return pd.DataFrame(columns=["City", "Month", "Day", "Metric", "Kind", "Value", "Year",
+                                     "Previous_Value", "Previous_Year"])
+    return pd.concat(rows, ignore_index=True)
+
+
+def build_records(df, previous=None, depth=RECORD_DEPTH):
+    """
+    Builds the index from the full merged frame. Returns (index, broken):
+    the records in `df` that differ from the `previous` index's, e.g. those
+    set by the days scraped since the last merge.
+    """
+    index = RecordsIndex(depth=depth)
+    index.update(df)
+    if previous is None:
+        return index, _broken_records(index, {})
+    before = {}
+    for kind in RECORD_KINDS:
+        shape = index.entries[kind][0].shape[:3]
+        old_values, old_years = np.full(shape, np.nan), np.zeros(shape, dtype="int16")
+        for c, city in enumerate(index.cities):
+            p = previous._city_index.get(city)
+            if p is None:
+                continue
+            for m, metric in enumerate(index.metrics):
+                if metric in previous.metrics:
+                    pm = previous.metrics.index(metric)
+                    old_values[c, :, m] = previous.entries[kind][0][p, :, pm, 0]
+                    old_years[c, :, m] = previous.entries[kind][1][p, :, pm, 0]
+        before[kind] = (old_values, old_years)
+    return index, _broken_records(index, before)
+
+
+def new_days(df, index):
+    """The rows of `df` after each city's last date in `index`; every row for a new city."""
+    last = df["City"].astype(str).map(index.last_date)
+    return df[last.isna() | (df["Date_Time"] > last)]
+
+
+def update_records(df, previous=None, rebuild=False, depth=RECORD_DEPTH):
+    """
+    Brings the `previous` index up to date with the merged frame. Returns
+    (index, broken, rebuilt): broken as for build_records, and whether the
+    index was rebuilt from the full frame instead of updated with the new days.
+    """
+    if previous is None or rebuild or previous.metrics != list(METRIC_COLUMNS):
+        index, broken = build_records(df, previous, depth)
+        return index, broken, True
+    return previous, previous.update(new_days(df, previous)), False
+
+
+def load_records(processed_data_dir):
+    """
+    Loads the records index written by merger.py. Returns None if it has not
+    been generated yet.
+    """
+    path = os.path.join(processed_data_dir, RECORDS_FILE)
+    if not os.path.exists(path):
+        return None
+    return RecordsIndex.from_file(path)
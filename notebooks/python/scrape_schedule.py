@@ -0,0 +1,145 @@
+# scrape_schedule.py
+# Orders the scraper's work list so the data that matters most is fetched first.
+#
+# build_work_list walks CITIES in dict order and years ascending, so a full
+# run reached the current year of the last city hours in. schedule() puts
+# every (station, period) unit in one of three priority classes:
+#
+#   freshness     periods ending within FRESHNESS_WINDOW_DAYS of today: the
+#                 current year, the current and previous month, which upstream
+#                 still revises. Always re-downloaded, even without overwrite.
+#   backfill      periods with nothing in data/raw yet
+#   revalidation  periods already stored; re-downloaded with overwrite, else skipped
+#
+# Classes run in the order given by `priority`, except that classes with a
+# deadline (seconds from the start of the run, e.g. {"freshness": 300}) go
+# first, earliest deadline first. Within a class the units are interleaved
+# across stations, newest period first: every station's most recent missing
+# year before any station's second, so no station waits behind another's
+# century of history and consecutive requests are spread across stations.
+#
+# The scraper tags each result with its class and the seconds from the start
+# of the run to its completion; deadline_report() checks them against the
+# deadlines.
+
+import os
+from datetime import datetime, timedelta
+
+from hourly import hourly_partition_path
+from raw_archive import LEGACY_SUFFIX, RawArchive
+
+PRIORITY_CLASSES = ("freshness", "backfill", "revalidation")
+DEFAULT_PRIORITY = PRIORITY_CLASSES
+DEFAULT_DEADLINES = {"freshness": 5 * 60}
+FRESHNESS_WINDOW_DAYS = 31
+
+
+def _period_end(unit):
+    """The last day covered by a (city, station, year) or (city, station, year, month) unit."""
+    year = unit[2]
+    if len(unit) == 3:
+        return datetime(year, 12, 31)
+    month = unit[3]
+    first_of_next = datetime(year + month // 12, month % 12 + 1, 1)
+    return first_of_next - timedelta(days=1)
+
+
+class _StoredPeriods:
+    """Whether a unit's period is already in raw storage, reading each station's index once."""
+
+    def __init__(self, raw_data_dir):
+        self.raw_data_dir = raw_data_dir
+        self._archives = {}
+
+    def __contains__(self, unit):
+        city_name, station_info, year = unit[:3]
+        if len(unit) == 4:
+            return os.path.exists(
+                hourly_partition_path(self.raw_data_dir, city_name, station_info, year, unit[3])
+            )
+        station_name = station_info["station_name"]
+        station_dir = os.path.join(self.raw_data_dir, f"{city_name}_{station_name}")
+        if station_dir not in self._archives:
+            self._archives[station_dir] = RawArchive(station_dir)
+        return self._archives[station_dir].has(year) or os.path.exists(
+            os.path.join(station_dir, f"{year}{LEGACY_SUFFIX}")
+        )
+
+
+def classify(unit, stored, now):
+    """The priority class of one work unit; `stored` is a _StoredPeriods."""
+    if _period_end(unit) >= now - timedelta(days=FRESHNESS_WINDOW_DAYS):
+        return "freshness"
+    return "revalidation" if unit in stored else "backfill"
+
+
+def class_order(priority=DEFAULT_PRIORITY, deadlines=None):
+    """Classes in run order: those with a deadline first (earliest first), then `priority`."""
+    unknown = [name for name in list(priority) + list(deadlines or {})
+               if name not in PRIORITY_CLASSES]
+    if unknown:
+        raise ValueError(f"Unknown priority classes {unknown}; expected {PRIORITY_CLASSES}")
+    # Classes left out of `priority` still run, after the listed ones
+    ordered = list(dict.fromkeys(list(priority) + list(PRIORITY_CLASSES)))
+    deadlines = deadlines or {}
+    return sorted(ordered, key=lambda name: (name not in deadlines, deadlines.get(name, 0)))
+
+
+def schedule(work, raw_data_dir, priority=DEFAULT_PRIORITY, deadlines=None, now=None):
+    """
+    Orders work units (the tuples of build_work_list and build_hourly_work_list,
+    mixed freely) for dispatch. Returns a list of (priority class, unit).
+    """
+    now = now or datetime.now()
+    stored = _StoredPeriods(raw_data_dir)
+    rank_of_class = {name: rank for rank, name in enumerate(class_order(priority, deadlines))}
+
+    by_station = {}  # (class, city, station) -> [unit]
+    for unit in work:
+        key = (classify(unit, stored, now), unit[0], unit[1]["station_name"])
+        by_station.setdefault(key, []).append(unit)
+
+    keyed = []
+    # Stations keep their config order as the tie-break between equal rounds
+    station_order = {}
+    for (priority_class, city_name, station_name), units in by_station.items():
+        station = station_order.setdefault((city_name, station_name), len(station_order))
+        units.sort(key=_period_end, reverse=True)
+        for round_number, unit in enumerate(units):
+            sort_key = (rank_of_class[priority_class], round_number, station)
+            keyed.append((sort_key, priority_class, unit))
+    keyed.sort(key=lambda item: item[0])
+    return [(priority_class, unit) for _, priority_class, unit in keyed]
+
+
+def deadline_report(results, deadlines=None):
+    """
+    Per priority class: {"units", "finished_s", "deadline_s", "met"} from
+    scraper results tagged with "priority" and "finished_s". A class without
+    a deadline has deadline_s and met set to None.
+    """
+    deadlines = deadlines or {}
+    report = {}
+    for result in results:
+        entry = report.setdefault(
+            result["priority"], {"units": 0, "finished_s": 0.0,
+                                 "deadline_s": deadlines.get(result["priority"]), "met": None}
+        )
+        entry["units"] += 1
+        entry["finished_s"] = max(entry["finished_s"], result["finished_s"])
+    for entry in report.values():
+        if entry["deadline_s"] is not None:
+            entry["met"] = entry["finished_s"] <= entry["deadline_s"]
+    return {name: report[name] for name in PRIORITY_CLASSES if name in report}
+
+
+def report_table(report):
+    """A plain-text table of deadline_report(), one line per class."""
+    lines = []
+    for name, entry in report.items():
+        line = f"{name:<13} {entry['units']:>6} units, done after {entry['finished_s']:.1f}s"
+        if entry["deadline_s"] is not None:
+            verdict = "met" if entry["met"] else "MISSED"
+            line += f" (deadline {entry['deadline_s']:.0f}s, {verdict})"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,158 @@
+# scrape_telemetry.py
+# Run metrics for scraper.py: what was asked of the upstream server and how it
+# behaved, so concurrency and rate limits can be tuned against real numbers.
+#
+# Every HTTP attempt and every finished station-year is appended as one JSON
+# object per line to the run's .jsonl file; the run ends with a "summary" line
+# and summary_table() renders the same numbers for the console.
+
+import json
+import threading
+import time
+from datetime import datetime
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS_S = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class ScrapeTelemetry:
+    """
+    Thread-safe counters for one scrape run, optionally streamed to a JSON
+    lines file. Worker threads call record_request() per HTTP attempt and
+    record_result() per station-year; close() writes the summary.
+    """
+
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self._file = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.finished = None
+        self.requests = 0
+        self.retries = 0
+        self.bytes = 0
+        self.rows_written = 0
+        self.http_status = {}  # HTTP status code (or "connection_error") -> count
+        self.results = {}  # scraper result status -> count
+        self.header_failures = 0
+        self.latencies = []
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_S) + 1)  # last is +Inf
+
+    def _write(self, event):
+        if self._file is not None:
+            self._file.write(json.dumps(event) + "\n")
+
+    def record_request(self, city, station, year, attempt, http_status, latency_s, nbytes,
+                       month=None):
+        """One HTTP attempt. http_status is None when no response was received."""
+        status_key = str(http_status) if http_status is not None else "connection_error"
+        bucket = next(
+            (i for i, bound in enumerate(LATENCY_BUCKETS_S) if latency_s <= bound),
+            len(LATENCY_BUCKETS_S),
+        )
+        with self._lock:
+            self.requests += 1
+            if attempt > 1:
+                self.retries += 1
+            self.bytes += nbytes
+            self.http_status[status_key] = self.http_status.get(status_key, 0) + 1
+            self.latencies.append(latency_s)
+            self.latency_buckets[bucket] += 1
+            event = {"event": "request", "city": city, "station": station, "year": year}
+            if month is not None:
+                event["month"] = month
+            self._write(
+                {
+                    **event,
+                    "attempt": attempt,
+                    "http_status": http_status,
+                    "latency_s": round(latency_s, 4),
+                    "bytes": nbytes,
+                }
+            )
+
+    def record_result(self, result):
+        """One finished station-year, as returned by download_station_year."""
+        with self._lock:
+            status = result["status"]
+            self.results[status] = self.results.get(status, 0) + 1
+            if status == "no_header":
+                self.header_failures += 1
+            self.rows_written += result.get("rows", 0)
+            self._write({"event": "result", **result})
+
+    def summary(self):
+        with self._lock:
+            finished = self.finished or time.perf_counter()
+            elapsed = max(finished - self.started, 1e-9)
+            latencies = sorted(round(latency, 4) for latency in self.latencies)
+            bounds = [str(b) for b in LATENCY_BUCKETS_S] + ["+Inf"]
+            return {
+                "event": "summary",
+                "started_at": self.started_at,
+                "elapsed_s": round(elapsed, 3),
+                "requests": self.requests,
+                "retries": self.retries,
+                "bytes": self.bytes,
+                "rows_written": self.rows_written,
+                "requests_per_s": round(self.requests / elapsed, 3),
+                "mb_per_s": round(self.bytes / 1e6 / elapsed, 3),
+                "http_status": dict(sorted(self.http_status.items())),
+                "results": dict(sorted(self.results.items())),
+                "header_failures": self.header_failures,
+                "latency_s": {
+                    "p50": _percentile(latencies, 0.50),
+                    "p95": _percentile(latencies, 0.95),
+                    "max": latencies[-1] if latencies else None,
+                    "buckets": dict(zip(bounds, self.latency_buckets)),
+                },
+            }
+
+    def close(self):
+        """Stops the clock, appends the summary line and returns the summary."""
+        self.finished = self.finished or time.perf_counter()
+        summary = self.summary()
+        with self._lock:
+            self._write(summary)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        return summary
+
+
+def summary_table(summary):
+    """Renders a run summary as a plain-text table."""
+    latency = summary["latency_s"]
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.3f}s"
+
+    percentiles = " / ".join(seconds(latency[key]) for key in ("p50", "p95", "max"))
+    rows = [
+        ("Elapsed", f"{summary['elapsed_s']:.1f}s"),
+        ("Requests", summary["requests"]),
+        ("Retries", summary["retries"]),
+        ("Requests/s", f"{summary['requests_per_s']:.2f}"),
+        ("Downloaded", f"{summary['bytes'] / 1e6:.2f} MB ({summary['mb_per_s']:.2f} MB/s)"),
+        ("Rows written", summary["rows_written"]),
+        ("Header failures", summary["header_failures"]),
+        ("Latency p50/p95/max", percentiles),
+    ]
+    rows += [(f"HTTP {code}", count) for code, count in summary["http_status"].items()]
+    rows += [(f"Result '{status}'", count) for status, count in summary["results"].items()]
+    for bound, count in latency["buckets"].items():
+        if not count:
+            continue
+        label = f"Latency > {LATENCY_BUCKETS_S[-1]}s" if bound == "+Inf" else f"Latency <= {bound}s"
+        rows.append((label, count))
+
+    width = max(len(label) for label, _ in rows)
+    return "\n".join(f"  {label.ljust(width)}  {value}" for label, value in rows)
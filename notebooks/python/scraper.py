@@ -3,12 +3,19 @@
 # This version has been updated to be more robust by dynamically finding the header row.
 
 import requests
-import pandas as pd
 import time
-import io
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from hourly import hourly_partition_path, parse_hourly_csv, write_hourly_partition
+from raw_archive import RawArchive
+from scrape_schedule import (
+    DEFAULT_DEADLINES, DEFAULT_PRIORITY, deadline_report, report_table, schedule,
+)
+from scrape_telemetry import ScrapeTelemetry, summary_table
+
 # --- Configuration ---
 # Import the CITIES dictionary from our configuration file
 try:
@@ -19,13 +26,12 @@ except ImportError:
     print("Please ensure 'config.py' exists in the same directory as this script.")
     exit()
 
-# --- ADD THIS LINE FOR DEBUGGING ---
-print(f"--- Config loaded. Found {len(CITIES)} cities: {list(CITIES.keys())} ---")
-
-print("--- Weather Data Scraper ---")
-
 # --- Constants ---
 DELAY_BETWEEN_REQUESTS = 1  # seconds
+REQUEST_TIMEOUT = 60  # seconds
+MAX_RETRIES = 3  # extra attempts after a connection error or a retryable status
+RETRY_BACKOFF = 2  # seconds, doubled after each retry
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 BASE_URL = "https://climate.weather.gc.ca/climate_data/bulk_data_e.html"
 TIMEFRAME_MAP = {
     "hourly": 1,
@@ -35,83 +41,375 @@ TIMEFRAME_MAP = {
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
+# The correct header contains these key column names. This is more reliable
+# than checking for just one column like "Year".
+HEADER_MARKERS = ('"Date/Time"', '"Max Temp (°C)"', '"Min Temp (°C)"')
+HOURLY_HEADER_MARKERS = ('"Date/Time (LST)"', '"Temp (°C)"')
 
 # --- Path Setup ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
 RAW_DATA_DIR = os.path.join(PROJECT_ROOT, "data", "raw")
-os.makedirs(RAW_DATA_DIR, exist_ok=True)
+SCRAPE_RUNS_DIR = os.path.join(PROJECT_ROOT, "reports", "scrape_runs")
 
-# --- Main Scraping Logic ---
-current_year = datetime.now().year
-
-for city_name, stations in CITIES.items():
-    for station_info in stations:
-        station_id = station_info["station_id"]
-        station_name = station_info["station_name"]
-        start_year = station_info["start_year"]
-        data_type = station_info.get("data_type", "daily")  # Default to daily
-        timeframe = TIMEFRAME_MAP.get(data_type.lower())
-
-        if not timeframe:
-            print(f"  WARNING: Invalid data_type '{data_type}' for {station_name}. Skipping.")
+# Each worker thread keeps its own HTTP session so connections are reused
+_thread_local = threading.local()
+
+
+def _get_session():
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+        _thread_local.session.headers.update(HEADERS)
+    return _thread_local.session
+
+
+def find_header_row(lines, markers=HEADER_MARKERS):
+    """Returns the index of the CSV header row, or -1 if it can't be found."""
+    for i, line in enumerate(lines):
+        if all(marker in line for marker in markers):
+            return i
+    return -1
+
+
+def _is_hourly(station_info):
+    return station_info.get("data_type", "daily").lower() == "hourly"
+
+
+def build_work_list(cities=None, start_year=None, end_year=None):
+    """
+    Expands the CITIES config into one (city_name, station_info, year) unit per
+    yearly file, optionally clipped to a year range. Hourly stations are
+    planned by build_hourly_work_list instead.
+    """
+    cities = CITIES if cities is None else cities
+    current_year = datetime.now().year
+    work = []
+    for city_name, stations in cities.items():
+        for station_info in stations:
+            if _is_hourly(station_info):
+                continue
+            first = station_info["start_year"]
+            # Ensure we don't try to fetch data for future years
+            last = min(station_info["end_year"], current_year)
+            if start_year is not None:
+                first = max(first, start_year)
+            if end_year is not None:
+                last = min(last, end_year)
+            for year in range(first, last + 1):
+                work.append((city_name, station_info, year))
+    return work
+
+
+def build_hourly_work_list(cities=None, start_year=None, end_year=None):
+    """
+    One (city_name, station_info, year, month) unit per month of every hourly
+    station, since the hourly endpoint serves a single month per request.
+    Months after the current one are left out.
+    """
+    cities = CITIES if cities is None else cities
+    now = datetime.now()
+    work = []
+    for city_name, stations in cities.items():
+        for station_info in stations:
+            if not _is_hourly(station_info):
+                continue
+            first = station_info["start_year"]
+            last = min(station_info["end_year"], now.year)
+            if start_year is not None:
+                first = max(first, start_year)
+            if end_year is not None:
+                last = min(last, end_year)
+            for year in range(first, last + 1):
+                last_month = now.month if year == now.year else 12
+                for month in range(1, last_month + 1):
+                    work.append((city_name, station_info, year, month))
+    return work
+
+
+def _get_with_retries(params, retries, telemetry, label):
+    """
+    GETs the bulk-data URL, retrying connection errors and RETRYABLE_STATUS
+    responses with exponential backoff (or the server's Retry-After). Every
+    attempt is reported to `telemetry`, tagged with the `label` dict (city,
+    station, year and optionally month). Returns the last response.
+    """
+    for attempt in range(1, retries + 2):
+        backoff = RETRY_BACKOFF * 2 ** (attempt - 1)
+        started = time.perf_counter()
+        try:
+            response = _get_session().get(BASE_URL, params=params, timeout=REQUEST_TIMEOUT)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if telemetry is not None:
+                telemetry.record_request(
+                    **label, attempt=attempt, http_status=None,
+                    latency_s=time.perf_counter() - started, nbytes=0,
+                )
+            if attempt > retries:
+                raise
+            time.sleep(backoff)
             continue
-        # Ensure we don't try to fetch data for future years
-        end_year = min(station_info["end_year"], current_year)
-
-        print(f"\nProcessing: {city_name} - {station_name} (ID: {station_id})")
-        print(f"Years: {start_year} to {end_year}")
-
-        station_dir = os.path.join(RAW_DATA_DIR, f"{city_name}_{station_name}")
-        os.makedirs(station_dir, exist_ok=True)
-
-        for year in range(start_year, end_year + 1):
-            params = {
-                "format": "csv",
-                "stationID": station_id,
-                "Year": year,
-                "timeframe": timeframe,
-            }
-
-            output_filepath = os.path.join(station_dir, f"{year}_daily_weather.csv")
-            print(f"  Fetching data for {year}...")
-
-            try:
-                response = requests.get(BASE_URL, params=params, headers=HEADERS)
-                response.raise_for_status()  # Raises an HTTPError for bad responses
-
-                # --- MODIFIED SECTION ---
-                # Dynamically find the header row instead of using a fixed skiprows value.
-                # This makes the scraper more robust if the website changes its format.
-                raw_text = response.text
-                lines = raw_text.splitlines()
-
-                header_row_index = -1
-                for i, line in enumerate(lines):
-                    # The correct header contains these key column names. This is more reliable
-                    # than checking for just one column like "Year".
-                    if '"Date/Time"' in line and '"Max Temp (°C)"' in line and '"Min Temp (°C)"' in line:
-                        header_row_index = i
-                        break
-
-                if header_row_index == -1:
-                    print(f"    WARNING: Could not find header row for {year}. Skipping file.")
-                    continue
-
-                # Use the dynamically found header_row_index as the value for skiprows.
-                df = pd.read_csv(io.StringIO(raw_text), skiprows=header_row_index)
-                # --- END OF MODIFIED SECTION ---
-
-                df.to_csv(output_filepath, index=False)
-                print(f"    -> Saved to {output_filepath}")
-
-            except requests.exceptions.RequestException as e:
-                print(f"    ERROR: Could not download data for {year}. Reason: {e}")
-            except pd.errors.EmptyDataError:
-                print(f"    WARNING: No data available for {year}. The file is empty.")
-            except Exception as e:
-                print(f"    An unexpected error occurred for {year}: {e}")
-
-            time.sleep(DELAY_BETWEEN_REQUESTS)
-
-print("\n--- Scraping complete! ---")
\ No newline at end of file
+
+        latency = time.perf_counter() - started
+        if telemetry is not None:
+            telemetry.record_request(
+                **label, attempt=attempt, http_status=response.status_code, latency_s=latency,
+                nbytes=len(response.content),
+            )
+        if response.status_code not in RETRYABLE_STATUS or attempt > retries:
+            return response
+        retry_after = response.headers.get("Retry-After", "")
+        time.sleep(int(retry_after) if retry_after.isdigit() else backoff)
+
+
+def station_dir_path(raw_data_dir, city_name, station_info):
+    return os.path.join(raw_data_dir, f"{city_name}_{station_info['station_name']}")
+
+
+def station_year_path(raw_data_dir, city_name, station_info, year):
+    """The loose yearly CSV of the layout before raw_archive.py, still read by merger.py."""
+    station_dir = station_dir_path(raw_data_dir, city_name, station_info)
+    return os.path.join(station_dir, f"{year}_daily_weather.csv")
+
+
+def station_archive(raw_data_dir, city_name, station_info):
+    return RawArchive(station_dir_path(raw_data_dir, city_name, station_info))
+
+
+def download_station_year(city_name, station_info, year, raw_data_dir=RAW_DATA_DIR, overwrite=True,
+                          retries=MAX_RETRIES, telemetry=None):
+    """
+    Downloads one station-year and stores it, from the header row onwards, in
+    the station's raw archive (see raw_archive.py). Returns a dict describing
+    the outcome: status is one of 'saved', 'unchanged' (the archive already
+    held the same content), 'skipped', 'no_header', 'empty' or 'error'. If a
+    ScrapeTelemetry is given, every HTTP attempt and the outcome are recorded in it.
+    """
+    result = _download_station_year(
+        city_name, station_info, year, raw_data_dir, overwrite, retries, telemetry
+    )
+    if telemetry is not None:
+        telemetry.record_result(result)
+    return result
+
+
+def _download_station_year(city_name, station_info, year, raw_data_dir, overwrite, retries,
+                           telemetry):
+    station_name = station_info["station_name"]
+    data_type = station_info.get("data_type", "daily")  # Default to daily
+    timeframe = TIMEFRAME_MAP.get(data_type.lower())
+    archive = station_archive(raw_data_dir, city_name, station_info)
+    legacy_path = station_year_path(raw_data_dir, city_name, station_info, year)
+    result = {
+        "city": city_name,
+        "station": station_name,
+        "year": year,
+        "path": archive.path,
+        "bytes": 0,
+        "rows": 0,
+        "status": "saved",
+        "message": "",
+    }
+
+    if not timeframe:
+        result.update(status="error", message=f"Invalid data_type '{data_type}'")
+        return result
+    if not overwrite and archive.has(year):
+        result.update(status="skipped", bytes=archive.member_size(year))
+        return result
+    if not overwrite and os.path.exists(legacy_path):
+        result.update(status="skipped", path=legacy_path, bytes=os.path.getsize(legacy_path))
+        return result
+
+    params = {
+        "format": "csv",
+        "stationID": station_info["station_id"],
+        "Year": year,
+        "timeframe": timeframe,
+    }
+    label = {"city": city_name, "station": station_name, "year": year}
+    try:
+        lines = _download_csv_lines(params, HEADER_MARKERS, retries, telemetry, label, result)
+        if lines is None:
+            return result
+
+        # Archive the CSV from the header row onwards without re-parsing it.
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        if archive.put(year, payload):
+            result["rows"] = len(lines) - 1
+        else:
+            # Rows already in the archive aren't written again
+            result["status"] = "unchanged"
+        if os.path.exists(legacy_path):
+            # The archived copy supersedes the loose file
+            os.remove(legacy_path)
+    except requests.exceptions.RequestException as e:
+        result.update(status="error", message=f"Could not download data. Reason: {e}")
+    except Exception as e:
+        result.update(status="error", message=f"An unexpected error occurred: {e}")
+    return result
+
+
+def _download_csv_lines(params, markers, retries, telemetry, label, result):
+    """
+    Downloads a bulk-data CSV and returns its lines from the header row on.
+    Returns None, with result's status set to 'no_header' or 'empty', if there
+    is nothing to save; HTTP errors are raised.
+    """
+    response = _get_with_retries(params, retries, telemetry, label)
+    response.raise_for_status()  # Raises an HTTPError for bad responses
+    result["bytes"] = len(response.content)
+    if "charset" not in response.headers.get("Content-Type", ""):
+        # The bulk CSVs are UTF-8; without a declared charset requests would
+        # fall back to ISO-8859-1 and mangle the '°C' header markers.
+        response.encoding = "utf-8-sig"
+
+    # Dynamically find the header row instead of using a fixed skiprows value.
+    # This makes the scraper more robust if the website changes its format.
+    lines = response.text.splitlines()
+    header_row_index = find_header_row(lines, markers)
+    if header_row_index == -1:
+        result.update(status="no_header", message="Could not find header row")
+        return None
+    if len(lines) <= header_row_index + 1:
+        result.update(status="empty", message="No data rows")
+        return None
+    return lines[header_row_index:]
+
+
+def download_station_month(city_name, station_info, year, month, raw_data_dir=RAW_DATA_DIR,
+                           overwrite=True, retries=MAX_RETRIES, telemetry=None):
+    """
+    Downloads one month of an hourly station and stores it as a compact
+    Parquet partition (see hourly.py). Returns a result dict like
+    download_station_year's, with the month added.
+    """
+    output_filepath = hourly_partition_path(raw_data_dir, city_name, station_info, year, month)
+    result = {
+        "city": city_name,
+        "station": station_info["station_name"],
+        "year": year,
+        "month": month,
+        "path": output_filepath,
+        "bytes": 0,
+        "rows": 0,
+        "status": "saved",
+        "message": "",
+    }
+    if not overwrite and os.path.exists(output_filepath):
+        result.update(status="skipped", bytes=os.path.getsize(output_filepath))
+    else:
+        params = {
+            "format": "csv",
+            "stationID": station_info["station_id"],
+            "Year": year,
+            "Month": month,
+            "Day": 1,
+            "timeframe": TIMEFRAME_MAP["hourly"],
+        }
+        label = {"city": city_name, "station": station_info["station_name"], "year": year,
+                 "month": month}
+        try:
+            lines = _download_csv_lines(
+                params, HOURLY_HEADER_MARKERS, retries, telemetry, label, result
+            )
+            if lines is not None:
+                compact_df = parse_hourly_csv("\n".join(lines))
+                write_hourly_partition(compact_df, output_filepath)
+                result["rows"] = len(compact_df)
+        except requests.exceptions.RequestException as e:
+            result.update(status="error", message=f"Could not download data. Reason: {e}")
+        except Exception as e:
+            result.update(status="error", message=f"An unexpected error occurred: {e}")
+
+    if telemetry is not None:
+        telemetry.record_result(result)
+    return result
+
+
+def scrape_all(cities=None, start_year=None, end_year=None, max_workers=1,
+               raw_data_dir=RAW_DATA_DIR, overwrite=True, on_result=None,
+               delay=DELAY_BETWEEN_REQUESTS, retries=MAX_RETRIES, telemetry=None,
+               priority=DEFAULT_PRIORITY, deadlines=None):
+    """
+    Downloads every station-year (and every month of hourly stations) in the
+    work list using a pool of worker threads, in the order of
+    scrape_schedule.schedule(): recent periods first, then missing ones, then
+    the rest, interleaved across stations. `priority` and `deadlines` reorder
+    the classes. Recent periods are re-downloaded even without `overwrite`.
+    Each worker waits `delay` seconds between its own requests, so the
+    overall request rate is roughly max_workers / delay. `on_result` is
+    called with each result dict as downloads complete, tagged with its
+    "priority" class and "finished_s", the seconds since the run started;
+    `telemetry` (a ScrapeTelemetry) collects the run's request metrics.
+    """
+    work = build_work_list(cities, start_year, end_year)
+    work += build_hourly_work_list(cities, start_year, end_year)
+    started = time.perf_counter()
+
+    def run(task):
+        priority_class, unit = task
+        download = download_station_month if len(unit) == 4 else download_station_year
+        result = download(
+            *unit, raw_data_dir=raw_data_dir,
+            overwrite=overwrite or priority_class == "freshness", retries=retries,
+            telemetry=telemetry,
+        )
+        result["priority"] = priority_class
+        result["finished_s"] = time.perf_counter() - started
+        if result["status"] != "skipped" and delay:
+            time.sleep(delay)
+        return result
+
+    results = []
+    # The pool's queue is first in, first out, so units start in schedule order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run, task)
+            for task in schedule(work, raw_data_dir, priority, deadlines)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def _print_result(result):
+    label = f"{result['city']} - {result['station']} {result['year']}"
+    if "month" in result:
+        label += f"-{result['month']:02d}"
+    if result["status"] == "saved":
+        print(f"  {label} -> Saved to {result['path']}")
+    elif result["status"] == "unchanged":
+        print(f"  {label} -> Unchanged in {result['path']}")
+    elif result["status"] == "empty":
+        print(f"  WARNING: No data available for {label}. The file is empty.")
+    elif result["status"] == "no_header":
+        print(f"  WARNING: Could not find header row for {label}. Skipping file.")
+    elif result["status"] == "error":
+        print(f"  ERROR: {label}: {result['message']}")
+
+
+# --- Main Scraping Logic ---
+if __name__ == "__main__":
+    print(f"--- Config loaded. Found {len(CITIES)} cities: {list(CITIES.keys())} ---")
+    print("--- Weather Data Scraper ---")
+    os.makedirs(RAW_DATA_DIR, exist_ok=True)
+    os.makedirs(SCRAPE_RUNS_DIR, exist_ok=True)
+
+    metrics_path = os.path.join(
+        SCRAPE_RUNS_DIR, f"scrape_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    )
+    telemetry = ScrapeTelemetry(metrics_path)
+    try:
+        results = scrape_all(
+            on_result=_print_result, telemetry=telemetry, deadlines=DEFAULT_DEADLINES
+        )
+    finally:
+        summary = telemetry.close()
+
+    print("\n--- Scraping complete! ---")
+    print(summary_table(summary))
+    print(report_table(deadline_report(results, DEFAULT_DEADLINES)))
+    print(f"Run metrics written to {metrics_path}")
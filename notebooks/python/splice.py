@@ -0,0 +1,154 @@
+# splice.py
+# Station splicing for merger.py: one row per (City, Date_Time).
+#
+# Most cities have an _OLD station that ends in the year its replacement
+# starts, so the concatenated raw files hold two rows for every day of that
+# overlap year and each groupby().mean() downstream counts them twice.
+# splice_stations() resolves those conflicts for the whole frame in one pass:
+# a single np.lexsort by (City, Date_Time, priority keys...) puts the preferred
+# row of each day first, and every row matching the one before it is dropped.
+# The priority rules are applied in order:
+#
+#   non_null  prefer the row with the most non-null metric values
+#   newer     prefer the station with the later start_year in CITIES
+#   older     prefer the station with the earlier start_year in CITIES
+#
+# splice_report() describes what was resolved (overlap days per city) and
+# what is still missing afterwards (days between first and last observation
+# with no values at all, e.g. Fort St. John between 2012 and 2021).
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import METRIC_COLUMNS
+from merged_data import atomic_write
+
+SPLICE_RULES = ("non_null", "newer", "older")
+DEFAULT_SPLICE_PRIORITY = ("non_null", "newer")
+SPLICE_REPORT_FILE = "splice_report.csv"
+
+
+def _station_rank(df, cities):
+    """
+    Position of each row's station when a city's stations are ordered by
+    start_year (config order breaks ties), or NaN for stations missing from
+    `cities`.
+    """
+    order = {}
+    for city_name, stations in cities.items():
+        ranked = sorted(enumerate(stations), key=lambda item: (item[1]["start_year"], item[0]))
+        for rank, (_, info) in enumerate(ranked):
+            order[(city_name, info["station_name"])] = rank
+
+    # Look up each distinct (City, Station) pair once rather than every row
+    city_codes, city_names = pd.factorize(df["City"])
+    station_codes, station_names = pd.factorize(df["Station"])
+    pair_codes, pair_index = np.unique(
+        city_codes.astype("int64") * len(station_names) + station_codes, return_inverse=True
+    )
+    pair_rank = np.array(
+        [
+            order.get((city_names[code // len(station_names)],
+                       station_names[code % len(station_names)]), np.nan)
+            for code in pair_codes
+        ],
+        dtype="float64",
+    )
+    return pair_rank[pair_index]
+
+
+def splice_stations(df, cities, priority=DEFAULT_SPLICE_PRIORITY):
+    """
+    Returns (spliced_df, report): the merged frame reduced to one row per
+    (City, Date_Time), sorted by both, and the per-city splice_report().
+    """
+    unknown = [rule for rule in priority if rule not in SPLICE_RULES]
+    if unknown:
+        raise ValueError(f"Unknown splice rule(s) {unknown}; expected any of {SPLICE_RULES}")
+
+    metrics = [m for m in METRIC_COLUMNS if m in df.columns]
+    non_null = df[metrics].notna().sum(axis=1).to_numpy()
+    city_codes = pd.factorize(df["City"], sort=True)[0]
+    dates = df["Date_Time"].to_numpy()
+
+    # np.lexsort sorts by its last key first: City, Date_Time, then each rule
+    # in priority order, with keys negated where larger values win. Stations
+    # that aren't in `cities` lose to configured ones under either age rule.
+    rule_keys = []
+    station_rank = None
+    for rule in priority:
+        if rule == "non_null":
+            rule_keys.append(-non_null)
+        elif "Station" in df.columns:
+            if station_rank is None:
+                station_rank = _station_rank(df, cities)
+            key = -station_rank if rule == "newer" else station_rank
+            rule_keys.append(np.nan_to_num(key, nan=np.inf))
+    order = np.lexsort(rule_keys[::-1] + [dates, city_codes])
+
+    # After the sort a row duplicates the previous one when City and Date_Time match
+    sorted_cities, sorted_dates = city_codes[order], dates[order]
+    same_as_previous = np.zeros(len(order), dtype=bool)
+    same_as_previous[1:] = (sorted_cities[1:] == sorted_cities[:-1]) & (
+        sorted_dates[1:] == sorted_dates[:-1]
+    )
+    overlapping = same_as_previous.copy()
+    overlapping[:-1] |= same_as_previous[1:]
+
+    ranked = df.iloc[order].assign(_non_null=non_null[order])
+    spliced = ranked[~same_as_previous]
+    report = splice_report(ranked, same_as_previous, overlapping, spliced)
+    return spliced.drop(columns="_non_null").reset_index(drop=True), report
+
+
+def splice_report(ranked, dropped, overlapping, spliced):
+    """
+    Per-city overlap and gap statistics. Gaps are runs of days between a
+    city's first and last observation with no row holding any metric value.
+    """
+    per_city = pd.DataFrame(
+        {
+            "City": ranked["City"].to_numpy(),
+            "rows_in": 1,
+            "overlap_days": overlapping & ~dropped,
+            "dropped_rows": dropped,
+        }
+    ).groupby("City", sort=True).sum()
+    if "Station" in ranked.columns:
+        per_city.insert(0, "stations", ranked.groupby("City", sort=True)["Station"].nunique())
+
+    observed = spliced.loc[spliced["_non_null"].to_numpy() > 0, ["City", "Date_Time"]]
+    # Rows are sorted by (City, Date_Time), so a shift within City gives the previous day
+    previous = observed.groupby("City", sort=False)["Date_Time"].shift()
+    gap_days = (observed["Date_Time"] - previous).dt.days.fillna(1).astype("int64") - 1
+    gaps = observed.assign(gap_days=gap_days, gap_start=previous + pd.Timedelta(days=1))
+
+    coverage = gaps.groupby("City", sort=True).agg(
+        first_date=("Date_Time", "min"),
+        last_date=("Date_Time", "max"),
+        observed_days=("Date_Time", "size"),
+        missing_days=("gap_days", "sum"),
+        gaps=("gap_days", lambda days: int((days > 0).sum())),
+    )
+    longest = gaps.loc[gaps["gap_days"] > 0]
+    longest = longest.loc[longest.groupby("City", sort=True)["gap_days"].idxmax()]
+    longest = longest.set_index("City").rename(columns={"gap_days": "longest_gap_days"})
+    longest["longest_gap_start"] = longest["gap_start"]
+    longest["longest_gap_end"] = longest["Date_Time"] - pd.Timedelta(days=1)
+
+    report = per_city.join(coverage).join(
+        longest[["longest_gap_days", "longest_gap_start", "longest_gap_end"]]
+    )
+    report["longest_gap_days"] = report["longest_gap_days"].fillna(0).astype("int64")
+    for column in ("first_date", "last_date", "longest_gap_start", "longest_gap_end"):
+        report[column] = report[column].dt.strftime("%Y-%m-%d")
+    return report.reset_index()
+
+
+def write_splice_report(report, processed_data_dir):
+    path = os.path.join(processed_data_dir, SPLICE_REPORT_FILE)
+    with atomic_write(path) as tmp_path:
+        report.to_csv(tmp_path, index=False)
+    return path
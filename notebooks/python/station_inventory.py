@@ -0,0 +1,251 @@
+# station_inventory.py
+# Finds stations for config.py's CITIES from Environment Canada's station inventory.
+#
+# Download "Station Inventory EN.csv" (linked from the historical data search
+# page) and ingest it once:
+#
+#   python station_inventory.py ingest "Station Inventory EN.csv"
+#
+# That parses the CSV into data/external/station_inventory.parquet. Lookups
+# load the Parquet file into a StationInventory, which keeps a BallTree
+# (haversine) over the station coordinates and an IntervalIndex per data type
+# over the years each station has daily/hourly data, so a search over the
+# ~9,000 stations takes milliseconds:
+#
+#   python station_inventory.py find "Red Deer" --lat 52.27 --lon -113.81 --radius 50 --start 1953
+#
+# prints a CITIES entry, chaining a station's successors (a new station ID at
+# the same airport, say) to cover as much of the requested years as possible.
+
+import argparse
+import io
+import json
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from merged_data import atomic_write
+
+EARTH_RADIUS_KM = 6371.0
+
+base_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in locals() else '.'
+INVENTORY_STORE = os.path.join(base_dir, '..', '..', 'data', 'external', 'station_inventory.parquet')
+
+# Inventory CSV header -> column in the store
+INVENTORY_COLUMNS = {
+    "Name": "name",
+    "Province": "province",
+    "Climate ID": "climate_id",
+    "Station ID": "station_id",
+    "Latitude (Decimal Degrees)": "latitude",
+    "Longitude (Decimal Degrees)": "longitude",
+    "Elevation (m)": "elevation_m",
+    "First Year": "first_year",
+    "Last Year": "last_year",
+    "HLY First Year": "hourly_first_year",
+    "HLY Last Year": "hourly_last_year",
+    "DLY First Year": "daily_first_year",
+    "DLY Last Year": "daily_last_year",
+    "MLY First Year": "monthly_first_year",
+    "MLY Last Year": "monthly_last_year",
+}
+DATA_TYPES = ("daily", "hourly", "monthly")
+
+
+def read_inventory_csv(csv_path):
+    """
+    Reads the inventory CSV, skipping the "Modified Date"/disclaimer lines
+    above its header row.
+    """
+    with open(csv_path, encoding="utf-8-sig") as f:
+        lines = f.read().splitlines()
+    header_row_index = next(
+        (i for i, line in enumerate(lines) if '"Station ID"' in line and '"Name"' in line), -1
+    )
+    if header_row_index == -1:
+        raise ValueError(f"No station inventory header found in {csv_path}")
+
+    raw = pd.read_csv(io.StringIO("\n".join(lines[header_row_index:])))
+    missing = [column for column in INVENTORY_COLUMNS if column not in raw.columns]
+    if missing:
+        raise ValueError(f"Station inventory is missing columns: {missing}")
+    stations = raw[list(INVENTORY_COLUMNS)].rename(columns=INVENTORY_COLUMNS)
+    stations = stations.dropna(subset=["station_id", "latitude", "longitude"])
+    stations["station_id"] = stations["station_id"].astype("int64")
+    for column in INVENTORY_COLUMNS.values():
+        if column.endswith("_year"):
+            stations[column] = stations[column].astype("Int16")
+    return stations.reset_index(drop=True)
+
+
+def ingest_inventory(csv_path, store_path=INVENTORY_STORE):
+    """Parses the inventory CSV into the Parquet store. Returns (path, station count)."""
+    stations = read_inventory_csv(csv_path)
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    with atomic_write(store_path) as tmp_path:
+        stations.to_parquet(tmp_path, index=False)
+    return store_path, len(stations)
+
+
+def config_station_name(name):
+    """'CALGARY INT'L A' -> 'CALGARY_INTL_A', the naming used in config.py."""
+    name = re.sub(r"[^A-Z0-9 ]", "", str(name).upper())
+    return "_".join(name.split())
+
+
+class StationInventory:
+    """In-memory spatial and year-coverage indexes over the station inventory."""
+
+    def __init__(self, stations):
+        self.stations = stations.reset_index(drop=True)
+        coordinates = np.radians(self.stations[["latitude", "longitude"]].to_numpy(dtype="float64"))
+        self._tree = BallTree(coordinates, metric="haversine")
+        self._coverage = {}
+        for data_type in DATA_TYPES:
+            first = self.stations[f"{data_type}_first_year"].to_numpy(dtype="float64", na_value=np.nan)
+            last = self.stations[f"{data_type}_last_year"].to_numpy(dtype="float64", na_value=np.nan)
+            # A range with a missing or inverted end counts as no coverage
+            invalid = ~(first <= last)
+            first[invalid] = last[invalid] = np.nan
+            self._coverage[data_type] = pd.IntervalIndex.from_arrays(first, last, closed="both")
+
+    @classmethod
+    def load(cls, store_path=INVENTORY_STORE):
+        if not os.path.exists(store_path):
+            raise FileNotFoundError(
+                f"No station inventory at {store_path}; run `python station_inventory.py ingest <csv>` first"
+            )
+        return cls(pd.read_parquet(store_path))
+
+    def locate(self, name):
+        """
+        (latitude, longitude) of the station whose name contains `name`,
+        preferring the one with the longest record.
+        """
+        matches = self.stations[self.stations["name"].str.contains(name, case=False, regex=False)]
+        if matches.empty:
+            raise KeyError(f"No station name contains '{name}'")
+        span = (matches["last_year"] - matches["first_year"]).fillna(-1)
+        best = matches.loc[span.astype("int64").idxmax()]
+        return float(best["latitude"]), float(best["longitude"])
+
+    def search(self, lat, lon, radius_km=50, start_year=None, end_year=None, data_type="daily"):
+        """
+        Stations within radius_km of (lat, lon) with `data_type` data in any of
+        the requested years, nearest first, with a distance_km column.
+        """
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"data_type must be one of {DATA_TYPES}, got '{data_type}'")
+        point = np.radians([[lat, lon]])
+        indices, distances = self._tree.query_radius(
+            point, r=radius_km / EARTH_RADIUS_KM, return_distance=True, sort_results=True
+        )
+        indices, distances = indices[0], distances[0] * EARTH_RADIUS_KM
+
+        end_year = end_year or datetime.now().year
+        wanted = pd.Interval(start_year or 0, end_year, closed="both")
+        covers = self._coverage[data_type][indices].overlaps(wanted)
+        found = self.stations.iloc[indices[covers]].copy()
+        found["distance_km"] = np.round(distances[covers], 2)
+        return found.reset_index(drop=True)
+
+    def best_chain(self, lat, lon, radius_km=50, start_year=None, end_year=None, data_type="daily"):
+        """
+        Picks stations that together cover start_year..end_year: at each year
+        not yet covered, the station reaching furthest forward (the nearest on
+        ties) is added, skipping ahead over years no station within the radius
+        covers. Returns the chosen rows in chronological order.
+        """
+        end_year = end_year or datetime.now().year
+        candidates = self.search(lat, lon, radius_km, start_year, end_year, data_type)
+        first = candidates[f"{data_type}_first_year"].to_numpy(dtype="int64")
+        last = candidates[f"{data_type}_last_year"].to_numpy(dtype="int64")
+        # Candidates are sorted nearest first, so argmax breaks ties by distance
+        current = start_year if start_year is not None else (first.min() if len(first) else end_year)
+
+        chain = []
+        while current <= end_year and len(candidates):
+            active = (first <= current) & (last >= current)
+            if not active.any():
+                later = first > current
+                if not later.any():
+                    break
+                current = first[later].min()
+                continue
+            pick = int(np.argmax(np.where(active, last, -1)))
+            chain.append(pick)
+            current = last[pick] + 1
+
+        chosen = candidates.iloc[chain].copy()
+        chosen["start_year"] = np.maximum(first[chain], start_year or 0)
+        chosen["end_year"] = np.minimum(last[chain], end_year)
+        return chosen.reset_index(drop=True)
+
+    def cities_entry(self, city_name, lat, lon, radius_km=50, start_year=None, end_year=None,
+                     data_type="daily"):
+        """
+        A {city_name: [station, ...]} dict in config.py's CITIES format. Station
+        names follow config.py's convention, with _OLD added to a predecessor
+        that would otherwise share its successor's name.
+        """
+        chain = self.best_chain(lat, lon, radius_km, start_year, end_year, data_type)
+        names = [config_station_name(name) for name in chain["name"]]
+        for i in range(len(names) - 2, -1, -1):
+            while names[i] in names[i + 1:]:
+                names[i] += "_OLD"
+
+        stations = [
+            {
+                "station_id": int(row.station_id),
+                "station_name": name,
+                "start_year": int(row.start_year),
+                "end_year": int(row.end_year),
+                "data_type": data_type,
+            }
+            for row, name in zip(chain.itertuples(), names)
+        ]
+        return {city_name: stations}
+
+
+# ############################################################################
+# # MAIN EXECUTION BLOCK
+# ############################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find Environment Canada stations for config.py's CITIES.")
+    parser.add_argument("--store", default=INVENTORY_STORE, help="Path of the ingested inventory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Ingest the station inventory CSV.")
+    ingest.add_argument("csv_path", help="Path to 'Station Inventory EN.csv'.")
+
+    find = commands.add_parser("find", help="Print a CITIES entry for a location.")
+    find.add_argument("city", help="City name for the entry.")
+    find.add_argument("--lat", type=float, help="Latitude in decimal degrees.")
+    find.add_argument("--lon", type=float, help="Longitude in decimal degrees.")
+    find.add_argument("--near", help="Use the location of the station whose name contains this.")
+    find.add_argument("--radius", type=float, default=50, help="Search radius in km.")
+    find.add_argument("--start", type=int, help="First year to cover.")
+    find.add_argument("--end", type=int, help="Last year to cover (default: this year).")
+    find.add_argument("--type", default="daily", choices=DATA_TYPES, help="Data type to cover.")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        path, count = ingest_inventory(args.csv_path, args.store)
+        print(f"Ingested {count} stations into {path}")
+    else:
+        inventory = StationInventory.load(args.store)
+        if args.near:
+            lat, lon = inventory.locate(args.near)
+        elif args.lat is not None and args.lon is not None:
+            lat, lon = args.lat, args.lon
+        else:
+            parser.error("find needs --lat and --lon, or --near")
+        entry = inventory.cities_entry(args.city, lat, lon, args.radius, args.start, args.end, args.type)
+        if not entry[args.city]:
+            print(f"No stations with {args.type} data within {args.radius} km.")
+        else:
+            print(json.dumps(entry, indent=4, ensure_ascii=False)[1:-1].strip("\n") + ",")
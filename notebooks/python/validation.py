@@ -0,0 +1,193 @@
+# validation.py
+# Data-quality checks run by merger.py over the spliced daily frame.
+#
+# Every check is a vectorized comparison over whole columns, and the results
+# are counted per (City, Year) partition in a single groupby, so validating
+# adds little to the merge. The checks are:
+#
+#   * range checks per metric against VALUE_LIMITS (a 60 °C reading, negative
+#     precipitation)
+#   * Max >= Min, and Mean within [Min, Max] (EC's mean is (max + min) / 2)
+#   * the EC data flags on each metric, decoded into FLAG_CODES categories
+#   * completeness per month: days with a Mean_Temp_C value / days in month
+#   * for days rolled up from hourly stations, how many had fewer than
+#     FULL_DAY_HOURS temperature readings, and the hours with rain
+#
+# The result is quality_report.csv, one row per (City, Year). With mask=True
+# values failing a range or ordering check are set to NaN in the merged data.
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from aggregates import METRIC_COLUMNS
+from merged_data import atomic_write
+
+QUALITY_REPORT_FILE = "quality_report.csv"
+
+# Plausible limits for Canadian daily values; the national records are
+# 49.6 °C (Lytton, 2021) and -63.0 °C (Snag, 1947)
+VALUE_LIMITS = {
+    "Max_Temp_C": (-64.0, 50.0),
+    "Min_Temp_C": (-64.0, 50.0),
+    "Mean_Temp_C": (-64.0, 50.0),
+    "Total_Precip_mm": (0.0, 500.0),
+}
+# EC rounds the mean to 0.1 °C, so allow that much outside [Min, Max]
+MEAN_TOLERANCE_C = 0.1
+
+# Flag columns in the raw daily files -> merged names, kept only until validation
+FLAG_COLUMNS = {
+    "Max Temp Flag": "Max_Temp_Flag",
+    "Min Temp Flag": "Min_Temp_Flag",
+    "Mean Temp Flag": "Mean_Temp_Flag",
+    "Total Precip Flag": "Total_Precip_Flag",
+}
+# Hourly stations' rollup columns (see hourly.py), also kept only until validation
+HOURLY_COLUMNS = ("Rain_Hours", "Obs_Hours")
+FULL_DAY_HOURS = 24
+# Report category -> EC flag codes counted under it
+FLAG_CODES = {
+    "estimated": ("E", "F"),
+    "missing": ("M",),
+    "trace": ("T",),
+    "accumulated": ("A", "C", "L"),
+    "temp_sign_only": ("N", "Y"),
+}
+
+
+def _decode_flags(flags):
+    """
+    One boolean array per FLAG_CODES category for a flag column. The column
+    has only a handful of distinct values, so they are decoded once and
+    broadcast back to the rows by their factorized codes.
+    """
+    codes, uniques = pd.factorize(flags.astype("string"), use_na_sentinel=True)
+    decoded = {}
+    for category, letters in FLAG_CODES.items():
+        hits = np.array([any(letter in str(value) for letter in letters) for value in uniques])
+        hits = np.append(hits, False)  # code -1 (no flag) indexes this
+        decoded[category] = hits[codes]
+    return decoded
+
+
+def _expected_days(years, months):
+    """Calendar days per (year, month), counting only up to today for the current month."""
+    today = pd.Timestamp(datetime.now().date())
+    starts = pd.to_datetime({"year": years, "month": months, "day": 1})
+    days = starts.dt.days_in_month.to_numpy(dtype="float64")
+    current = (starts.dt.year == today.year) & (starts.dt.month == today.month)
+    days = np.where(current.to_numpy(), today.day, days)
+    return np.where((starts > today).to_numpy(), np.nan, days)
+
+
+def validate(df, mask=False):
+    """
+    Runs every check over the merged frame. Returns (df, quality_report); the
+    frame has failing values masked when `mask` is set and is otherwise
+    returned unchanged.
+    """
+    metrics = [m for m in METRIC_COLUMNS if m in df.columns]
+    values = {m: pd.to_numeric(df[m], errors="coerce").to_numpy(dtype="float64") for m in metrics}
+    present = {m: ~np.isnan(v) for m, v in values.items()}
+
+    checks = pd.DataFrame({"City": df["City"].to_numpy(), "Year": df["Date_Time"].dt.year})
+    bad = {}
+    for metric in metrics:
+        low, high = VALUE_LIMITS[metric]
+        with np.errstate(invalid="ignore"):
+            bad[metric] = present[metric] & ((values[metric] < low) | (values[metric] > high))
+        checks[f"{metric}_missing"] = ~present[metric]
+        checks[f"{metric}_out_of_range"] = bad[metric]
+
+    if {"Max_Temp_C", "Min_Temp_C"} <= set(metrics):
+        max_temp, min_temp = values["Max_Temp_C"], values["Min_Temp_C"]
+        with np.errstate(invalid="ignore"):
+            max_below_min = max_temp < min_temp
+        checks["max_below_min"] = max_below_min
+        bad["Max_Temp_C"] = bad["Max_Temp_C"] | max_below_min
+        bad["Min_Temp_C"] = bad["Min_Temp_C"] | max_below_min
+        if "Mean_Temp_C" in metrics:
+            mean_temp = values["Mean_Temp_C"]
+            with np.errstate(invalid="ignore"):
+                mean_outside = (mean_temp < min_temp - MEAN_TOLERANCE_C) | (
+                    mean_temp > max_temp + MEAN_TOLERANCE_C
+                )
+            checks["mean_outside_range"] = mean_outside
+            bad["Mean_Temp_C"] = bad["Mean_Temp_C"] | mean_outside | max_below_min
+
+    flag_columns = [c for c in FLAG_COLUMNS.values() if c in df.columns]
+    for category in FLAG_CODES:
+        checks[f"flag_{category}"] = 0
+    for column in flag_columns:
+        for category, hits in _decode_flags(df[column]).items():
+            checks[f"flag_{category}"] += hits
+
+    # Rows from the daily files have no hour counts and count as neither
+    hours = {
+        column: pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64")
+        if column in df.columns else np.full(len(df), np.nan)
+        for column in HOURLY_COLUMNS
+    }
+    checks["hourly_days"] = ~np.isnan(hours["Obs_Hours"])
+    with np.errstate(invalid="ignore"):
+        checks["partial_hour_days"] = hours["Obs_Hours"] < FULL_DAY_HOURS
+    checks["rain_hours"] = np.nan_to_num(hours["Rain_Hours"]).astype("int64")
+
+    if "Mean_Temp_C" in metrics:
+        checks["Month"] = df["Date_Time"].dt.month.to_numpy()
+        checks["has_mean"] = present["Mean_Temp_C"]
+
+    if mask:
+        checks["masked_values"] = sum(bad[m].astype("int64") for m in metrics)
+
+    report = _quality_report(checks)
+    if mask:
+        df = df.copy()
+        for metric in metrics:
+            df[metric] = np.where(bad[metric], np.nan, values[metric])
+    return df, report
+
+
+def _quality_report(checks):
+    """Counts every check per (City, Year) and adds monthly completeness."""
+    counted = [c for c in checks.columns if c not in ("City", "Year", "Month", "has_mean")]
+    grouped = checks.groupby(["City", "Year"], sort=True)
+    report = grouped[counted].sum().astype("int64")
+    report.insert(0, "rows", grouped.size())
+
+    if "Month" in checks.columns:
+        monthly = checks.groupby(["City", "Year", "Month"], sort=True)["has_mean"].sum()
+        monthly = monthly.unstack("Month").reindex(columns=range(1, 13)).fillna(0)
+        years = np.repeat(monthly.index.get_level_values("Year").to_numpy(), 12)
+        months = np.tile(np.arange(1, 13), len(monthly))
+        expected = _expected_days(years, months).reshape(-1, 12)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            completeness = np.round(monthly.to_numpy() / expected, 3)
+        report = report.join(
+            pd.DataFrame(
+                completeness,
+                index=monthly.index,
+                columns=[f"complete_{month:02d}" for month in range(1, 13)],
+            )
+        )
+    return report.reset_index()
+
+
+def write_quality_report(report, processed_data_dir):
+    path = os.path.join(processed_data_dir, QUALITY_REPORT_FILE)
+    with atomic_write(path) as tmp_path:
+        report.to_csv(tmp_path, index=False)
+    return path
+
+
+def issue_totals(report):
+    """Totals of the range, ordering and flag counts over every partition."""
+    columns = [
+        c for c in report.columns
+        if c.endswith("_out_of_range") or c.startswith("flag_")
+        or c in ("max_below_min", "mean_outside_range", "masked_values")
+    ]
+    return report[columns].sum()
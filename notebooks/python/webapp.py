@@ -1,91 +1,344 @@
 # webapp.py
 # A robust Flask web application to visualize the weather data.
 # This app handles data loading errors gracefully without crashing.
-
+#
+# Only the small city catalog is loaded at startup. Daily rows come from the
+# memory-mapped columnar store written by merger.py: every worker maps the same
+# read-only pages, and a city's rows are zero-copy slices. If the store hasn't
+# been generated, cities are loaded on first request from the per-city
+# partitions and kept in a size-bounded LRU cache instead.
+#
+# A background thread watches for new output from merger.py. The new version
+# is loaded in that thread and swapped in whole, so requests never wait on a
+# reload and there is no need to restart workers after a nightly merge.
+#
+# Configuration (environment variables):
+#   WEATHER_CACHE_MAX_MB      - memory ceiling for cached city data (default 256)
+#   WEATHER_PRELOAD_CITIES    - comma-separated cities to load at startup, or "all"
+#   WEATHER_RELOAD_INTERVAL_S - seconds between checks for new data (default 30, 0 disables)
+#
+# Request latencies, split into filter/groupby/figure/json phases for /plot,
+# are exported on /metrics (see weather_scraping/request_timing.py).
+#
+# /records answers "was this day a record?" from the per-day records index
+# (see records.py) without touching the daily rows.
+
+import numpy as np
 import pandas as pd
 import plotly
 import plotly.express as px
+from plotly.offline import get_plotlyjs_version
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from flask import Flask, render_template, request, jsonify
 
+from city_partitions import load_city_partition
+from columnar_store import ColumnarStore, current_version
+from records import load_records
+from weather_scraping.request_timing import instrument, phase
+
 # --- Global Cache & Error Tracking ---
-# These variables will hold the loaded data and any loading errors.
-WEATHER_DF = None
-META_DF = None
+# DATA holds everything loaded from one version of the processed data. A reload
+# builds a complete new DataState and replaces it with a single assignment, so
+# requests that already took a reference keep using a consistent snapshot.
+DATA = None
 DATA_LOAD_ERROR = None
+STARTUP_SECONDS = None
+RELOAD_STATS = {"reloads": 0, "failed_reloads": 0, "last_reload_seconds": None, "last_error": None}
+# The one reload watcher thread per process, shared by every create_app() call
+RELOAD_WATCHER = None
+
+CACHE_MAX_MB = float(os.environ.get("WEATHER_CACHE_MAX_MB", "256"))
+PRELOAD_CITIES = os.environ.get("WEATHER_PRELOAD_CITIES", "")
+RELOAD_INTERVAL_S = float(os.environ.get("WEATHER_RELOAD_INTERVAL_S", "30"))
+
+# --- Path Setup ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(script_dir))
+processed_data_dir = os.path.join(project_root, "data", "processed")
+
+# This path points to the output of the unified 'merger.py' script
+meta_file = os.path.join(processed_data_dir, "cities_metadata.csv")
+
+
+class CityDataCache:
+    """
+    Size-bounded LRU of per-city dataframes. A city is loaded from its
+    partition file on first use; the least recently used cities are evicted
+    once the cached frames exceed max_bytes.
+    """
+
+    def __init__(self, processed_data_dir, max_bytes):
+        self.processed_data_dir = processed_data_dir
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()  # city -> (dataframe, size in bytes)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def get(self, city):
+        with self._lock:
+            if city in self._frames:
+                self._frames.move_to_end(city)
+                self.hits += 1
+                return self._frames[city][0]
+            self.misses += 1
+
+        # Load outside the lock so other cities can still be served meanwhile
+        started = time.perf_counter()
+        df = load_city_partition(self.processed_data_dir, city)
+        size = int(df.memory_usage(deep=True).sum())
+
+        with self._lock:
+            self.load_seconds += time.perf_counter() - started
+            if city not in self._frames:
+                self._frames[city] = (df, size)
+                self.current_bytes += size
+            self._frames.move_to_end(city)
+            # Always keep the city just requested, even if it alone exceeds the limit
+            while self.current_bytes > self.max_bytes and len(self._frames) > 1:
+                _, (_, evicted_size) = self._frames.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            return self._frames[city][0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached_cities": list(self._frames),
+                "cached_mb": round(self.current_bytes / 1e6, 2),
+                "max_mb": round(self.max_bytes / 1e6, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds": round(self.load_seconds, 3),
+            }
+
+
+class DataState:
+    """The city catalog, columnar store, city cache and records index for one dataset version."""
+
+    def __init__(self, version, meta_df, store, city_cache, records=None):
+        self.version = version
+        self.meta_df = meta_df
+        self.store = store
+        self.city_cache = city_cache
+        self.records = records
+
+
+def dataset_version():
+    """
+    Identifies the processed data currently on disk. merger.py publishes the
+    columnar store's CURRENT version after writing the catalogs and every
+    other output, so that version alone marks a complete run; the catalog's
+    modification time only counts when there is no store. Raises
+    FileNotFoundError if there is no catalog.
+    """
+    catalog_mtime = os.stat(meta_file).st_mtime_ns
+    try:
+        return (current_version(processed_data_dir), None)
+    except FileNotFoundError:
+        return (None, catalog_mtime)
+
+
+def build_data_state(version):
+    """Loads a complete DataState for `version` without touching the live one."""
+    store_version, _ = version
+    meta_df = pd.read_csv(meta_file)
+    city_cache = CityDataCache(processed_data_dir, max_bytes=CACHE_MAX_MB * 1e6)
+    store = ColumnarStore(processed_data_dir, store_version) if store_version else None
+    if store is not None:
+        print(f"Memory-mapped columnar store {store.version} with {store.rows} rows.")
+    else:
+        print("Columnar store not found; loading per-city partitions on demand.")
+
+    if PRELOAD_CITIES.strip().lower() == "all":
+        preload = meta_df["City"].tolist()
+    else:
+        preload = [c.strip() for c in PRELOAD_CITIES.split(",") if c.strip()]
+    if store is None:
+        for city in preload:
+            print(f"Preloading weather data for {city}...")
+            city_cache.get(city)
+    records = load_records(processed_data_dir)
+    if records is None:
+        print("Records index not found; /records is unavailable until merger.py is re-run.")
+    return DataState(version, meta_df, store, city_cache, records)
 
 
 def load_data_if_needed():
     """
-    Loads data into global variables if they haven't been loaded yet.
-    Sets a global error message if loading fails.
+    Loads the city catalog and sets up the city data cache if they haven't
+    been loaded yet. Sets a global error message if loading fails.
     """
-    global WEATHER_DF, META_DF, DATA_LOAD_ERROR
+    global DATA, DATA_LOAD_ERROR, STARTUP_SECONDS
 
     # Return if data is already loaded successfully
-    if WEATHER_DF is not None and DATA_LOAD_ERROR is None:
+    if DATA is not None and DATA_LOAD_ERROR is None:
         return
 
     print("--- Weather Visualization Web App ---")
+    started = time.perf_counter()
     try:
-        # --- Path Setup ---
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(os.path.dirname(script_dir))
-        processed_data_dir = os.path.join(project_root, "data", "processed")
-
-        # These paths point to the output of the unified 'merger.py' script
-        data_file = os.path.join(processed_data_dir, "all_cities_weather_data.csv")
-        meta_file = os.path.join(processed_data_dir, "cities_metadata.csv")
-
         print(f"Attempting to load metadata from {meta_file}...")
-        META_DF = pd.read_csv(meta_file)
-        print(f"Attempting to load weather data from {data_file}...")
-        WEATHER_DF = pd.read_csv(data_file, parse_dates=["Date_Time"])
-
+        DATA = build_data_state(dataset_version())
         DATA_LOAD_ERROR = None  # Clear any previous errors
-        print("Data loaded successfully.")
+        STARTUP_SECONDS = time.perf_counter() - started
+        print(f"Data catalog loaded successfully in {STARTUP_SECONDS:.2f}s.")
 
     except FileNotFoundError as e:
         error_message = (
             f"A required data file was not found: {e.filename}. "
-            "Please run 'scraper.py' and 'merger.py' to generate the data, "
-            "then restart this web application."
+            "Please run 'scraper.py' and 'merger.py' to generate the data; "
+            "it will be picked up automatically."
         )
         print(f"--- FATAL ERROR: {error_message} ---")
         DATA_LOAD_ERROR = error_message
-        # Set dataframes to empty to prevent further errors
-        WEATHER_DF = pd.DataFrame()
-        META_DF = pd.DataFrame()
+        DATA = None
 
     except Exception as e:
         error_message = f"An unexpected error occurred during data loading: {e}"
         print(f"--- FATAL ERROR: {error_message} ---")
         DATA_LOAD_ERROR = error_message
-        WEATHER_DF = pd.DataFrame()
-        META_DF = pd.DataFrame()
+        DATA = None
+
 
+def reload_data_if_changed():
+    """
+    Builds the new dataset version in the calling (watcher) thread and swaps
+    it in when it differs from the live one. On failure the live data keeps
+    being served. Returns True if a new version was swapped in.
+    """
+    global DATA, DATA_LOAD_ERROR
+
+    try:
+        version = dataset_version()
+    except FileNotFoundError:
+        return False
+    if DATA is not None and version == DATA.version:
+        return False
 
-def create_app():
-    """Creates and configures the Flask application using the factory pattern."""
+    started = time.perf_counter()
+    try:
+        new_state = build_data_state(version)
+    except Exception as e:
+        RELOAD_STATS["failed_reloads"] += 1
+        RELOAD_STATS["last_error"] = str(e)
+        print(f"--- Reload failed, still serving the previous data: {e} ---")
+        return False
+
+    # The swap: one reference assignment. Dropping the old state releases its
+    # city cache and, once in-flight requests finish, its memory maps.
+    DATA = new_state
+    DATA_LOAD_ERROR = None
+    RELOAD_STATS["reloads"] += 1
+    RELOAD_STATS["last_reload_seconds"] = round(time.perf_counter() - started, 3)
+    RELOAD_STATS["last_error"] = None
+    print(f"Reloaded processed data in {RELOAD_STATS['last_reload_seconds']:.2f}s.")
+    return True
+
+
+def start_reload_watcher(interval=RELOAD_INTERVAL_S):
+    """
+    Polls for a new dataset version every `interval` seconds in a daemon
+    thread. Only one watcher runs per process: it reads the current data
+    directory on every poll, so later calls return the running one.
+    """
+    global RELOAD_WATCHER
+
+    if interval <= 0:
+        return None
+    if RELOAD_WATCHER is not None and RELOAD_WATCHER.is_alive():
+        return RELOAD_WATCHER
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                reload_data_if_changed()
+            except Exception as e:
+                print(f"--- Data watcher error: {e} ---")
+
+    RELOAD_WATCHER = threading.Thread(target=watch, name="data-reload-watcher", daemon=True)
+    RELOAD_WATCHER.start()
+    return RELOAD_WATCHER
+
+
+def city_columns(data, city, metric):
+    """
+    Year, day-of-year and metric arrays for one city: zero-copy views of the
+    memory-mapped store when available, otherwise from the LRU city cache.
+    """
+    if data.store is not None:
+        columns = data.store.city_columns(city, ["Year", "Day_of_Year", metric])
+        return columns["Year"], columns["Day_of_Year"], columns[metric]
+    df = data.city_cache.get(city)
+    return (
+        df["Year"].to_numpy(),
+        df["Date_Time"].dt.dayofyear.to_numpy(),
+        df[metric].to_numpy(dtype="float64"),
+    )
+
+
+def filter_years(years, days, values, selected_years):
+    """Day-of-year and metric values of the rows in the selected years."""
+    in_years = np.isin(years, selected_years)
+    return days[in_years], values[in_years]
+
+
+def day_of_year_means(days, values):
+    """
+    Mean of `values` per day of year, via bincount. Returns the days that
+    have rows and their means (NaN if all values are missing).
+    """
+    valid = ~np.isnan(values)
+    rows = np.bincount(days, minlength=367)
+    sums = np.bincount(days[valid], weights=values[valid], minlength=367)
+    counts = np.bincount(days[valid], minlength=367)
+    present = np.flatnonzero(rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return present, sums[present] / counts[present]
+
+
+def create_app(data_dir=None):
+    """
+    Creates and configures the Flask application using the factory pattern.
+    `data_dir` overrides the processed data directory (default data/processed).
+    """
+    global processed_data_dir, meta_file, DATA
+
+    if data_dir is not None and data_dir != processed_data_dir:
+        processed_data_dir = data_dir
+        meta_file = os.path.join(processed_data_dir, "cities_metadata.csv")
+        DATA = None
     app = Flask(__name__)
+    instrument(app, "webapp")
 
     # Attempt to load data when the app starts.
     with app.app_context():
         load_data_if_needed()
+        start_reload_watcher()
 
         @app.route("/")
         def index():
             """Renders the main page with selectors for cities, years, and metrics."""
-            if DATA_LOAD_ERROR:
+            data = DATA  # One snapshot for the whole request, even if a reload swaps DATA
+            if data is None:
                 # If data loading failed, show a helpful error page.
                 return render_template("error.html", error_message=DATA_LOAD_ERROR)
 
             # Prepare data for the template from the loaded dataframes
-            cities = META_DF["City"].unique().tolist()
+            meta_df = data.meta_df
+            cities = meta_df["City"].unique().tolist()
             years = list(
                 range(
-                    int(META_DF["start_year"].min()), int(META_DF["end_year"].max()) + 1
+                    int(meta_df["start_year"].min()), int(meta_df["end_year"].max()) + 1
                 )
             )
             metrics = {
@@ -100,13 +353,16 @@ def create_app():
                 cities=cities,
                 years=years,
                 metrics=metrics,
+                # The plotly.js bundled with the installed plotly, which decodes its figure JSON
+                plotlyjs_version=get_plotlyjs_version(),
             )
 
         @app.route("/plot", methods=["POST"])
         def create_plot():
             """Creates a plot based on user selections and returns it as JSON."""
             # If data failed to load, prevent plotting.
-            if DATA_LOAD_ERROR:
+            data = DATA
+            if data is None:
                 return jsonify(
                     {"error": "Data is not loaded. Cannot create plot."}
                 ), 500
@@ -124,9 +380,6 @@ def create_app():
                     }
                 ), 400
 
-            # Use the globally loaded WEATHER_DF
-            df = WEATHER_DF
-
             # Define metrics to get the friendly name for the plot title and labels
             metrics = {
                 "Mean_Temp_C": "Mean Temperature (°C)",
@@ -134,52 +387,135 @@ def create_app():
                 "Min_Temp_C": "Min Temperature (°C)",
                 "Total_Precip_mm": "Total Precipitation (mm)",
             }
-            metric_name = metrics.get(selected_metric, selected_metric)
-
-            # Filter the main dataframe based on selections
-            filtered_df = df[
-                (df["City"].isin(selected_cities)) & (df["Year"].isin(selected_years))
-            ].copy()
+            if selected_metric not in metrics:
+                return jsonify({"error": f"Unknown metric '{selected_metric}'."}), 400
+            metric_name = metrics[selected_metric]
+
+            # Aggregate each selected city: mean of the metric for each day of the
+            # year across all selected years, computed on the city's row slice only.
+            # merger.py's agg_daily_climatology table can't serve this: it pools
+            # every year, and a table keyed by (City, Year, Day_of_Year) would hold
+            # one row per city-day, i.e. the daily data the store already maps.
+            known_cities = set(data.meta_df["City"])
+            city_frames = []
+            try:
+                for city in selected_cities:
+                    if city not in known_cities:
+                        continue
+                    # The catalog can list a city the store has no rows for
+                    if data.store is not None and city not in data.store.city_ranges:
+                        continue
+                    with phase("filter"):
+                        days, values = filter_years(
+                            *city_columns(data, city, selected_metric), selected_years
+                        )
+                    with phase("groupby"):
+                        days, means = day_of_year_means(days, values)
+                        city_frames.append(
+                            pd.DataFrame(
+                                {"City": city, "Day_of_Year": days, selected_metric: means}
+                            )
+                        )
+            except FileNotFoundError as e:
+                return jsonify(
+                    {"error": f"City data file not found: {e.filename}. Please re-run 'merger.py'."}
+                ), 500
 
-            if filtered_df.empty:
+            plot_df = pd.concat(city_frames, ignore_index=True) if city_frames else pd.DataFrame()
+            if plot_df.empty:
                 return jsonify(
                     {"error": "No data available for the selected criteria."}
                 ), 404
 
-            # Create a 'Day of Year' column for plotting across different years
-            filtered_df["Day_of_Year"] = filtered_df["Date_Time"].dt.dayofyear
-
-            # Aggregate data: calculate the mean of the metric for each day of the year across all selected years
-            plot_df = (
-                filtered_df.groupby(["City", "Day_of_Year"])[selected_metric]
-                .mean()
-                .reset_index()
-            )
-
             # Create the plot
-            fig = px.line(
-                plot_df,
-                x="Day_of_Year",
-                y=selected_metric,
-                color="City",
-                title=f"Average {metric_name} for {', '.join(selected_cities)}",
-                labels={
-                    "Day_of_Year": "Day of the Year",
-                    selected_metric: metric_name,
-                    "City": "City",
-                },
-            )
+            with phase("figure"):
+                fig = px.line(
+                    plot_df,
+                    x="Day_of_Year",
+                    y=selected_metric,
+                    color="City",
+                    title=f"Average {metric_name} for {', '.join(selected_cities)}",
+                    labels={
+                        "Day_of_Year": "Day of the Year",
+                        selected_metric: metric_name,
+                        "City": "City",
+                    },
+                )
 
-            fig.update_layout(title_x=0.5, legend_title_text="Cities")
+                fig.update_layout(title_x=0.5, legend_title_text="Cities")
 
             # Convert the plot to JSON
-            graph_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+            with phase("json"):
+                graph_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
             # Return the JSON string directly as a response with the correct mimetype.
             return app.response_class(
                 response=graph_json, mimetype="application/json"
             )
 
+        @app.route("/records")
+        def day_records():
+            """
+            The highest and lowest values on record for a city's calendar day,
+            e.g. /records?city=Calgary&date=2024-07-15&metric=Max_Temp_C. The
+            date defaults to today and the metric to all of them. Entries set
+            in the requested date's year are listed under "set_on_date".
+            """
+            data = DATA
+            if data is None or data.records is None:
+                return jsonify({"error": "Records index is not loaded. Please re-run 'merger.py'."}), 500
+
+            city = request.args.get("city")
+            metric = request.args.get("metric")
+            try:
+                date = pd.Timestamp(request.args.get("date") or pd.Timestamp.now().date())
+            except ValueError:
+                return jsonify({"error": "date must be given as YYYY-MM-DD."}), 400
+            if not city:
+                return jsonify({"error": "Missing city."}), 400
+            try:
+                found = data.records.lookup(city, date.month, date.day, metric)
+            except KeyError as e:
+                return jsonify({"error": f"Unknown city or metric {e}."}), 404
+
+            set_on_date = [
+                {"metric": name, "kind": kind, "rank": rank + 1, "value": value}
+                for name, kinds in found.items()
+                for kind, entries in kinds.items()
+                for rank, (value, year) in enumerate(entries)
+                if year == date.year
+            ]
+            last_date = data.records.last_date.get(city)
+            return jsonify(
+                {
+                    "city": city,
+                    "month": date.month,
+                    "day": date.day,
+                    "records": {
+                        name: {
+                            kind: [{"value": value, "year": year} for value, year in entries]
+                            for kind, entries in kinds.items()
+                        }
+                        for name, kinds in found.items()
+                    },
+                    "set_on_date": set_on_date,
+                    "data_through": last_date.strftime("%Y-%m-%d") if last_date else None,
+                }
+            )
+
+        @app.route("/cache_stats")
+        def cache_stats():
+            """Reports startup/reload times, the data source and the city cache's memory use and hit rates."""
+            data = DATA
+            stats = data.city_cache.stats() if data is not None else {}
+            stats["startup_seconds"] = STARTUP_SECONDS
+            stats.update(RELOAD_STATS)
+            stats["mmap_store"] = data is not None and data.store is not None
+            if stats["mmap_store"]:
+                stats["store_version"] = data.store.version
+                stats["mapped_mb"] = round(data.store.nbytes() / 1e6, 2)
+            return jsonify(stats)
+
     return app
 
 
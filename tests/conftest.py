@@ -0,0 +1,7 @@
+import sys
+
+from weather_scraping.config import NOTEBOOK_SCRIPTS_DIR
+
+# The merge-time modules under test are notebook scripts, imported the same
+# way the package imports them
+sys.path.insert(0, str(NOTEBOOK_SCRIPTS_DIR))
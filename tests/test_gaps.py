@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from gaps import FILL_CODES, build_grid, fill_gaps, missing_runs
+
+
+def daily_frame(city, start, end, offset=0.0, seed=0):
+    dates = pd.date_range(start, end, freq="D")
+    rng = np.random.default_rng(seed)
+    seasonal = -12 * np.cos(2 * np.pi * dates.dayofyear.to_numpy() / 365.25)
+    return pd.DataFrame(
+        {
+            "City": city,
+            "Date_Time": dates,
+            "Mean_Temp_C": np.round(seasonal + offset + rng.normal(0, 2, len(dates)), 1),
+        }
+    )
+
+
+def drop_days(df, start, end):
+    """`df` without the days from `start` to `end`, inclusive."""
+    return df[~df["Date_Time"].between(start, end)]
+
+
+def city_rows(grid, city):
+    return grid[grid["City"] == city].set_index("Date_Time")
+
+
+def test_build_grid_reinserts_missing_days():
+    df = drop_days(daily_frame("Calgary", "2020-01-01", "2020-01-31"), "2020-01-10", "2020-01-12")
+    df = pd.concat([df, daily_frame("Edmonton", "2020-01-05", "2020-01-20")], ignore_index=True)
+    grid = build_grid(df)
+
+    assert len(grid) == 31 + 16
+    calgary = city_rows(grid, "Calgary")
+    assert calgary.loc["2020-01-10":"2020-01-12", "Mean_Temp_C"].isna().all()
+    assert calgary["Mean_Temp_C"].notna().sum() == 28
+
+    starts, lengths, bounded = missing_runs(
+        grid["Mean_Temp_C"].to_numpy(), np.array([0, 31]), np.array([30, 46])
+    )
+    assert list(starts) == [9] and list(lengths) == [3] and list(bounded) == [True]
+
+
+def test_fill_gaps_applies_fills_in_order():
+    calgary = daily_frame("Calgary", "2018-01-01", "2020-12-31")
+    edmonton = daily_frame("Edmonton", "2018-01-01", "2020-12-31", offset=-3, seed=1)
+    # Short gap: interpolated. Three weeks: from the neighbour. Neighbour also
+    # missing on the last days of that gap: climatology. 90 days: left missing.
+    calgary = drop_days(calgary, "2019-02-10", "2019-02-11")
+    calgary = drop_days(calgary, "2019-06-01", "2019-06-21")
+    edmonton = drop_days(edmonton, "2019-06-18", "2019-06-30")
+    calgary = drop_days(calgary, "2019-09-01", "2019-11-29")
+    grid = build_grid(pd.concat([calgary, edmonton], ignore_index=True))
+
+    filled, spans = fill_gaps(
+        grid, neighbours={"Mean_Temp_C": {"Calgary": "Edmonton", "Edmonton": "Calgary"}}
+    )
+    rows = city_rows(filled, "Calgary")
+    fill = rows["Mean_Temp_C_fill"]
+
+    assert (fill.loc["2019-02-10":"2019-02-11"] == FILL_CODES["interpolate"]).all()
+    before, after = rows.loc["2019-02-09", "Mean_Temp_C"], rows.loc["2019-02-12", "Mean_Temp_C"]
+    expected = np.round(before + (after - before) * np.array([1, 2]) / 3, 1)
+    np.testing.assert_allclose(rows.loc["2019-02-10":"2019-02-11", "Mean_Temp_C"], expected)
+
+    assert (fill.loc["2019-06-01":"2019-06-17"] == FILL_CODES["nearby"]).all()
+    assert (fill.loc["2019-06-18":"2019-06-21"] == FILL_CODES["climatology"]).all()
+    assert (fill.loc["2019-09-01":"2019-11-29"] == FILL_CODES["missing"]).all()
+    assert rows.loc["2019-09-01":"2019-11-29", "Mean_Temp_C"].isna().all()
+    assert (fill.loc["2018-01-01":"2019-01-31"] == FILL_CODES["observed"]).all()
+
+    # The input grid is left alone
+    assert grid["Mean_Temp_C"].isna().sum() == 2 + 21 + 90 + 13
+
+    calgary_spans = spans[spans["City"] == "Calgary"]
+    assert list(calgary_spans["Days"]) == [2, 21, 90]
+    assert list(calgary_spans["Filled_Days"]) == [2, 21, 0]
+    assert list(calgary_spans["Fill"]) == ["interpolate", "nearby", "missing"]
+
+
+def test_fill_gaps_nearby_shifts_by_climatology():
+    calgary = daily_frame("Calgary", "2018-01-01", "2020-12-31")
+    edmonton = daily_frame("Edmonton", "2018-01-01", "2020-12-31", offset=-3, seed=1)
+    calgary = drop_days(calgary, "2019-06-01", "2019-06-10")
+    grid = build_grid(pd.concat([calgary, edmonton], ignore_index=True))
+
+    filled, _ = fill_gaps(
+        grid, fills=("nearby",), neighbours={"Mean_Temp_C": {"Calgary": "Edmonton"}}
+    )
+    rows = city_rows(filled, "Calgary").loc["2019-06-01":"2019-06-10", "Mean_Temp_C"]
+    source = city_rows(grid, "Edmonton").loc["2019-06-01":"2019-06-10", "Mean_Temp_C"]
+    # Calgary runs about 3 degrees warmer than Edmonton in daily_frame
+    assert np.abs((rows - source).mean() - 3) < 1.5
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from quantile_sketches import (
+    SKETCH_BIN_DAYS,
+    SKETCH_COMPRESSION,
+    SKETCH_WINDOW_BINS,
+    QuantileSketches,
+    build_sketches,
+    calendar_day,
+    exact_bands,
+)
+
+QUANTILES = [0.1, 0.5, 0.9]
+BAND_COLUMNS = ["P10", "P50", "P90"]
+# A fifth of daily_frame's noise: about one gap between neighbouring values near P10
+TOLERANCE = 1.0
+
+
+def daily_frame(start, end, seed=0):
+    dates = pd.date_range(start, end, freq="D")
+    rng = np.random.default_rng(seed)
+    seasonal = -12 * np.cos(2 * np.pi * dates.dayofyear.to_numpy() / 365.25)
+    return pd.DataFrame(
+        {
+            "City": "Calgary",
+            "Date_Time": dates,
+            "Mean_Temp_C": seasonal + rng.normal(0, 5, len(dates)),
+        }
+    )
+
+
+def window_values(df, day):
+    """Every value in the window of bins around calendar day `day`."""
+    bins = 365 // SKETCH_BIN_DAYS
+    day_bins = (calendar_day(df["Date_Time"].dt) - 1) // SKETCH_BIN_DAYS
+    distance = np.abs(day_bins - (day - 1) // SKETCH_BIN_DAYS)
+    distance = np.minimum(distance, bins - distance)
+    return df["Mean_Temp_C"].to_numpy()[distance <= SKETCH_WINDOW_BINS // 2]
+
+
+def test_exact_bands_match_pooled_quantiles():
+    df = daily_frame("2000-01-01", "2009-12-31")
+    bands = exact_bands(df, "Mean_Temp_C").set_index("Day_of_Year")
+    assert list(bands.index) == list(range(1, 366))
+    for day in (1, 59, 60, 200, 365):
+        expected = np.quantile(window_values(df, day), QUANTILES)
+        np.testing.assert_allclose(bands.loc[day, BAND_COLUMNS], expected)
+
+
+def test_digests_summarize_their_values():
+    sketches = QuantileSketches().update(daily_frame("2000-01-01", "2009-12-31"))
+    per_digest = sketches.centroids.groupby("Day_Bin").size()
+    # About 50 values per bin and decade, in at most ~compression / 2 centroids
+    assert per_digest.max() <= SKETCH_COMPRESSION // 2 + 1
+    assert len(sketches.centroids) < 3653 / 3
+    assert sketches.centroids["Weight"].sum() == 3653
+
+
+def test_merged_digests_match_pooled_quantiles():
+    first = daily_frame("2000-01-01", "2009-12-31")
+    second = daily_frame("2010-01-01", "2019-12-31", seed=1)
+    sketches = QuantileSketches().update(first).update(second)
+    pooled = pd.concat([first, second], ignore_index=True)
+
+    bands = sketches.bands("Calgary", "Mean_Temp_C").set_index("Day_of_Year")
+    for day in (1, 60, 120, 200, 300, 365):
+        expected = np.quantile(window_values(pooled, day), QUANTILES)
+        np.testing.assert_allclose(bands.loc[day, BAND_COLUMNS], expected, atol=TOLERANCE)
+        assert bands.loc[day, "Count"] == len(window_values(pooled, day))
+
+    decade = sketches.bands("Calgary", "Mean_Temp_C", years=range(2010, 2020))
+    expected = np.quantile(window_values(second, 200), QUANTILES)
+    np.testing.assert_allclose(
+        decade.set_index("Day_of_Year").loc[200, BAND_COLUMNS], expected, atol=TOLERANCE
+    )
+    with pytest.raises(ValueError):
+        sketches.bands("Calgary", "Mean_Temp_C", years=range(2015, 2020))
+
+
+def test_build_sketches_rebuilds_only_changed_blocks():
+    df = daily_frame("2000-01-01", "2019-12-31")
+    previous, rebuilt, blocks = build_sketches(df)
+    assert (rebuilt, blocks) == (2, 2)
+
+    # New days in the current decade only change that block
+    newer = pd.concat([df, daily_frame("2020-01-01", "2020-01-31", seed=2)], ignore_index=True)
+    sketches, rebuilt, blocks = build_sketches(newer, previous=previous)
+    assert (rebuilt, blocks) == (1, 3)
+
+    fresh, _, _ = build_sketches(newer)
+    pd.testing.assert_frame_equal(
+        sketches.bands("Calgary", "Mean_Temp_C"), fresh.bands("Calgary", "Mean_Temp_C")
+    )
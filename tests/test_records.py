@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from records import RECORD_KINDS, RecordsIndex, build_records, new_days, update_records
+
+
+def daily_frame(cities, start, end, seed=0):
+    dates = pd.date_range(start, end, freq="D")
+    rng = np.random.default_rng(seed)
+    frames = []
+    for city in cities:
+        frame = pd.DataFrame({"City": city, "Date_Time": dates})
+        for metric in ("Max_Temp_C", "Min_Temp_C", "Mean_Temp_C"):
+            # Rounded so ties between years happen and exercise the tie-break
+            frame[metric] = np.round(rng.normal(0, 5, len(dates)))
+        frame["Total_Precip_mm"] = np.round(rng.exponential(2, len(dates)), 1)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def assert_same_index(actual, expected):
+    assert actual.cities == expected.cities
+    assert actual.metrics == expected.metrics
+    assert actual.last_date == expected.last_date
+    for kind in RECORD_KINDS:
+        np.testing.assert_array_equal(actual.entries[kind][0], expected.entries[kind][0])
+        np.testing.assert_array_equal(actual.entries[kind][1], expected.entries[kind][1])
+
+
+def test_lookup_ranks_values_best_first_and_ties_to_earlier_year():
+    dates = pd.to_datetime(["2000-07-15", "2001-07-15", "2002-07-15", "2003-07-15"])
+    df = pd.DataFrame(
+        {"City": "Calgary", "Date_Time": dates, "Max_Temp_C": [30.0, 32.0, 30.0, 28.0]}
+    )
+    index, _ = build_records(df)
+    day = index.lookup("Calgary", 7, 15, "Max_Temp_C")["Max_Temp_C"]
+    assert day["high"][:3] == [(32.0, 2001), (30.0, 2000), (30.0, 2002)]
+    assert day["low"][:3] == [(28.0, 2003), (30.0, 2000), (30.0, 2002)]
+    assert index.is_record("Calgary", 7, 15, "Max_Temp_C", 33.0) == "high"
+    assert index.is_record("Calgary", 7, 15, "Max_Temp_C", 31.0) is None
+    with pytest.raises(KeyError):
+        index.lookup("Calgary", 7, 15, "Snow_cm")
+
+
+def test_incremental_update_matches_rebuild(tmp_path):
+    df = daily_frame(["Calgary", "Edmonton"], "2000-01-01", "2009-12-31")
+    newer = pd.concat(
+        [df, daily_frame(["Calgary", "Edmonton", "Red Deer"], "2010-01-01", "2011-06-30", seed=1)],
+        ignore_index=True,
+    )
+    build_records(df)[0].write(tmp_path)
+    path = tmp_path / "records_index.npz"
+    previous = RecordsIndex.from_file(path)
+    assert len(new_days(newer, previous)) == len(newer) - len(df)
+
+    updated, broken, rebuilt = update_records(newer, previous)
+    assert not rebuilt
+    fresh, fresh_broken, rebuilt = update_records(
+        newer, RecordsIndex.from_file(path), rebuild=True
+    )
+    assert rebuilt
+    assert_same_index(updated, fresh)
+
+    # Both paths report the same broken records, all set by the new days
+    assert len(broken) > 0
+    assert (broken["Year"] >= 2010).all()
+    assert (broken["City"] != "Red Deer").all()
+    key = ["City", "Month", "Day", "Metric", "Kind"]
+    pd.testing.assert_frame_equal(
+        broken.sort_values(key).reset_index(drop=True),
+        fresh_broken.sort_values(key).reset_index(drop=True),
+    )
+
+
+def test_update_is_idempotent():
+    df = daily_frame(["Calgary"], "2000-01-01", "2004-12-31")
+    index, _ = build_records(df)
+    before = {kind: tuple(a.copy() for a in pair) for kind, pair in index.entries.items()}
+    broken = index.update(df.iloc[-400:])
+    assert broken.empty
+    for kind in RECORD_KINDS:
+        np.testing.assert_array_equal(index.entries[kind][0], before[kind][0])
+        np.testing.assert_array_equal(index.entries[kind][1], before[kind][1])
@@ -0,0 +1,51 @@
+import pytest
+from weather_scraping.scale_out import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queue.enqueue([("calgary-1", {"station_id": 1}), ("calgary-2", {"station_id": 2})])
+    return queue
+
+
+def test_claim_hands_each_unit_out_once(queue):
+    assert queue.enqueue([("calgary-1", {"station_id": 1})]) == 0
+    assert queue.claim("a") == ("calgary-1", {"station_id": 1})
+    assert queue.claim("b") == ("calgary-2", {"station_id": 2})
+    assert queue.claim("c") is None
+    assert queue.counts() == {"claimed": 2}
+
+
+def test_expired_lease_is_reclaimed(queue):
+    unit_id, _ = queue.claim("a", lease_s=-1)
+    assert queue.claim("b")[0] == unit_id
+    # The first worker lost the unit, so it can no longer finish or fail it
+    assert not queue.complete(unit_id, "a")
+    assert not queue.fail(unit_id, "a", "boom")
+    assert queue.complete(unit_id, "b")
+    assert queue.counts() == {"done": 1, "pending": 1}
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    for attempt in range(1, 3):
+        unit_id, _ = queue.claim("a", max_attempts=2)
+        assert unit_id == "calgary-1"
+        assert queue.fail(unit_id, "a", f"attempt {attempt}", max_attempts=2)
+    assert queue.failures() == [("calgary-1", "attempt 2")]
+    assert queue.claim("a", max_attempts=2)[0] == "calgary-2"
+
+    assert queue.retry_failed() == 1
+    assert queue.claim("a", max_attempts=2)[0] == "calgary-1"
+
+
+def test_unit_that_keeps_expiring_is_failed(queue):
+    queue.enqueue([("calgary-3", {"station_id": 3})])
+    for worker in ("a", "b"):
+        assert queue.claim(worker, lease_s=-1, max_attempts=2)[0] == "calgary-1"
+    # Each worker died holding calgary-1; after the second expiry it is failed
+    # rather than handed out again
+    assert queue.claim("c", max_attempts=2)[0] == "calgary-2"
+    assert queue.counts() == {"claimed": 1, "failed": 1, "pending": 1}
+    assert queue.failures()[0][0] == "calgary-1"
+    assert "lease expired 2 times" in queue.failures()[0][1]
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from splice import splice_stations
+
+CITIES = {
+    "Calgary": [
+        {"station_id": 2205, "station_name": "CALGARY_INTL_A_OLD", "start_year": 1953,
+         "end_year": 2012},
+        {"station_id": 50430, "station_name": "CALGARY_INTL_A", "start_year": 2012,
+         "end_year": 2025},
+    ],
+}
+
+
+def station_frame(station, start, end, value):
+    dates = pd.date_range(start, end, freq="D")
+    return pd.DataFrame(
+        {
+            "City": "Calgary",
+            "Station": station,
+            "Date_Time": dates,
+            "Max_Temp_C": value,
+            "Min_Temp_C": value - 10,
+        }
+    )
+
+
+def overlapping_stations():
+    """Both stations report 2012-06-01..10; the new one misses Min_Temp_C on the 5th."""
+    old = station_frame("CALGARY_INTL_A_OLD", "2012-05-25", "2012-06-10", 20.0)
+    new = station_frame("CALGARY_INTL_A", "2012-06-01", "2012-06-15", 25.0)
+    new.loc[new["Date_Time"] == "2012-06-05", "Min_Temp_C"] = np.nan
+    # Shuffled, since the raw files arrive in no particular order
+    return pd.concat([new, old], ignore_index=True).sample(frac=1, random_state=0)
+
+
+def station_by_day(spliced):
+    return spliced.set_index("Date_Time")["Station"]
+
+
+def test_splice_keeps_one_row_per_day():
+    spliced, report = splice_stations(overlapping_stations(), CITIES)
+    assert len(spliced) == 22
+    assert spliced["Date_Time"].is_monotonic_increasing
+    assert not spliced.duplicated(["City", "Date_Time"]).any()
+
+    row = report.set_index("City").loc["Calgary"]
+    assert row["stations"] == 2
+    assert row["overlap_days"] == 10
+    assert row["dropped_rows"] == 10
+    assert row["missing_days"] == 0
+
+
+def test_splice_priority_order():
+    df = overlapping_stations()
+
+    # Default: the most complete row wins, then the newer station
+    stations = station_by_day(splice_stations(df, CITIES)[0])
+    assert stations["2012-06-04"] == "CALGARY_INTL_A"
+    assert stations["2012-06-05"] == "CALGARY_INTL_A_OLD"
+    assert stations["2012-05-31"] == "CALGARY_INTL_A_OLD"
+    assert stations["2012-06-11"] == "CALGARY_INTL_A"
+
+    # Station age alone ignores the missing value
+    stations = station_by_day(splice_stations(df, CITIES, priority=("newer",))[0])
+    assert stations["2012-06-05"] == "CALGARY_INTL_A"
+    stations = station_by_day(splice_stations(df, CITIES, priority=("older", "non_null"))[0])
+    assert (stations["2012-06-01":"2012-06-10"] == "CALGARY_INTL_A_OLD").all()
+
+    # A station missing from the config loses to configured ones
+    unknown = df.replace({"Station": {"CALGARY_INTL_A_OLD": "CALGARY_SPRINGBANK"}})
+    stations = station_by_day(splice_stations(unknown, CITIES, priority=("older",))[0])
+    assert (stations["2012-06-01":"2012-06-10"] == "CALGARY_INTL_A").all()
+
+    with pytest.raises(ValueError):
+        splice_stations(df, CITIES, priority=("newest",))
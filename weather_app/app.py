@@ -8,9 +8,19 @@ from dateutil.relativedelta import relativedelta
 import concurrent.futures
 import io
 import csv
+import os
+
+from weather_scraping.request_timing import instrument, phase
 
 app = Flask(__name__)
 CORS(app)
+instrument(app, "weather_app")
+
+# Environment Canada bulk data endpoint; override to point at a mirror or test server
+BULK_DATA_URL = os.environ.get(
+    "WEATHER_BULK_DATA_URL",
+    "https://climate.weather.gc.ca/climate_data/bulk_data_e.html",
+)
 
 # Environment Canada station IDs
 STATION_IDS = {
@@ -30,15 +40,31 @@ STATION_IDS = {
 }
 
 
+def fetch_csv(url):
+    """
+    Download a bulk-data CSV and return its raw bytes
+    """
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+
+def parse_csv(content):
+    """
+    Parse downloaded CSV bytes into a dataframe
+    """
+    return pd.read_csv(io.BytesIO(content))
+
+
 def fetch_monthly_data(station_id, year, month):
     """
-    Fetch one month of climate data for a station
+    Fetch one month of climate data for a station (raw CSV bytes, or None on failure)
     """
-    url = f"https://climate.weather.gc.ca/climate_data/bulk_data_e.html?format=csv&stationID={station_id}&Year={year}&Month={month}&timeframe=2&submit=Download+Data"
+    url = f"{BULK_DATA_URL}?format=csv&stationID={station_id}&Year={year}&Month={month}&timeframe=2&submit=Download+Data"
     try:
-        return pd.read_csv(url)
-    except:
-        return pd.DataFrame()
+        return fetch_csv(url)
+    except Exception:
+        return None
 
 
 def get_historical_weather(city, years=2):
@@ -53,9 +79,12 @@ def get_historical_weather(city, years=2):
     start_date = end_date - relativedelta(years=years)
 
     # Get current conditions (daily data)
-    current_url = f"https://climate.weather.gc.ca/climate_data/bulk_data_e.html?format=csv&stationID={station_id}&Year={end_date.year}&Month={end_date.month}&Day={end_date.day}&timeframe=1&submit=Download+Data"
+    current_url = f"{BULK_DATA_URL}?format=csv&stationID={station_id}&Year={end_date.year}&Month={end_date.month}&Day={end_date.day}&timeframe=1&submit=Download+Data"
     try:
-        current_df = pd.read_csv(current_url)
+        with phase("fetch"):
+            current_content = fetch_csv(current_url)
+        with phase("parse"):
+            current_df = parse_csv(current_content)
         latest = current_df.iloc[-1]
     except Exception as e:
         return {"error": f"Error fetching current data: {str(e)}"}
@@ -67,14 +96,25 @@ def get_historical_weather(city, years=2):
         dates.append((current_date.year, current_date.month))
         current_date += relativedelta(months=1)
 
+    monthly_contents = []
+    with phase("fetch"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [
+                executor.submit(fetch_monthly_data, station_id, year, month)
+                for year, month in dates
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                content = future.result()
+                if content is not None:
+                    monthly_contents.append(content)
+
     all_data = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_date = {
-            executor.submit(fetch_monthly_data, station_id, year, month): (year, month)
-            for year, month in dates
-        }
-        for future in concurrent.futures.as_completed(future_to_date):
-            df = future.result()
+    with phase("parse"):
+        for content in monthly_contents:
+            try:
+                df = parse_csv(content)
+            except Exception:
+                continue
             if not df.empty:
                 all_data.append(df)
 
@@ -83,6 +123,15 @@ def get_historical_weather(city, years=2):
 
     # Combine all monthly data
     historical_df = pd.concat(all_data, ignore_index=True)
+    with phase("aggregate"):
+        return summarize_weather(historical_df, latest, years)
+
+
+def summarize_weather(historical_df, latest, years):
+    """
+    Build the current conditions, historical statistics and seasonal averages
+    from the latest daily row and the combined monthly data
+    """
 
     # Process current conditions
     temp = latest.get("Temp (°C)", latest.get("Mean Temp (°C)"))
@@ -197,16 +246,13 @@ def index():
 
 @app.route("/get_weather", methods=["POST"])
 def weather_comparison():
-    print("Received weather comparison request")  # Debug log
     data = request.get_json()
-    print(f"Request data: {data}")  # Debug log
     city1 = data.get("city1", "Calgary")
     city2 = data.get("city2", "")
 
-    print(f"Fetching weather for {city1} and {city2}")  # Debug log
+    app.logger.debug("Fetching weather for %s and %s", city1, city2)
     weather1 = get_historical_weather(city1)
     weather2 = get_historical_weather(city2)
-    print("Weather data fetched successfully")  # Debug log
 
     return jsonify({"city1": weather1, "city2": weather2})
 
@@ -0,0 +1,299 @@
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from weather_scraping.config import (
+    INTERIM_DATA_DIR,
+    NOTEBOOK_SCRIPTS_DIR,
+    PROJ_ROOT,
+    REPORTS_DIR,
+    WEATHER_APP_DIR,
+)
+from weather_scraping.synthetic import daily_csv, synthetic_cities, write_raw_dataset
+
+app = typer.Typer()
+
+# Benchmarks time the scripts as they are: merger, webapp and the reports from
+# notebooks/python, and weather_app's get_historical_weather
+sys.path.insert(0, str(NOTEBOOK_SCRIPTS_DIR))
+os.environ.setdefault("WEATHER_RELOAD_INTERVAL_S", "0")
+
+HISTORY_PATH = REPORTS_DIR / "benchmarks" / "history.jsonl"
+DEFAULT_SCALES = [1, 10, 100]
+PLOT_CITIES = 3
+# get_historical_weather fetches this many years per 1x of scale
+WEATHER_YEARS_PER_SCALE = 2
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Serves synthetic bulk-data CSVs for any station, year and month."""
+
+    seed = 0
+    preamble = False
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        try:
+            station_id = int(params["stationID"][0])
+            year = int(params["Year"][0])
+            month = int(params["Month"][0]) if "Month" in params else None
+        except (KeyError, ValueError):
+            self.send_error(400, "stationID and Year are required")
+            return
+        station_info = {"station_id": station_id, "station_name": f"STATION_{station_id}"}
+        body = daily_csv(station_info, year, self.seed, month, self.preamble).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def stub_server(seed: int = 0, preamble: bool = False):
+    """
+    A local stand-in for the bulk-data endpoint. Yields its URL. The live
+    endpoint now starts its CSVs at the header row; `preamble` serves the
+    older format with station details and a legend first.
+    """
+    handler = type("StubHandler", (_StubHandler,), {"seed": seed, "preamble": preamble})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/climate_data/bulk_data_e.html"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _timed(fn: Callable, runs: int) -> tuple:
+    """Calls fn `runs` times with its prints suppressed. Returns (last result, timings)."""
+    timings, result = [], None
+    for _ in range(runs):
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = fn()
+        timings.append(time.perf_counter() - started)
+    return result, timings
+
+
+def _load_weather_app():
+    spec = importlib.util.spec_from_file_location("weather_app_server", WEATHER_APP_DIR / "app.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJ_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_workspace(work_dir: Path, scale: int, seed: int, workers: Optional[int]) -> dict:
+    """
+    Generates the synthetic raw data for a scale under work_dir, reusing it if
+    a previous run with the same scale and seed already completed.
+    """
+    scale_dir = work_dir / f"scale_{scale}_seed_{seed}"
+    marker = scale_dir / "raw.json"
+    cities = synthetic_cities(scale)
+    if marker.exists():
+        info = json.loads(marker.read_text())
+    else:
+        logger.info(f"Generating {scale}x synthetic raw data in {scale_dir}...")
+        files, nbytes = write_raw_dataset(scale_dir / "raw", cities, seed, workers=workers)
+        info = {"files": files, "bytes": nbytes}
+        marker.write_text(json.dumps(info))
+    return {
+        "cities": cities,
+        "raw_dir": scale_dir / "raw",
+        "processed_dir": scale_dir / "processed",
+        "reports_dir": scale_dir / "reports",
+        **info,
+    }
+
+
+def bench_scale(
+    scale: int, work_dir: Path, seed: int, repeat: int, workers: Optional[int], stub_url: str
+) -> List[dict]:
+    """Times every stage at one scale. Returns one record per stage."""
+    import generate_comparison_report
+    import generate_max_temp_report
+    import generate_report
+    import generate_summary_report
+    import merger
+    import webapp
+
+    workspace = prepare_workspace(work_dir, scale, seed, workers)
+    cities = workspace["cities"]
+    processed_dir = str(workspace["processed_dir"])
+    reports_dir = str(workspace["reports_dir"])
+    records = []
+
+    def record(stage, timings, **extra):
+        records.append(
+            {
+                "scale": scale,
+                "stage": stage,
+                "runs": len(timings),
+                "best_s": round(min(timings), 4),
+                "mean_s": round(sum(timings) / len(timings), 4),
+                **extra,
+            }
+        )
+        logger.info(f"{scale}x {stage}: best {min(timings):.3f}s over {len(timings)} run(s)")
+
+    # merger.py over the raw files; the other stages read its output
+    _, timings = _timed(
+        lambda: merger.merge_and_clean_data(
+            str(workspace["raw_dir"]), processed_dir, cities=cities
+        ),
+        1,
+    )
+    rows = int(pd.read_csv(os.path.join(processed_dir, "cities_metadata.csv"))["rows"].sum())
+    record("merge", timings, rows=rows, files=workspace["files"], bytes=workspace["bytes"])
+
+    # The /plot handler through Flask's test client, data already loaded
+    with redirect_stdout(io.StringIO()):
+        flask_app = webapp.create_app(processed_dir)
+    meta_df = webapp.DATA.meta_df
+    selection = {
+        "cities": meta_df["City"].tolist()[:PLOT_CITIES],
+        "years": list(range(int(meta_df["start_year"].min()), int(meta_df["end_year"].max()) + 1)),
+        "metric": "Mean_Temp_C",
+    }
+    client = flask_app.test_client()
+    response, timings = _timed(lambda: client.post("/plot", json=selection), repeat)
+    if response.status_code != 200:
+        raise RuntimeError(f"/plot returned {response.status_code}: {response.get_data(True)}")
+    record("plot", timings, rows=rows)
+
+    first_city = next(iter(cities))
+    reports = {
+        "generate_report": lambda: generate_report.generate_report(
+            first_city, processed_dir, reports_dir
+        ),
+        "generate_summary_report": lambda: generate_summary_report.generate_summary_report(
+            processed_dir, reports_dir
+        ),
+        "generate_max_temp_report": lambda: generate_max_temp_report.generate_max_temp_report(
+            processed_dir, reports_dir
+        ),
+        "generate_comparison_report": (
+            lambda: generate_comparison_report.generate_comparison_report(
+                processed_dir, reports_dir
+            )
+        ),
+    }
+    for name, run in reports.items():
+        _, timings = _timed(run, 1)
+        record(name, timings, rows=rows)
+
+    # weather_app fetching from the local stub; the history length scales instead
+    weather_app = _load_weather_app()
+    weather_app.BULK_DATA_URL = stub_url
+    years = WEATHER_YEARS_PER_SCALE * scale
+    result, timings = _timed(
+        lambda: weather_app.get_historical_weather("Calgary", years=years), repeat
+    )
+    if "error" in result:
+        raise RuntimeError(f"get_historical_weather failed: {result['error']}")
+    record("get_historical_weather", timings, months=years * 12 + 1)
+    return records
+
+
+def load_history(history_path: Path) -> List[dict]:
+    if not history_path.exists():
+        return []
+    with open(history_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def comparison_table(records: List[dict], history: List[dict]) -> str:
+    """This run's best times next to the most recent earlier run of each stage and scale."""
+    previous = {}
+    for entry in history:
+        previous[(entry["scale"], entry["stage"])] = entry
+    lines = [f"{'stage':<28}{'scale':>6}{'best s':>10}{'prev s':>10}{'change':>9}  prev rev"]
+    for entry in records:
+        before = previous.get((entry["scale"], entry["stage"]))
+        if before is None:
+            prev, change, rev = "-", "-", ""
+        else:
+            prev = f"{before['best_s']:.3f}"
+            change = f"{(entry['best_s'] / max(before['best_s'], 1e-9) - 1) * 100:+.0f}%"
+            rev = before.get("git_rev") or ""
+        lines.append(
+            f"{entry['stage']:<28}{entry['scale']:>5}x{entry['best_s']:>10.3f}"
+            f"{prev:>10}{change:>9}  {rev}"
+        )
+    return "\n".join(lines)
+
+
+@app.command()
+def main(
+    scales: Optional[List[int]] = typer.Option(
+        None, "--scale", min=1, help="Data size multiple to run (repeatable). Default 1, 10, 100."
+    ),
+    work_dir: Path = typer.Option(
+        INTERIM_DATA_DIR / "benchmarks", help="Synthetic data, reused between runs."
+    ),
+    history_path: Path = typer.Option(HISTORY_PATH, help="JSON lines file results are added to."),
+    repeat: int = typer.Option(3, min=1, help="Runs of the /plot and weather_app stages."),
+    seed: int = 0,
+    workers: Optional[int] = typer.Option(None, help="Processes generating synthetic data."),
+):
+    scales = scales or DEFAULT_SCALES
+    run = {
+        "run_id": datetime.now().strftime("%Y%m%dT%H%M%S"),
+        "git_rev": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    history = load_history(history_path)
+
+    records = []
+    with stub_server(seed) as stub_url:
+        for scale in scales:
+            records.extend(bench_scale(scale, work_dir, seed, repeat, workers, stub_url))
+
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_path, "a", encoding="utf-8") as f:
+        for entry in records:
+            f.write(json.dumps({**run, **entry}) + "\n")
+
+    logger.info("Benchmark results:\n" + comparison_table(records, history))
+    logger.success(f"Appended {len(records)} results to {history_path}")
+
+
+if __name__ == "__main__":
+    app()
@@ -18,6 +18,10 @@ EXTERNAL_DATA_DIR = DATA_DIR / "external"
 
 MODELS_DIR = PROJ_ROOT / "models"
 
+# The scraper/merger scripts and the CITIES station config live here
+NOTEBOOK_SCRIPTS_DIR = PROJ_ROOT / "notebooks" / "python"
+WEATHER_APP_DIR = PROJ_ROOT / "weather_app"
+
 REPORTS_DIR = PROJ_ROOT / "reports"
 FIGURES_DIR = REPORTS_DIR / "figures"
 
@@ -1,28 +1,368 @@
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+from enum import Enum
 from pathlib import Path
+from typing import List, Optional, Sequence
 
 import typer
 from loguru import logger
 from tqdm import tqdm
 
-from weather_scraping.config import PROCESSED_DATA_DIR, RAW_DATA_DIR
+from weather_scraping.config import (
+    NOTEBOOK_SCRIPTS_DIR,
+    PROCESSED_DATA_DIR,
+    RAW_DATA_DIR,
+    REPORTS_DIR,
+)
+
+# The scrape and merge stages are the scripts in notebooks/python; this module
+# drives them as one pipeline so production can run `make data`.
+sys.path.insert(0, str(NOTEBOOK_SCRIPTS_DIR))
+import gaps  # noqa: E402
+import merger  # noqa: E402
+import raw_archive  # noqa: E402
+import scrape_schedule  # noqa: E402
+import scrape_telemetry  # noqa: E402
+import scraper  # noqa: E402
+import splice  # noqa: E402
 
 app = typer.Typer()
 
+REQUIRED_RAW_COLUMNS = {"Date/Time", "Max Temp (°C)", "Min Temp (°C)"}
+INVALID_SUFFIX = ".invalid"
+
+
+class OutputFormat(str, Enum):
+    csv = "csv"
+    parquet = "parquet"
+
+
+class ThroughputBar:
+    """A file-count progress bar that also reports MB/s over the bytes seen so far."""
+
+    def __init__(self, total: Optional[int], desc: str):
+        self.bar = tqdm(total=total, desc=desc, unit="file")
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+    def update(self, nbytes: int):
+        self.bytes += nbytes
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        self.bar.set_postfix_str(
+            f"{self.bytes / 1e6:.1f} MB, {self.bytes / 1e6 / elapsed:.2f} MB/s", refresh=False
+        )
+        self.bar.update(1)
+
+    def close(self):
+        self.bar.close()
+
+
+def select_cities(names: Optional[List[str]]) -> dict:
+    """Returns the subset of CITIES matching `names` (case-insensitive), or all of them."""
+    if not names:
+        return scraper.CITIES
+    by_lower = {city.lower(): city for city in scraper.CITIES}
+    unknown = [name for name in names if name.lower() not in by_lower]
+    if unknown:
+        raise typer.BadParameter(
+            f"Unknown cities {unknown}. Available: {sorted(scraper.CITIES)}", param_hint="--city"
+        )
+    return {by_lower[name.lower()]: scraper.CITIES[by_lower[name.lower()]] for name in names}
+
+
+def raw_files(raw_dir: Path, cities: dict) -> List[Path]:
+    """Lists the loose raw yearly files (not yet archived) of the selected cities' stations."""
+    paths = []
+    for city_name, stations in cities.items():
+        for station_info in stations:
+            station_dir = raw_dir / f"{city_name}_{station_info['station_name']}"
+            if station_dir.is_dir():
+                paths.extend(sorted(station_dir.glob("*_daily_weather.csv")))
+    return paths
+
+
+def raw_archives(raw_dir: Path, cities: dict) -> List[raw_archive.RawArchive]:
+    """The raw archives of the selected cities' stations that hold at least one year."""
+    archives = []
+    for city_name, stations in cities.items():
+        for station_info in stations:
+            archive = scraper.station_archive(str(raw_dir), city_name, station_info)
+            if archive.years:
+                archives.append(archive)
+    return archives
+
+
+def scrape(
+    cities: dict,
+    start_year,
+    end_year,
+    concurrency: int,
+    raw_dir: Path,
+    overwrite: bool,
+    retries: int = scraper.MAX_RETRIES,
+    metrics_path: Optional[Path] = None,
+    priority: Sequence[str] = scrape_schedule.DEFAULT_PRIORITY,
+    deadlines: Optional[dict] = None,
+):
+    """
+    Downloads all station-years (station-months for hourly stations) in
+    parallel, ordered by the `priority` classes and `deadlines` (see
+    scrape_schedule.py), returning the per-file results.
+    Request metrics go to `metrics_path` as JSON lines and a summary is logged.
+    """
+    work = scraper.build_work_list(cities, start_year, end_year)
+    hourly_work = scraper.build_hourly_work_list(cities, start_year, end_year)
+    logger.info(
+        f"Scraping {len(work)} station-years and {len(hourly_work)} hourly station-months "
+        f"with {concurrency} workers..."
+    )
+    bar = ThroughputBar(total=len(work) + len(hourly_work), desc="scrape")
+    if metrics_path is not None:
+        metrics_path.parent.mkdir(parents=True, exist_ok=True)
+    telemetry = scrape_telemetry.ScrapeTelemetry(metrics_path)
+
+    def on_result(result):
+        if result["status"] in ("error", "no_header"):
+            logger.warning(
+                f"{result['city']} {result['station']} {result['year']}: {result['message']}"
+            )
+        bar.update(result["bytes"])
+
+    try:
+        results = scraper.scrape_all(
+            cities,
+            start_year=start_year,
+            end_year=end_year,
+            max_workers=concurrency,
+            raw_data_dir=str(raw_dir),
+            overwrite=overwrite,
+            on_result=on_result,
+            retries=retries,
+            telemetry=telemetry,
+            priority=priority,
+            deadlines=deadlines,
+        )
+    finally:
+        bar.close()
+        summary = telemetry.close()
+
+    logger.info("Scrape summary:\n" + scrape_telemetry.summary_table(summary))
+    report = scrape_schedule.deadline_report(results, deadlines)
+    logger.info("Priority classes:\n" + scrape_schedule.report_table(report))
+    for name, entry in report.items():
+        if entry["met"] is False:
+            logger.warning(
+                f"{name} finished after {entry['finished_s']:.0f}s, "
+                f"past its {entry['deadline_s']:.0f}s deadline"
+            )
+    if metrics_path is not None:
+        logger.info(f"Scrape metrics written to {metrics_path}")
+    return results
+
+
+def parse_deadlines(specs: Optional[List[str]]) -> dict:
+    """Parses --deadline CLASS=SECONDS options; none given means the default deadlines."""
+    if not specs:
+        return dict(scrape_schedule.DEFAULT_DEADLINES)
+    if specs == ["none"]:
+        return {}
+    deadlines = {}
+    for spec in specs:
+        name, _, seconds = spec.partition("=")
+        if (
+            name not in scrape_schedule.PRIORITY_CLASSES
+            or not seconds.replace(".", "", 1).isdigit()
+        ):
+            raise typer.BadParameter(
+                f"Expected CLASS=SECONDS with CLASS one of "
+                f"{', '.join(scrape_schedule.PRIORITY_CLASSES)}, got {spec!r}",
+                param_hint="--deadline",
+            )
+        deadlines[name] = float(seconds)
+    return deadlines
+
+
+def validate(cities: dict, raw_dir: Path) -> List[str]:
+    """
+    Checks that every raw yearly payload starts with the expected CSV header.
+    Archived years that don't are quarantined in their archive's index and
+    loose files are renamed with an '.invalid' suffix, so the merge step skips
+    them. Returns the rejected payloads.
+    """
+    paths = raw_files(raw_dir, cities)
+    archives = raw_archives(raw_dir, cities)
+    bar = ThroughputBar(
+        total=len(paths) + sum(len(archive.years) for archive in archives), desc="validate"
+    )
+    invalid_members, invalid_paths = [], []
+    try:
+        for archive in archives:
+            for year, payload, nbytes in archive.iter_members():
+                first_line = payload.split(b"\n", 1)[0].decode("utf-8-sig")
+                if not REQUIRED_RAW_COLUMNS.issubset(next(csv.reader([first_line]), [])):
+                    invalid_members.append((archive, year))
+                bar.update(nbytes)
+        for path in paths:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                header = next(csv.reader(f), [])
+            if not REQUIRED_RAW_COLUMNS.issubset(header):
+                invalid_paths.append(path)
+            bar.update(path.stat().st_size)
+    finally:
+        bar.close()
+
+    for archive, year in invalid_members:
+        logger.warning(f"Missing required columns, quarantining {year} in {archive.path}")
+        archive.quarantine(year)
+    for path in invalid_paths:
+        logger.warning(f"Missing required columns, quarantining {path}")
+        os.replace(path, path.with_name(path.name + INVALID_SUFFIX))
+    return [f"{archive.path}#{year}" for archive, year in invalid_members] + [
+        str(path) for path in invalid_paths
+    ]
+
+
+def merge(
+    cities: dict,
+    raw_dir: Path,
+    output_dir: Path,
+    output_format: OutputFormat,
+    splice_priority: Sequence[str] = splice.DEFAULT_SPLICE_PRIORITY,
+    mask_invalid: bool = False,
+    fills: Sequence[str] = gaps.DEFAULT_FILLS,
+    rebuild_records: bool = False,
+):
+    """
+    Runs the merger over the validated raw files, splicing overlapping stations
+    with the `splice_priority` rules. With `mask_invalid`, values failing the
+    merged data's quality checks are set to missing. `fills` are the gap-fill
+    methods for the reports' daily grid. With `rebuild_records`, the per-day
+    records index is rebuilt from the full history instead of updated.
+    """
+    archived = sum(len(archive.years) for archive in raw_archives(raw_dir, cities))
+    bar = ThroughputBar(total=len(raw_files(raw_dir, cities)) + archived, desc="merge")
+    try:
+        return merger.merge_and_clean_data(
+            raw_data_dir=str(raw_dir),
+            processed_data_dir=str(output_dir),
+            cities=cities,
+            output_format=output_format.value,
+            on_file=lambda path, nbytes: bar.update(nbytes),
+            splice_priority=splice_priority,
+            mask_invalid=mask_invalid,
+            fills=fills,
+            rebuild_records=rebuild_records,
+        )
+    finally:
+        bar.close()
+
 
 @app.command()
 def main(
-    # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    input_path: Path = RAW_DATA_DIR / "dataset.csv",
-    output_path: Path = PROCESSED_DATA_DIR / "dataset.csv",
-    # ----------------------------------------------
+    cities: Optional[List[str]] = typer.Option(
+        None, "--city", help="City to process (repeatable). Defaults to every city in CITIES."
+    ),
+    start_year: Optional[int] = typer.Option(None, help="First year to scrape."),
+    end_year: Optional[int] = typer.Option(None, help="Last year to scrape."),
+    concurrency: int = typer.Option(4, min=1, help="Number of parallel download workers."),
+    output_format: OutputFormat = typer.Option(OutputFormat.csv, help="Merged file format."),
+    overwrite: bool = typer.Option(False, help="Re-download files that already exist."),
+    skip_scrape: bool = typer.Option(False, help="Only validate and merge existing raw files."),
+    retries: int = typer.Option(
+        scraper.MAX_RETRIES, min=0, help="Retries per request on connection errors/429/5xx."
+    ),
+    metrics_path: Optional[Path] = typer.Option(
+        None, help="JSON lines file for scrape metrics. Defaults to reports/scrape_runs/."
+    ),
+    priority: Optional[List[str]] = typer.Option(
+        None,
+        "--priority",
+        help="Scrape priority class, highest first (repeatable): "
+        f"{', '.join(scrape_schedule.PRIORITY_CLASSES)}. Defaults to that order.",
+    ),
+    deadline_specs: Optional[List[str]] = typer.Option(
+        None,
+        "--deadline",
+        help="CLASS=SECONDS: run the class first and warn if it isn't done by then "
+        "(repeatable). Defaults to "
+        + ", ".join(f"{k}={v}" for k, v in scrape_schedule.DEFAULT_DEADLINES.items())
+        + "; --deadline none disables it.",
+    ),
+    splice_rules: Optional[List[str]] = typer.Option(
+        None,
+        "--splice-rule",
+        help="Rule for days covered by two stations, in priority order (repeatable): "
+        f"{', '.join(splice.SPLICE_RULES)}. Defaults to "
+        f"{', '.join(splice.DEFAULT_SPLICE_PRIORITY)}.",
+    ),
+    mask_invalid: bool = typer.Option(
+        False, help="Blank out values failing the range/ordering checks in quality_report.csv."
+    ),
+    fill_methods: Optional[List[str]] = typer.Option(
+        None,
+        "--fill",
+        help="Gap fill for the daily grid, in order (repeatable): "
+        f"{', '.join(gaps.FILL_METHODS)}. Defaults to all three.",
+    ),
+    rebuild_records: bool = typer.Option(
+        False, help="Rebuild the per-day records index, e.g. after upstream corrected past days."
+    ),
+    raw_dir: Path = RAW_DATA_DIR,
+    output_dir: Path = PROCESSED_DATA_DIR,
 ):
-    # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    logger.info("Processing dataset...")
-    for i in tqdm(range(10), total=10):
-        if i == 5:
-            logger.info("Something happened for iteration 5.")
-    logger.success("Processing dataset complete.")
-    # -----------------------------------------
+    selected = select_cities(cities)
+    unknown = [rule for rule in splice_rules or [] if rule not in splice.SPLICE_RULES]
+    if unknown:
+        raise typer.BadParameter(f"Unknown splice rule(s): {unknown}", param_hint="--splice-rule")
+    splice_priority = splice_rules or splice.DEFAULT_SPLICE_PRIORITY
+    unknown = [name for name in priority or [] if name not in scrape_schedule.PRIORITY_CLASSES]
+    if unknown:
+        raise typer.BadParameter(f"Unknown priority class(es): {unknown}", param_hint="--priority")
+    deadlines = parse_deadlines(deadline_specs)
+    unknown = [fill for fill in fill_methods or [] if fill not in gaps.FILL_METHODS]
+    if unknown:
+        raise typer.BadParameter(f"Unknown fill method(s): {unknown}", param_hint="--fill")
+    fills = fill_methods or gaps.DEFAULT_FILLS
+    logger.info(f"Processing dataset for {len(selected)} cities: {list(selected)}")
+
+    if not skip_scrape:
+        if metrics_path is None:
+            run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+            metrics_path = REPORTS_DIR / "scrape_runs" / f"scrape_{run_id}.jsonl"
+        scrape(
+            selected,
+            start_year,
+            end_year,
+            concurrency,
+            raw_dir,
+            overwrite,
+            retries,
+            metrics_path,
+            priority or scrape_schedule.DEFAULT_PRIORITY,
+            deadlines,
+        )
+
+    invalid = validate(selected, raw_dir)
+    if invalid:
+        logger.warning(f"{len(invalid)} raw files failed validation and were skipped.")
+
+    output_path = merge(
+        selected,
+        raw_dir,
+        output_dir,
+        output_format,
+        splice_priority,
+        mask_invalid,
+        fills,
+        rebuild_records,
+    )
+    if output_path is None:
+        logger.error("No data was merged.")
+        raise typer.Exit(code=1)
+    logger.success(f"Processing dataset complete: {output_path}")
 
 
 if __name__ == "__main__":
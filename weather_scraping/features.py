@@ -1,28 +1,306 @@
+import sys
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
+import pandas as pd
 import typer
 from loguru import logger
 from tqdm import tqdm
 
-from weather_scraping.config import PROCESSED_DATA_DIR
+from weather_scraping.config import NOTEBOOK_SCRIPTS_DIR, PROCESSED_DATA_DIR
+
+# The merged file's name and format are decided by merger.py's helpers, and
+# calendar days match the ones the merge's quantile sketches are keyed by
+sys.path.insert(0, str(NOTEBOOK_SCRIPTS_DIR))
+from merged_data import merged_data_path  # noqa: E402
+from quantile_sketches import calendar_day  # noqa: E402
 
 app = typer.Typer()
 
+METRIC_COLUMNS = ["Max_Temp_C", "Min_Temp_C", "Mean_Temp_C", "Total_Precip_mm"]
+LAG_DAYS = [1, 2, 3, 7, 14, 365]
+ROLLING_WINDOWS = [7, 30, 90]
+DEGREE_DAY_BASE_C = 18.0
+WET_DAY_THRESHOLD_MM = 0.2
+
+FEATURE_DTYPE = np.float32
+
+
+def feature_columns() -> List[str]:
+    """Names of the model input columns produced by build_city_features, in order."""
+    columns = []
+    for lag in LAG_DAYS:
+        columns.append(f"Mean_Temp_C_lag_{lag}")
+    columns += ["Max_Temp_C_lag_1", "Min_Temp_C_lag_1", "Total_Precip_mm_lag_1"]
+    for window in ROLLING_WINDOWS:
+        columns += [
+            f"Mean_Temp_C_roll_mean_{window}",
+            f"Mean_Temp_C_roll_std_{window}",
+            f"Total_Precip_mm_roll_sum_{window}",
+        ]
+    columns += ["HDD", "CDD", "HDD_roll_sum_30", "CDD_roll_sum_30"]
+    columns += ["Mean_Temp_C_clim", "Mean_Temp_C_anomaly", "Mean_Temp_C_anomaly_roll_mean_7"]
+    columns += ["Dry_Streak_Days", "Wet_Streak_Days"]
+    columns += ["Day_of_Year_sin", "Day_of_Year_cos"]
+    return columns
+
+
+def _streak_lengths(flags: np.ndarray) -> np.ndarray:
+    """Length of the current run of True values ending at each position (0 where False)."""
+    idx = np.arange(len(flags))
+    # Position of the most recent False at or before each index
+    last_break = np.maximum.accumulate(np.where(flags, -1, idx))
+    return np.where(flags, idx - last_break, 0)
+
+
+def doy_climatology(doy: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Mean of `values` per calendar day via bincount, as an array indexed by day number."""
+    valid = ~np.isnan(values)
+    sums = np.bincount(doy[valid], weights=values[valid], minlength=367)
+    counts = np.bincount(doy[valid], minlength=367)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sums / counts
+
+
+def prior_years_climatology(dates: pd.DatetimeIndex, values: np.ndarray) -> np.ndarray:
+    """
+    For each date, the mean of `values` on the same calendar day in earlier
+    years only (NaN in a series' first year), so no row sees its own year or
+    any later one.
+    """
+    doy = calendar_day(dates)
+    years = dates.year.to_numpy() - dates.year.min()
+    valid = ~np.isnan(values)
+    keys = years * 367 + doy
+    n_years = years.max() + 1 if len(years) else 0
+    sums = np.bincount(keys[valid], weights=values[valid], minlength=n_years * 367)
+    counts = np.bincount(keys[valid], minlength=n_years * 367)
+    # Running totals per calendar day, shifted by one year to exclude the current one
+    sums = np.cumsum(sums.reshape(n_years, 367), axis=0) - sums.reshape(n_years, 367)
+    counts = np.cumsum(counts.reshape(n_years, 367), axis=0) - counts.reshape(n_years, 367)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (sums / counts)[years, doy]
+
+
+def build_city_features(
+    city_df: pd.DataFrame,
+    climatology: Optional[np.ndarray] = None,
+    observed_only: bool = True,
+) -> pd.DataFrame:
+    """
+    Computes all features for one city's daily rows.
+
+    Rows are placed on a continuous daily calendar first so lags and rolling
+    windows are measured in days, not rows. Every feature at a date uses
+    observations up to and including that date; the DOY climatology is the
+    mean over earlier years only, unless a precomputed `climatology` array
+    fitted on the training window is given (as done when forecasting past the
+    end of a short recent history). Only dates that had a
+    temperature observation are returned unless `observed_only` is False, in
+    which case every calendar day is.
+    """
+    city = city_df["City"].iloc[0]
+    daily = (
+        city_df.groupby("Date_Time", sort=True)[METRIC_COLUMNS]
+        .mean()
+        .asfreq("D")
+        .astype("float64")
+    )
+    if observed_only:
+        observed = daily[["Max_Temp_C", "Min_Temp_C", "Mean_Temp_C"]].notna().any(axis=1)
+        observed = observed.to_numpy()
+    else:
+        observed = np.ones(len(daily), dtype=bool)
+
+    mean = daily["Mean_Temp_C"]
+    precip = daily["Total_Precip_mm"]
+    out = {}
+
+    for lag in LAG_DAYS:
+        out[f"Mean_Temp_C_lag_{lag}"] = mean.shift(lag)
+    out["Max_Temp_C_lag_1"] = daily["Max_Temp_C"].shift(1)
+    out["Min_Temp_C_lag_1"] = daily["Min_Temp_C"].shift(1)
+    out["Total_Precip_mm_lag_1"] = precip.shift(1)
+
+    for window in ROLLING_WINDOWS:
+        min_periods = max(1, window // 2)
+        rolling_mean = mean.rolling(window, min_periods=min_periods)
+        out[f"Mean_Temp_C_roll_mean_{window}"] = rolling_mean.mean()
+        out[f"Mean_Temp_C_roll_std_{window}"] = rolling_mean.std()
+        out[f"Total_Precip_mm_roll_sum_{window}"] = precip.rolling(
+            window, min_periods=min_periods
+        ).sum()
+
+    hdd = (DEGREE_DAY_BASE_C - mean).clip(lower=0)
+    cdd = (mean - DEGREE_DAY_BASE_C).clip(lower=0)
+    out["HDD"] = hdd
+    out["CDD"] = cdd
+    out["HDD_roll_sum_30"] = hdd.rolling(30, min_periods=15).sum()
+    out["CDD_roll_sum_30"] = cdd.rolling(30, min_periods=15).sum()
+
+    doy = calendar_day(daily.index)
+    if climatology is None:
+        clim_values = prior_years_climatology(daily.index, mean.to_numpy())
+    else:
+        clim_values = climatology[doy]
+    clim = pd.Series(clim_values, index=daily.index)
+    anomaly = mean - clim
+    out["Mean_Temp_C_clim"] = clim
+    out["Mean_Temp_C_anomaly"] = anomaly
+    out["Mean_Temp_C_anomaly_roll_mean_7"] = anomaly.rolling(7, min_periods=4).mean()
+
+    # Missing precipitation breaks both streaks
+    precip_values = precip.to_numpy()
+    has_precip = ~np.isnan(precip_values)
+    out["Dry_Streak_Days"] = _streak_lengths(has_precip & (precip_values < WET_DAY_THRESHOLD_MM))
+    out["Wet_Streak_Days"] = _streak_lengths(has_precip & (precip_values >= WET_DAY_THRESHOLD_MM))
+
+    angle = 2 * np.pi * (doy - 1) / 365.0
+    out["Day_of_Year_sin"] = np.sin(angle)
+    out["Day_of_Year_cos"] = np.cos(angle)
+
+    features = pd.DataFrame(out, index=daily.index)[feature_columns()].astype(FEATURE_DTYPE)
+    result = pd.concat([daily.astype(FEATURE_DTYPE), features], axis=1)[observed]
+    result.index.name = "Date_Time"
+    result = result.reset_index()
+    result.insert(0, "City", city)
+    return result
+
+
+def _iter_chunks(input_path: Path, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Reads the merged daily file in chunks (CSV or Parquet) with compact dtypes."""
+    columns = ["City", "Date_Time"] + METRIC_COLUMNS
+    if input_path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(input_path).iter_batches(
+            batch_size=chunksize, columns=columns
+        ):
+            yield batch.to_pandas()
+    else:
+        dtypes = {col: "float32" for col in METRIC_COLUMNS}
+        yield from pd.read_csv(
+            input_path,
+            usecols=columns,
+            dtype=dtypes,
+            parse_dates=["Date_Time"],
+            chunksize=chunksize,
+        )
+
+
+def iter_city_partitions(
+    input_path: Path, chunksize: int = 200_000
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    Streams (city, rows) partitions from the merged daily file.
+
+    The merger writes each city's rows contiguously, so only the city currently
+    being read is buffered and memory stays bounded by the largest city.
+    """
+    finished = set()
+    current, buffered = None, []
+    for chunk in _iter_chunks(input_path, chunksize):
+        chunk = chunk.dropna(subset=["City", "Date_Time"])
+        cities = chunk["City"].to_numpy()
+        # Split the chunk wherever the city changes
+        boundaries = np.flatnonzero(cities[1:] != cities[:-1]) + 1
+        for piece in np.split(np.arange(len(chunk)), boundaries):
+            if len(piece) == 0:
+                continue
+            city = cities[piece[0]]
+            if city != current:
+                if current is not None:
+                    finished.add(current)
+                    yield current, pd.concat(buffered, ignore_index=True)
+                if city in finished:
+                    raise ValueError(
+                        f"Rows for '{city}' are not contiguous in {input_path}; "
+                        "re-run the merger or sort the file by City."
+                    )
+                current, buffered = city, []
+            buffered.append(chunk.iloc[piece])
+    if current is not None:
+        yield current, pd.concat(buffered, ignore_index=True)
+
+
+def write_features(input_path: Path, output_path: Path, chunksize: int = 200_000) -> int:
+    """Builds features city by city and appends each partition to a Parquet file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    writer = None
+    total_rows = 0
+    try:
+        for city, rows in tqdm(iter_city_partitions(input_path, chunksize), unit="city"):
+            features = build_city_features(rows)
+            table = pa.Table.from_pandas(features, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema, compression="zstd")
+            # One row group per city lets readers load a single city cheaply
+            writer.write_table(table.cast(writer.schema), row_group_size=max(len(table), 1))
+            total_rows += len(features)
+            logger.info(f"{city}: {len(features)} rows")
+    finally:
+        if writer is not None:
+            writer.close()
+    return total_rows
+
+
+def city_row_groups(features_path: Path) -> Dict[str, int]:
+    """Maps each city to its row group in a features file, using the Parquet statistics."""
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(features_path).metadata
+    city_index = metadata.schema.to_arrow_schema().get_field_index("City")
+    groups = {}
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(city_index).statistics
+        groups[stats.min] = i
+    return groups
+
+
+def read_city_features(
+    features_path: Path, city: str, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """Loads a single city's rows from a features file without reading the others."""
+    import pyarrow.parquet as pq
+
+    groups = city_row_groups(features_path)
+    if city not in groups:
+        raise KeyError(f"No features for city '{city}' in {features_path}")
+    return pq.ParquetFile(features_path).read_row_group(groups[city], columns=columns).to_pandas()
+
+
+def iter_feature_partitions(
+    features_path: Path, columns: Optional[List[str]] = None
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Yields (city, rows) for each city row group of a features file, one at a time."""
+    import pyarrow.parquet as pq
+
+    if columns is not None and "City" not in columns:
+        columns = ["City"] + list(columns)
+    parquet_file = pq.ParquetFile(features_path)
+    for i in range(parquet_file.num_row_groups):
+        frame = parquet_file.read_row_group(i, columns=columns).to_pandas()
+        if not frame.empty:
+            yield frame["City"].iloc[0], frame
+
 
 @app.command()
 def main(
-    # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    input_path: Path = PROCESSED_DATA_DIR / "dataset.csv",
-    output_path: Path = PROCESSED_DATA_DIR / "features.csv",
-    # -----------------------------------------
+    input_path: Optional[Path] = typer.Option(
+        None, help="Merged daily file. Defaults to the newest all_cities_weather_data.*"
+    ),
+    output_path: Path = PROCESSED_DATA_DIR / "features.parquet",
+    chunksize: int = typer.Option(200_000, help="Rows read from the input per chunk."),
 ):
-    # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    logger.info("Generating features from dataset...")
-    for i in tqdm(range(10), total=10):
-        if i == 5:
-            logger.info("Something happened for iteration 5.")
-    logger.success("Features generation complete.")
-    # -----------------------------------------
+    if input_path is None:
+        input_path = Path(merged_data_path(PROCESSED_DATA_DIR))
+    logger.info(f"Generating features from {input_path}...")
+    total_rows = write_features(input_path, output_path, chunksize)
+    logger.success(f"Features generation complete: {total_rows} rows written to {output_path}")
 
 
 if __name__ == "__main__":
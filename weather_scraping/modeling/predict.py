@@ -1,29 +1,228 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional
 
+import joblib
+import numpy as np
+import pandas as pd
 import typer
 from loguru import logger
 from tqdm import tqdm
 
 from weather_scraping.config import MODELS_DIR, PROCESSED_DATA_DIR
+from weather_scraping.features import (
+    LAG_DAYS,
+    METRIC_COLUMNS,
+    ROLLING_WINDOWS,
+    build_city_features,
+    calendar_day,
+    city_row_groups,
+    doy_climatology,
+    read_city_features,
+)
+from weather_scraping.modeling.train import TrainMode, scale_features
 
 app = typer.Typer()
 
+# Enough trailing days to recompute every lag and rolling window for a new day
+HISTORY_DAYS = max(LAG_DAYS + ROLLING_WINDOWS) + 1
+
+
+def load_model(model_path: Path) -> dict:
+    """Loads a model bundle, memory-mapping its numpy arrays read-only where possible."""
+    return joblib.load(model_path, mmap_mode="r")
+
+
+def predict_frame(bundle: dict, city: str, frame: pd.DataFrame) -> np.ndarray:
+    """Scores a city's feature rows with the bundle's global or per-city model."""
+    X = frame[bundle["features"]].to_numpy(dtype=np.float32)
+    if bundle["kind"] == TrainMode.per_city.value:
+        model = bundle["models"].get(city)
+        if model is None:
+            return np.full(len(X), np.nan, dtype=np.float32)
+    else:
+        X = scale_features(bundle["scaler"], X)
+        model = bundle["model"]
+    return model.predict(X).astype(np.float32)
+
+
+class Predictor:
+    """
+    In-process predictor for the web apps.
+
+    The model is loaded once. For each city, the last HISTORY_DAYS of observed
+    metrics and the full-history day-of-year climatology are cached on first
+    use, so a "next N days" forecast only recomputes features over that short
+    window for each step instead of reading the features file again.
+    """
+
+    def __init__(
+        self,
+        model_path: Path = MODELS_DIR / "model.pkl",
+        features_path: Path = PROCESSED_DATA_DIR / "features.parquet",
+    ):
+        self.bundle = load_model(model_path)
+        self.features_path = features_path
+        self._state: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cities(self) -> List[str]:
+        return sorted(city_row_groups(self.features_path))
+
+    def _city_state(self, city: str) -> tuple:
+        state = self._state.get(city)
+        if state is None:
+            frame = read_city_features(
+                self.features_path, city, columns=["City", "Date_Time"] + METRIC_COLUMNS
+            )
+            dates = pd.DatetimeIndex(frame["Date_Time"])
+            climatology = doy_climatology(
+                calendar_day(dates), frame["Mean_Temp_C"].to_numpy(dtype="float64")
+            )
+            cutoff = dates.max() - pd.Timedelta(days=HISTORY_DAYS)
+            history = frame[frame["Date_Time"] > cutoff].reset_index(drop=True)
+            state = (history, climatology)
+            with self._lock:
+                self._state[city] = state
+        return state
+
+    def invalidate(self, city: Optional[str] = None):
+        """Drops cached state for one city (or all), e.g. after the data is refreshed."""
+        with self._lock:
+            if city is None:
+                self._state.clear()
+            else:
+                self._state.pop(city, None)
+
+    def forecast(self, city: str, days: int = 7) -> List[dict]:
+        """
+        Predicts the target for the `days` days after the last observation.
+        Each prediction is fed back into the history before the next step; the
+        metrics the model doesn't predict are left missing for future days.
+        """
+        if self.bundle["horizon"] != 1:
+            raise ValueError("Multi-day forecasts need a model trained with --horizon 1")
+        target = self.bundle["target"]
+        history, climatology = self._city_state(city)
+        history = history.copy()
+
+        forecasts = []
+        for _ in range(days):
+            # Fed-back days only have the target filled, so with a precipitation
+            # target they must not be dropped as unobserved
+            features = build_city_features(
+                history, climatology=climatology, observed_only=False
+            ).iloc[[-1]]
+            value = float(predict_frame(self.bundle, city, features)[0])
+            next_date = history["Date_Time"].iloc[-1] + pd.Timedelta(days=1)
+            forecasts.append({"date": next_date.strftime("%Y-%m-%d"), target: round(value, 1)})
+
+            next_row = {
+                "City": city,
+                "Date_Time": next_date,
+                **{m: np.nan for m in METRIC_COLUMNS},
+            }
+            next_row[target] = value
+            history = pd.concat([history.iloc[1:], pd.DataFrame([next_row])], ignore_index=True)
+        return forecasts
+
+
+_worker_bundle = None
+
+
+def _init_worker(model_path: Path):
+    global _worker_bundle
+    _worker_bundle = load_model(model_path)
+
+
+def _score_city(task: tuple) -> pd.DataFrame:
+    features_path, city, chunk_size = task
+    frame = read_city_features(
+        features_path, city, columns=["City", "Date_Time"] + _worker_bundle["features"]
+    )
+    predictions = np.empty(len(frame), dtype=np.float32)
+    for start in range(0, len(frame), chunk_size):
+        stop = start + chunk_size
+        predictions[start:stop] = predict_frame(_worker_bundle, city, frame.iloc[start:stop])
+    horizon = pd.Timedelta(days=_worker_bundle["horizon"])
+    return pd.DataFrame(
+        {
+            "City": city,
+            "Date_Time": frame["Date_Time"],
+            "Target_Date": frame["Date_Time"] + horizon,
+            f"Predicted_{_worker_bundle['target']}": predictions,
+        }
+    )
+
+
+def predict_batch(
+    features_path: Path,
+    model_path: Path,
+    predictions_path: Path,
+    workers: Optional[int] = None,
+    chunk_size: int = 50_000,
+) -> int:
+    """Scores every city in the features file across worker processes."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tasks = [(features_path, city, chunk_size) for city in city_row_groups(features_path)]
+    predictions_path.parent.mkdir(parents=True, exist_ok=True)
+    writer, csv_file, total_rows = None, None, 0
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(model_path,)
+        ) as pool:
+            for scored in tqdm(pool.map(_score_city, tasks), total=len(tasks), unit="city"):
+                total_rows += len(scored)
+                if predictions_path.suffix == ".parquet":
+                    table = pa.Table.from_pandas(scored, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(predictions_path, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                else:
+                    # Appended city by city like the Parquet row groups; header once
+                    header = csv_file is None
+                    if header:
+                        csv_file = open(predictions_path, "w", newline="")
+                    scored.to_csv(csv_file, index=False, header=header)
+    finally:
+        if writer is not None:
+            writer.close()
+        if csv_file is not None:
+            csv_file.close()
+    return total_rows
+
 
 @app.command()
 def main(
-    # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    features_path: Path = PROCESSED_DATA_DIR / "test_features.csv",
+    features_path: Path = PROCESSED_DATA_DIR / "features.parquet",
     model_path: Path = MODELS_DIR / "model.pkl",
-    predictions_path: Path = PROCESSED_DATA_DIR / "test_predictions.csv",
-    # -----------------------------------------
+    predictions_path: Path = PROCESSED_DATA_DIR / "predictions.parquet",
+    workers: Optional[int] = typer.Option(None, help="Worker processes for batch scoring."),
+    chunk_size: int = typer.Option(50_000, min=1, help="Rows scored per model call."),
+    city: Optional[str] = typer.Option(None, help="Forecast a single city instead of batch."),
+    days: int = typer.Option(7, min=1, help="Days to forecast with --city."),
 ):
-    # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    logger.info("Performing inference for model...")
-    for i in tqdm(range(10), total=10):
-        if i == 5:
-            logger.info("Something happened for iteration 5.")
-    logger.success("Inference complete.")
-    # -----------------------------------------
+    if city is not None:
+        predictor = Predictor(model_path, features_path)
+        started = time.perf_counter()
+        for row in predictor.forecast(city, days):
+            logger.info(row)
+        logger.success(f"Forecast for {city} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return
+
+    logger.info("Performing batch inference for model...")
+    started = time.perf_counter()
+    total_rows = predict_batch(features_path, model_path, predictions_path, workers, chunk_size)
+    elapsed = time.perf_counter() - started
+    logger.success(
+        f"Inference complete: {total_rows} rows in {elapsed:.1f}s "
+        f"({total_rows / max(elapsed, 1e-9):,.0f} rows/s) -> {predictions_path}"
+    )
 
 
 if __name__ == "__main__":
@@ -1,29 +1,181 @@
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
 from pathlib import Path
+from typing import List, Optional, Tuple
 
+import joblib
+import numpy as np
+import pandas as pd
 import typer
 from loguru import logger
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
 from tqdm import tqdm
 
 from weather_scraping.config import MODELS_DIR, PROCESSED_DATA_DIR
+from weather_scraping.features import (
+    city_row_groups,
+    feature_columns,
+    iter_feature_partitions,
+    read_city_features,
+)
 
 app = typer.Typer()
 
 
+class TrainMode(str, Enum):
+    global_sgd = "global"
+    per_city = "per-city"
+
+
+def peak_rss_mb(include_children: bool = False) -> float:
+    """Peak resident set size of this process (or its finished children) in MB."""
+    who = resource.RUSAGE_CHILDREN if include_children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is reported in KB on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_labels(frame: pd.DataFrame, target: str, horizon: int) -> np.ndarray:
+    """The target observed `horizon` days after each row's date (NaN where not observed)."""
+    series = pd.Series(frame[target].to_numpy(), index=frame["Date_Time"])
+    ahead = frame["Date_Time"] + pd.Timedelta(days=horizon)
+    return series.reindex(ahead).to_numpy(dtype=np.float32)
+
+
+def training_arrays(
+    frame: pd.DataFrame, features: List[str], target: str, horizon: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """float32 feature matrix and labels for the rows that have a label."""
+    X = frame[features].to_numpy(dtype=np.float32)
+    y = make_labels(frame, target, horizon)
+    keep = ~np.isnan(y)
+    return X[keep], y[keep]
+
+
+def scale_features(scaler: StandardScaler, X: np.ndarray) -> np.ndarray:
+    """Standardizes X and imputes missing values with the feature mean (0 after scaling)."""
+    X = scaler.transform(X).astype(np.float32, copy=False)
+    X[np.isnan(X)] = 0.0
+    return X
+
+
+def train_global(
+    features_path: Path,
+    features: List[str],
+    target: str,
+    horizon: int,
+    batch_size: int,
+    epochs: int,
+    seed: int,
+) -> Tuple[dict, int]:
+    """
+    Trains one SGD model across all cities, streaming one city partition at a
+    time. A first pass fits the scaler; each epoch then feeds shuffled
+    mini-batches to partial_fit, so only one partition is ever in memory.
+    """
+    columns = ["Date_Time", target] + features
+    scaler = StandardScaler()
+    for _, frame in tqdm(
+        iter_feature_partitions(features_path, columns), desc="scale", unit="city"
+    ):
+        X, _ = training_arrays(frame, features, target, horizon)
+        if len(X):
+            scaler.partial_fit(X)
+
+    model = SGDRegressor(alpha=1e-4, learning_rate="adaptive", eta0=0.01, random_state=seed)
+    rng = np.random.default_rng(seed)
+    rows_seen = 0
+    for epoch in range(epochs):
+        partitions = iter_feature_partitions(features_path, columns)
+        for _, frame in tqdm(partitions, desc=f"epoch {epoch + 1}/{epochs}", unit="city"):
+            X, y = training_arrays(frame, features, target, horizon)
+            if not len(y):
+                continue
+            X = scale_features(scaler, X)
+            order = rng.permutation(len(y))
+            for start in range(0, len(y), batch_size):
+                stop = start + batch_size
+                model.partial_fit(X[order[start:stop]], y[order[start:stop]])
+            rows_seen += len(y)
+
+    return {"kind": TrainMode.global_sgd.value, "scaler": scaler, "model": model}, rows_seen
+
+
+def _fit_city(task: tuple) -> Tuple[str, HistGradientBoostingRegressor, int]:
+    features_path, city, features, target, horizon, max_iter, seed = task
+    frame = read_city_features(features_path, city, columns=["Date_Time", target] + features)
+    X, y = training_arrays(frame, features, target, horizon)
+    # Gradient boosting handles the NaN lags/rolls natively, so no imputation here
+    model = HistGradientBoostingRegressor(max_iter=max_iter, random_state=seed)
+    model.fit(X, y)
+    return city, model, len(y)
+
+
+def train_per_city(
+    features_path: Path,
+    features: List[str],
+    target: str,
+    horizon: int,
+    max_iter: int,
+    workers: Optional[int],
+    seed: int,
+) -> Tuple[dict, int]:
+    """Trains one gradient boosting model per city in a process pool."""
+    cities = list(city_row_groups(features_path))
+    tasks = [(features_path, city, features, target, horizon, max_iter, seed) for city in cities]
+    models = {}
+    rows_seen = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for city, model, n_rows in tqdm(
+            pool.map(_fit_city, tasks), total=len(tasks), desc="fit", unit="city"
+        ):
+            models[city] = model
+            rows_seen += n_rows
+            logger.info(f"{city}: trained on {n_rows} rows")
+    return {"kind": TrainMode.per_city.value, "models": models}, rows_seen
+
+
 @app.command()
 def main(
-    # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    features_path: Path = PROCESSED_DATA_DIR / "features.csv",
-    labels_path: Path = PROCESSED_DATA_DIR / "labels.csv",
+    features_path: Path = PROCESSED_DATA_DIR / "features.parquet",
     model_path: Path = MODELS_DIR / "model.pkl",
-    # -----------------------------------------
+    mode: TrainMode = typer.Option(TrainMode.per_city, help="One global model or one per city."),
+    target: str = typer.Option("Mean_Temp_C", help="Column to predict."),
+    horizon: int = typer.Option(1, min=1, help="Days ahead to predict."),
+    batch_size: int = typer.Option(10_000, min=1, help="Mini-batch rows (global mode)."),
+    epochs: int = typer.Option(3, min=1, help="Passes over the data (global mode)."),
+    max_iter: int = typer.Option(200, min=1, help="Boosting iterations (per-city mode)."),
+    workers: Optional[int] = typer.Option(None, help="Worker processes (per-city mode)."),
+    seed: int = 0,
 ):
-    # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    logger.info("Training some model...")
-    for i in tqdm(range(10), total=10):
-        if i == 5:
-            logger.info("Something happened for iteration 5.")
-    logger.success("Modeling training complete.")
-    # -----------------------------------------
+    logger.info(f"Training {mode.value} model for {target} at +{horizon} day(s)...")
+    features = feature_columns()
+    started = time.perf_counter()
+
+    if mode is TrainMode.global_sgd:
+        bundle, rows_seen = train_global(
+            features_path, features, target, horizon, batch_size, epochs, seed
+        )
+    else:
+        bundle, rows_seen = train_per_city(
+            features_path, features, target, horizon, max_iter, workers, seed
+        )
+
+    elapsed = time.perf_counter() - started
+    bundle.update({"features": features, "target": target, "horizon": horizon})
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(bundle, model_path)
+
+    logger.info(
+        f"{rows_seen} rows in {elapsed:.1f}s ({rows_seen / max(elapsed, 1e-9):,.0f} rows/s); "
+        f"peak RSS {peak_rss_mb():.0f} MB (workers {peak_rss_mb(include_children=True):.0f} MB)"
+    )
+    logger.success(f"Modeling training complete: {model_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+import sys
+from enum import Enum
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from weather_scraping.config import NOTEBOOK_SCRIPTS_DIR, PROCESSED_DATA_DIR
+
+# SQL over the SQLite store written by merger.py (see query_store.py), e.g.
+#   weather-query "SELECT City, MAX(Max_Temp_C) FROM daily WHERE Year = 2021 GROUP BY City"
+sys.path.insert(0, str(NOTEBOOK_SCRIPTS_DIR))
+import query_store  # noqa: E402
+
+app = typer.Typer()
+
+
+class OutputFormat(str, Enum):
+    table = "table"
+    csv = "csv"
+    json = "json"
+
+
+@app.command()
+def main(
+    sql: str = typer.Argument(..., help="Query to run; the daily rows are in the `daily` table."),
+    params: Optional[List[str]] = typer.Option(
+        None, "--param", "-p", help="Value for the next ? placeholder (repeatable)."
+    ),
+    output_format: OutputFormat = typer.Option(OutputFormat.table, "--format"),
+    max_rows: int = typer.Option(50, help="Rows to print in table format (0 for all)."),
+    processed_dir: Path = typer.Option(
+        PROCESSED_DATA_DIR, help="Directory holding weather.sqlite."
+    ),
+):
+    """Runs a read-only SQL query against the processed data and prints the result."""
+    try:
+        result = query_store.query(sql, tuple(params or ()), str(processed_dir))
+    except FileNotFoundError as e:
+        logger.error(f"{e.filename} not found; run `make data` to build it")
+        raise typer.Exit(1)
+    except pd.errors.DatabaseError as e:
+        logger.error(f"Query failed: {e}")
+        raise typer.Exit(1)
+
+    if output_format == OutputFormat.csv:
+        typer.echo(result.to_csv(index=False), nl=False)
+    elif output_format == OutputFormat.json:
+        typer.echo(result.to_json(orient="records", date_format="iso"))
+    else:
+        shown = result if max_rows <= 0 else result.head(max_rows)
+        typer.echo(shown.to_string(index=False))
+        if len(shown) < len(result):
+            logger.info(f"Showing {len(shown)} of {len(result)} rows; use --max-rows 0 for all")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,99 @@
+# Request latency instrumentation shared by the Flask apps (notebooks/python/webapp.py
+# and weather_app/app.py).
+#
+# instrument(app, name) times every request per endpoint. Inside a view, each
+# stage can be wrapped in `with phase("name"):` to time it separately; a phase
+# entered several times in one request (e.g. once per city) is summed. The
+# timings are exported as Prometheus histograms on /metrics and, if enabled,
+# sent back in a Server-Timing header so browser dev tools show the breakdown.
+#
+# Configuration (environment variables):
+#   WEATHER_SERVER_TIMING    - set to 1 to add Server-Timing headers (default off)
+#   PROMETHEUS_MULTIPROC_DIR - set when running several worker processes (e.g.
+#                              gunicorn) so /metrics reports all of them
+
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+SERVER_TIMING = os.environ.get("WEATHER_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+# From 1 ms (cached plots) up to 30 s (cold upstream fetches)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_SECONDS = Histogram(
+    "weather_request_seconds",
+    "End-to-end request latency.",
+    ["app", "endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+PHASE_SECONDS = Histogram(
+    "weather_request_phase_seconds",
+    "Time spent in each phase of a request.",
+    ["app", "endpoint", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+@contextmanager
+def phase(name):
+    """Times a block as part of the current request. Does nothing outside a request."""
+    if not has_request_context() or "request_phases" not in g:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = g.request_phases
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def metrics_response():
+    """The Prometheus text exposition of all request metrics."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        payload = generate_latest(registry)
+    else:
+        payload = generate_latest()
+    return Response(payload, content_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app, app_name):
+    """Registers the timing hooks and the /metrics endpoint on a Flask app."""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.request_phases = {}
+
+    @app.after_request
+    def record_timing(response):
+        if "request_started" not in g or request.endpoint == "metrics":
+            return response
+        total = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or "unknown"
+        status = response.status_code
+        REQUEST_SECONDS.labels(app_name, endpoint, request.method, status).observe(total)
+        phases = g.request_phases
+        for name, seconds in phases.items():
+            PHASE_SECONDS.labels(app_name, endpoint, name).observe(seconds)
+
+        if SERVER_TIMING:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items()]
+            entries.append(f"total;dur={total * 1000:.1f}")
+            response.headers["Server-Timing"] = ", ".join(entries)
+        return response
+
+    app.add_url_rule("/metrics", "metrics", metrics_response)
+    return app
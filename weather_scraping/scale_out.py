@@ -0,0 +1,346 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from weather_scraping.config import (
+    EXTERNAL_DATA_DIR,
+    INTERIM_DATA_DIR,
+    NOTEBOOK_SCRIPTS_DIR,
+    PROCESSED_DATA_DIR,
+    RAW_DATA_DIR,
+)
+
+# Each work unit is one station: it is scraped and merged by the same scripts
+# as the regular pipeline, then written to its own shard, so a worker only
+# ever holds one station in memory however many stations are queued.
+sys.path.insert(0, str(NOTEBOOK_SCRIPTS_DIR))
+from merged_data import atomic_write  # noqa: E402
+import merger  # noqa: E402
+import scraper  # noqa: E402
+from config import CITIES  # noqa: E402
+
+app = typer.Typer()
+
+QUEUE_PATH = INTERIM_DATA_DIR / "scale_out" / "queue.sqlite"
+SHARDS_DIR = PROCESSED_DATA_DIR / "shards"
+INVENTORY_STORE = EXTERNAL_DATA_DIR / "station_inventory.parquet"
+# A claimed unit goes back to the queue if its worker hasn't finished it by then
+LEASE_SECONDS = 3600
+MAX_ATTEMPTS = 3
+
+
+class WorkQueue:
+    """
+    A work queue in a SQLite file shared by every worker process on a host (or
+    on hosts sharing a filesystem whose file locks work, e.g. NFS with lockd).
+    Claims happen in BEGIN IMMEDIATE transactions, so each unit goes to
+    exactly one worker, and a unit whose lease runs out is handed to the next
+    worker that asks.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # WAL needs a shared-memory index that hosts can't share, so stay on
+        # the rollback journal (and switch back queues created in WAL mode)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS units (
+                unit_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_expires REAL,
+                updated REAL,
+                message TEXT
+            )
+            """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS units_state ON units (state)")
+
+    def enqueue(self, units: Iterable[Tuple[str, dict]]) -> int:
+        """Adds (unit_id, payload) units, skipping IDs already queued. Returns how many were new."""
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO units (unit_id, payload, updated) VALUES (?, ?, ?)",
+                ((unit_id, json.dumps(payload), time.time()) for unit_id, payload in units),
+            )
+        return self.conn.total_changes - before
+
+    def claim(
+        self, worker: str, lease_s: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS
+    ) -> Optional[Tuple[str, dict]]:
+        """
+        The next pending (or lease-expired) unit, now leased to `worker`, or
+        None. A unit whose lease ran out after max_attempts claims is marked
+        failed instead: its worker died without calling fail(), e.g. when the
+        unit got it killed, so handing it out again would never end.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "UPDATE units SET state = 'failed', lease_expires = NULL, updated = ?,"
+                " message = 'lease expired ' || attempts || ' times; worker presumed killed'"
+                " WHERE state = 'claimed' AND lease_expires < ? AND attempts >= ?",
+                (now, now, max_attempts),
+            )
+            row = self.conn.execute(
+                "SELECT unit_id, payload FROM units WHERE state = 'pending'"
+                " OR (state = 'claimed' AND lease_expires < ? AND attempts < ?)"
+                " ORDER BY rowid LIMIT 1",
+                (now, max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE units SET state = 'claimed', worker = ?, attempts = attempts + 1,"
+                " lease_expires = ?, updated = ? WHERE unit_id = ?",
+                (worker, now + lease_s, now, row[0]),
+            )
+        return row[0], json.loads(row[1])
+
+    def complete(self, unit_id: str, worker: str, message: str = "") -> bool:
+        """
+        Marks the unit done if `worker` still holds it. Returns False when the
+        lease expired and another worker claimed the unit in the meantime.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE units SET state = 'done', lease_expires = NULL, updated = ?, message = ?"
+                " WHERE unit_id = ? AND worker = ? AND state = 'claimed'",
+                (time.time(), message, unit_id, worker),
+            )
+        return cursor.rowcount > 0
+
+    def fail(
+        self, unit_id: str, worker: str, message: str, max_attempts: int = MAX_ATTEMPTS
+    ) -> bool:
+        """
+        Puts the unit back in the queue, or marks it failed after max_attempts,
+        if `worker` still holds it. Returns False otherwise, like complete().
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " lease_expires = NULL, updated = ?, message = ?"
+                " WHERE unit_id = ? AND worker = ? AND state = 'claimed'",
+                (max_attempts, time.time(), message, unit_id, worker),
+            )
+        return cursor.rowcount > 0
+
+    def counts(self) -> dict:
+        rows = self.conn.execute("SELECT state, COUNT(*) FROM units GROUP BY state")
+        return dict(rows.fetchall())
+
+    def failures(self) -> List[Tuple[str, str]]:
+        rows = self.conn.execute("SELECT unit_id, message FROM units WHERE state = 'failed'")
+        return rows.fetchall()
+
+    def retry_failed(self) -> int:
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE units SET state = 'pending', attempts = 0 WHERE state = 'failed'"
+            )
+        return cursor.rowcount
+
+
+def config_units(cities: dict) -> List[Tuple[str, dict]]:
+    """One unit per station in a CITIES-style dict."""
+    return [
+        (f"{city_name}|{station_info['station_id']}", {"city": city_name, "station": station_info})
+        for city_name, stations in cities.items()
+        for station_info in stations
+    ]
+
+
+def inventory_units(store_path: Path, provinces: Optional[List[str]] = None) -> List[tuple]:
+    """
+    One unit per station with daily data in the ingested station inventory
+    (see station_inventory.py). Each station is its own "city", named like
+    config.py's station names.
+    """
+    import station_inventory
+
+    stations = pd.read_parquet(store_path)
+    stations = stations.dropna(subset=["daily_first_year", "daily_last_year"])
+    if provinces:
+        stations = stations[stations["province"].str.upper().isin([p.upper() for p in provinces])]
+    units = []
+    for row in stations.itertuples():
+        name = station_inventory.config_station_name(row.name)
+        station_info = {
+            "station_id": int(row.station_id),
+            "station_name": name,
+            "start_year": int(row.daily_first_year),
+            "end_year": int(row.daily_last_year),
+            "data_type": "daily",
+        }
+        units.append((f"{name}|{row.station_id}", {"city": name, "station": station_info}))
+    return units
+
+
+def shard_path(shards_dir: Path, city_name: str, station_id: int) -> Path:
+    return shards_dir / city_name.replace(os.sep, "_") / f"{station_id}.parquet"
+
+
+def process_unit(payload: dict, raw_dir: Path, shards_dir: Path, options: dict) -> str:
+    """
+    Scrapes one station's years, merges its raw files and writes its shard.
+    Returns a short summary for the queue.
+    """
+    city_name, station_info = payload["city"], payload["station"]
+    results = scraper.scrape_all(
+        {city_name: [station_info]},
+        start_year=options["start_year"],
+        end_year=options["end_year"],
+        raw_data_dir=str(raw_dir),
+        overwrite=options["overwrite"],
+        delay=options["delay"],
+        retries=options["retries"],
+    )
+    errors = [result for result in results if result["status"] == "error"]
+    if errors:
+        raise RuntimeError(f"{len(errors)} downloads failed, first: {errors[0]['message']}")
+
+    frames = merger.read_station_frames(str(raw_dir), city_name, station_info)
+    if not frames:
+        return f"{len(results)} files, no data"
+    station_df = merger.clean_merged_data(pd.concat(frames, ignore_index=True))
+
+    path = shard_path(shards_dir, city_name, station_info["station_id"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path) as tmp_path:
+        station_df.to_parquet(tmp_path, index=False)
+    return f"{len(results)} files, {len(station_df)} rows"
+
+
+def run_worker(queue_path: Path, worker: str, raw_dir: Path, shards_dir: Path, options: dict):
+    """Processes units until the queue has nothing left to claim. Returns units completed."""
+    queue = WorkQueue(queue_path)
+    completed = 0
+    while True:
+        claimed = queue.claim(worker, options["lease"])
+        if claimed is None:
+            return completed
+        unit_id, payload = claimed
+        started = time.perf_counter()
+        try:
+            # Scraper/merger progress prints are per file; keep worker logs to one line per unit
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                message = process_unit(payload, raw_dir, shards_dir, options)
+        except Exception as e:
+            if queue.fail(unit_id, worker, str(e)):
+                logger.warning(f"[{worker}] {unit_id} failed: {e}")
+            else:
+                logger.warning(f"[{worker}] {unit_id} failed after its lease was reclaimed: {e}")
+            continue
+        if not queue.complete(unit_id, worker, message):
+            logger.warning(f"[{worker}] {unit_id} finished after its lease was reclaimed")
+            continue
+        completed += 1
+        logger.info(f"[{worker}] {unit_id}: {message} in {time.perf_counter() - started:.1f}s")
+
+
+@app.command()
+def plan(
+    source: str = typer.Option(
+        "config", help="Where stations come from: 'config' or 'inventory'."
+    ),
+    cities: Optional[List[str]] = typer.Option(
+        None, "--city", help="City from CITIES (repeatable). Defaults to all of them."
+    ),
+    provinces: Optional[List[str]] = typer.Option(
+        None, "--province", help="Inventory province to include (repeatable). Defaults to all."
+    ),
+    inventory_store: Path = typer.Option(INVENTORY_STORE, help="Ingested station inventory."),
+    queue_path: Path = typer.Option(QUEUE_PATH, help="SQLite work queue shared by the workers."),
+):
+    """Adds one work unit per station to the queue."""
+    if source == "config":
+        selected = {name: CITIES[name] for name in cities} if cities else CITIES
+        units = config_units(selected)
+    elif source == "inventory":
+        units = inventory_units(inventory_store, provinces)
+    else:
+        raise typer.BadParameter("must be 'config' or 'inventory'", param_hint="--source")
+    added = WorkQueue(queue_path).enqueue(units)
+    logger.success(f"Queued {added} new stations ({len(units) - added} already queued)")
+
+
+@app.command()
+def work(
+    workers: int = typer.Option(4, min=1, help="Worker processes to run on this host."),
+    start_year: Optional[int] = typer.Option(None, help="First year to scrape."),
+    end_year: Optional[int] = typer.Option(None, help="Last year to scrape."),
+    overwrite: bool = typer.Option(False, help="Re-download files that already exist."),
+    delay: float = typer.Option(
+        scraper.DELAY_BETWEEN_REQUESTS, help="Seconds each worker waits between requests."
+    ),
+    retries: int = typer.Option(scraper.MAX_RETRIES, min=0, help="Retries per request."),
+    lease: float = typer.Option(LEASE_SECONDS, help="Seconds before a claimed unit is retried."),
+    queue_path: Path = typer.Option(QUEUE_PATH, help="SQLite work queue shared by the workers."),
+    raw_dir: Path = RAW_DATA_DIR,
+    shards_dir: Path = SHARDS_DIR,
+):
+    """
+    Runs worker processes until the queue is drained. Start it on more hosts
+    sharing the queue and data directories to add workers.
+    """
+    options = {
+        "start_year": start_year,
+        "end_year": end_year,
+        "overwrite": overwrite,
+        "delay": delay,
+        "retries": retries,
+        "lease": lease,
+    }
+    host = socket.gethostname()
+    args = [
+        (queue_path, f"{host}-{os.getpid()}-{i}", raw_dir, shards_dir, options)
+        for i in range(workers)
+    ]
+    WorkQueue(queue_path)  # create the schema before the workers start
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        completed = sum(pool.starmap(run_worker, args))
+    elapsed = time.perf_counter() - started
+    logger.success(
+        f"{completed} stations in {elapsed:.1f}s ({completed / max(elapsed, 1e-9) * 60:.1f}/min)"
+    )
+    status(queue_path, retry_failed=False)
+
+
+@app.command()
+def status(
+    queue_path: Path = typer.Option(QUEUE_PATH, help="SQLite work queue shared by the workers."),
+    retry_failed: bool = typer.Option(False, help="Put failed units back in the queue."),
+):
+    """Shows how many units are pending, claimed, done and failed."""
+    queue = WorkQueue(queue_path)
+    if retry_failed:
+        logger.info(f"Re-queued {queue.retry_failed()} failed units")
+    counts = queue.counts()
+    logger.info(
+        "Queue: "
+        + ", ".join(f"{counts.get(s, 0)} {s}" for s in ("pending", "claimed", "done", "failed"))
+    )
+    for unit_id, message in queue.failures()[:20]:
+        logger.warning(f"{unit_id}: {message}")
+
+
+if __name__ == "__main__":
+    app()
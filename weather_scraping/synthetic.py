@@ -0,0 +1,309 @@
+import csv
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import typer
+from loguru import logger
+from tqdm import tqdm
+
+from weather_scraping.config import INTERIM_DATA_DIR, NOTEBOOK_SCRIPTS_DIR
+
+sys.path.insert(0, str(NOTEBOOK_SCRIPTS_DIR))
+import scraper  # noqa: E402
+
+app = typer.Typer()
+
+# Column layout of an Environment Canada daily bulk-data CSV
+EC_DAILY_COLUMNS = [
+    "Longitude (x)",
+    "Latitude (y)",
+    "Station Name",
+    "Climate ID",
+    "Date/Time",
+    "Year",
+    "Month",
+    "Day",
+    "Data Quality",
+    "Max Temp (°C)",
+    "Max Temp Flag",
+    "Min Temp (°C)",
+    "Min Temp Flag",
+    "Mean Temp (°C)",
+    "Mean Temp Flag",
+    "Heat Deg Days (°C)",
+    "Heat Deg Days Flag",
+    "Cool Deg Days (°C)",
+    "Cool Deg Days Flag",
+    "Total Rain (mm)",
+    "Total Rain Flag",
+    "Total Snow (cm)",
+    "Total Snow Flag",
+    "Total Precip (mm)",
+    "Total Precip Flag",
+    "Snow on Grnd (cm)",
+    "Snow on Grnd Flag",
+    "Dir of Max Gust (10s deg)",
+    "Dir of Max Gust Flag",
+    "Spd of Max Gust (km/h)",
+    "Spd of Max Gust Flag",
+]
+
+# The legend block older bulk downloads put between the station details and the header
+EC_LEGEND = [
+    ("A", "Accumulated"),
+    ("C", "Precipitation occurred, amount uncertain"),
+    ("E", "Estimated"),
+    ("F", "Accumulated and estimated"),
+    ("L", "Precipitation may or may not have occurred"),
+    ("M", "Missing"),
+    ("T", "Trace"),
+    ("[empty]", "No data available"),
+]
+
+MISSING_VALUE_FRAC = 0.02  # values left blank and flagged "M"
+ESTIMATED_FRAC = 0.01  # temperatures flagged "E"
+TRACE_FRAC = 0.05  # dry days reported as trace precipitation ("T")
+MISSING_DAY_FRAC = 0.005  # days absent from the file altogether
+
+
+def synthetic_cities(
+    scale: int = 1,
+    n_cities: Optional[int] = None,
+    n_years: Optional[int] = None,
+    base_cities: Optional[dict] = None,
+) -> dict:
+    """
+    A CITIES-style station config for synthetic data.
+
+    By default the real CITIES config is repeated `scale` times (copies are
+    named "Calgary 2", "Calgary 3", ...), which gives `scale` times the current
+    station-years. With n_cities/n_years, that many single-station cities
+    covering the last n_years years are generated instead.
+    """
+    if n_cities is not None or n_years is not None:
+        last_year = pd.Timestamp.now().year - 1
+        first_year = last_year - (n_years or 30) + 1
+        return {
+            f"City {i:03d}": [
+                {
+                    "station_id": 900_000 + i,
+                    "station_name": f"SYNTHETIC_{i:03d}",
+                    "start_year": first_year,
+                    "end_year": last_year,
+                    "data_type": "daily",
+                }
+            ]
+            for i in range(1, (n_cities or 1) + 1)
+        }
+
+    base_cities = scraper.CITIES if base_cities is None else base_cities
+    cities = {}
+    for copy in range(1, scale + 1):
+        for city_name, stations in base_cities.items():
+            name = city_name if copy == 1 else f"{city_name} {copy}"
+            cities[name] = [
+                {**info, "station_id": info["station_id"] + (copy - 1) * 1_000_000}
+                for info in stations
+            ]
+    return cities
+
+
+def _station_details(station_id: int) -> dict:
+    """Location, climate ID and a baseline climate that are stable for a station ID."""
+    rng = np.random.default_rng(station_id)
+    latitude = rng.uniform(42.0, 62.0)
+    return {
+        "latitude": round(latitude, 2),
+        "longitude": round(rng.uniform(-135.0, -53.0), 2),
+        "climate_id": f"{rng.integers(1_000_000, 9_999_999)}",
+        # Colder and more seasonal further north
+        "annual_mean": 12.0 - 0.45 * (latitude - 42.0) + rng.normal(0, 1.5),
+        "amplitude": 11.0 + 0.35 * (latitude - 42.0) + rng.normal(0, 1.0),
+        "wet_day_prob": rng.uniform(0.25, 0.5),
+    }
+
+
+def station_year_columns(
+    station_info: dict, year: int, seed: int = 0, month: Optional[int] = None
+) -> dict:
+    """
+    One station-year (or month) of synthetic daily observations as string
+    arrays keyed by bulk-data column, formatted as EC writes them: seasonal
+    temperatures with noise, gamma-distributed precipitation split into rain
+    and snow, "M"/"E"/"T" flags and a few missing days.
+    """
+    details = _station_details(station_info["station_id"])
+    rng = np.random.default_rng([seed, station_info["station_id"], year])
+    dates = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="D")
+    n = len(dates)
+
+    seasonal = -np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 15) / 365.25)
+    mean = details["annual_mean"] + details["amplitude"] * seasonal + rng.normal(0, 3.0, n)
+    spread = rng.uniform(3.0, 8.0, n)
+    max_temp = np.round(mean + spread, 1)
+    min_temp = np.round(mean - spread, 1)
+    mean_temp = np.round((max_temp + min_temp) / 2, 1)
+
+    wet = rng.random(n) < details["wet_day_prob"]
+    precip = np.where(wet, np.round(rng.gamma(0.8, 4.0, n), 1), 0.0)
+    snowing = mean_temp < 0
+    empty = np.full(n, "", dtype=object)
+
+    def fmt(values):
+        return np.char.mod("%.1f", values).astype(object)
+
+    def flags(mask, flag):
+        return np.where(mask, flag, empty)
+
+    columns = {
+        "Longitude (x)": np.full(n, f"{details['longitude']:.2f}", dtype=object),
+        "Latitude (y)": np.full(n, f"{details['latitude']:.2f}", dtype=object),
+        "Station Name": np.full(n, station_info["station_name"].replace("_", " "), dtype=object),
+        "Climate ID": np.full(n, details["climate_id"], dtype=object),
+        "Date/Time": dates.strftime("%Y-%m-%d").to_numpy(dtype=object),
+        "Year": np.full(n, str(year), dtype=object),
+        "Month": dates.strftime("%m").to_numpy(dtype=object),
+        "Day": dates.strftime("%d").to_numpy(dtype=object),
+        "Data Quality": empty,
+        "Max Temp (°C)": fmt(max_temp),
+        "Max Temp Flag": flags(rng.random(n) < ESTIMATED_FRAC, "E"),
+        "Min Temp (°C)": fmt(min_temp),
+        "Min Temp Flag": flags(rng.random(n) < ESTIMATED_FRAC, "E"),
+        "Mean Temp (°C)": fmt(mean_temp),
+        "Mean Temp Flag": empty,
+        "Heat Deg Days (°C)": fmt(np.clip(18.0 - mean_temp, 0, None)),
+        "Heat Deg Days Flag": empty,
+        "Cool Deg Days (°C)": fmt(np.clip(mean_temp - 18.0, 0, None)),
+        "Cool Deg Days Flag": empty,
+        "Total Rain (mm)": fmt(np.where(snowing, 0.0, precip)),
+        "Total Rain Flag": empty,
+        "Total Snow (cm)": fmt(np.where(snowing, precip, 0.0)),
+        "Total Snow Flag": empty,
+        "Total Precip (mm)": fmt(precip),
+        # Trace precipitation on some dry days
+        "Total Precip Flag": flags(~wet & (rng.random(n) < TRACE_FRAC), "T"),
+    }
+    # Snow on ground and gusts are left unreported
+    for column in EC_DAILY_COLUMNS:
+        columns.setdefault(column, empty)
+
+    # Missing temperatures; a missing max or min also blanks the mean and degree days
+    for column in ["Max Temp (°C)", "Min Temp (°C)"]:
+        missing = rng.random(n) < MISSING_VALUE_FRAC
+        for blanked in [column, "Mean Temp (°C)", "Heat Deg Days (°C)", "Cool Deg Days (°C)"]:
+            columns[blanked] = np.where(missing, empty, columns[blanked])
+        for flag in [column.replace(" (°C)", " Flag"), "Mean Temp Flag"]:
+            columns[flag] = np.where(missing, "M", columns[flag])
+    missing = rng.random(n) < MISSING_VALUE_FRAC
+    for column in ["Total Rain (mm)", "Total Snow (cm)", "Total Precip (mm)"]:
+        columns[column] = np.where(missing, empty, columns[column])
+    columns["Total Precip Flag"] = np.where(missing, "M", columns["Total Precip Flag"])
+
+    # Days missing from the file altogether, and future days not published yet
+    keep = (rng.random(n) >= MISSING_DAY_FRAC) & (dates <= pd.Timestamp.now().normalize())
+    if month is not None:
+        keep &= dates.month == month
+    return {column: values[keep] for column, values in columns.items()}
+
+
+def ec_preamble(station_info: dict) -> str:
+    """The station details and legend block that precede the header in older bulk downloads."""
+    details = _station_details(station_info["station_id"])
+    rows = [
+        ("Station Name", station_info["station_name"].replace("_", " ")),
+        ("Latitude", f"{details['latitude']:.2f}"),
+        ("Longitude", f"{details['longitude']:.2f}"),
+        ("Climate Identifier", details["climate_id"]),
+        (),
+        ("Legend",),
+        *EC_LEGEND,
+        (),
+    ]
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+
+def daily_csv(
+    station_info: dict,
+    year: int,
+    seed: int = 0,
+    month: Optional[int] = None,
+    preamble: bool = True,
+) -> str:
+    """
+    A synthetic bulk-data CSV as Environment Canada serves it: every field
+    quoted and, with `preamble`, the station details and legend first.
+    """
+    columns = station_year_columns(station_info, year, seed, month)
+    buffer = io.StringIO()
+    if preamble:
+        buffer.write(ec_preamble(station_info))
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow(EC_DAILY_COLUMNS)
+    writer.writerows(zip(*(columns[column] for column in EC_DAILY_COLUMNS)))
+    return buffer.getvalue()
+
+
+def _write_station(task: tuple) -> int:
+    raw_dir, city_name, station_info, years, seed, preamble = task
+    archive = scraper.station_archive(raw_dir, city_name, station_info)
+    nbytes = 0
+    for year in years:
+        content = daily_csv(station_info, year, seed, preamble=preamble).encode("utf-8")
+        archive.put(year, content)
+        nbytes += len(content)
+    return nbytes
+
+
+def write_raw_dataset(
+    raw_dir: Path,
+    cities: dict,
+    seed: int = 0,
+    preamble: bool = False,
+    workers: Optional[int] = None,
+) -> tuple:
+    """
+    Writes every station-year into `raw_dir` with the scraper's layout: one
+    raw archive per station. Payloads start at the header row, as the scraper
+    saves them, unless `preamble` is set. Returns (station-years, uncompressed bytes).
+    """
+    years_by_station = {}
+    for city_name, station_info, year in scraper.build_work_list(cities):
+        key = (city_name, station_info["station_name"])
+        years_by_station.setdefault(key, (city_name, station_info, []))[2].append(year)
+    tasks = [
+        (str(raw_dir), city_name, station_info, years, seed, preamble)
+        for city_name, station_info, years in years_by_station.values()
+    ]
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        sizes = pool.map(_write_station, tasks)
+        for size in tqdm(sizes, total=len(tasks), desc="synthetic", unit="station"):
+            total_bytes += size
+    return sum(len(task[3]) for task in tasks), total_bytes
+
+
+@app.command()
+def main(
+    raw_dir: Path = INTERIM_DATA_DIR / "synthetic" / "raw",
+    scale: int = typer.Option(1, min=1, help="Multiple of the current CITIES station-years."),
+    cities: Optional[int] = typer.Option(None, min=1, help="Generate this many cities instead."),
+    years: Optional[int] = typer.Option(None, min=1, help="Years per city with --cities."),
+    seed: int = 0,
+    preamble: bool = typer.Option(False, help="Keep the EC preamble, as served upstream."),
+    workers: Optional[int] = typer.Option(None, help="Worker processes."),
+):
+    config = synthetic_cities(scale, cities, years)
+    logger.info(f"Generating synthetic raw data for {len(config)} cities into {raw_dir}...")
+    files, nbytes = write_raw_dataset(raw_dir, config, seed, preamble, workers)
+    logger.success(f"Wrote {files} station-years ({nbytes / 1e6:.1f} MB uncompressed).")
+
+
+if __name__ == "__main__":
+    app()